@@ -1,16 +1,54 @@
 import os
+import time
 from flask import Flask, request
 from flask_sqlalchemy import SQLAlchemy
-from dotenv import load_dotenv
-from flask_babel import Babel
 
 db = SQLAlchemy()
 
+
+class StartupTimer:
+    """
+    Wall time per create_app phase, kept in app.extensions["startup_timings"]
+    (shown by `flask startup-profile`).
+    """
+
+    def __init__(self):
+        self.phases = []
+        self._last = time.perf_counter()
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, round((now - self._last) * 1000, 2)))
+        self._last = now
+
+
 def create_app():
+    timer = StartupTimer()
+
+    # imported here, not at module level: QR export pool processes import
+    # this package too and never need them
+    from dotenv import load_dotenv
+    from flask_babel import Babel
+    timer.mark("imports")
+
     load_dotenv()
+    timer.mark("dotenv")
 
     app = Flask(__name__)
 
+    # Compiled templates cached on disk, shared by workers and kept across
+    # restarts ("" = off). Must be set before anything touches app.jinja_env.
+    app.config["JINJA_CACHE_DIR"] = os.getenv("JINJA_CACHE_DIR", "instance/jinja_cache")
+    if app.config["JINJA_CACHE_DIR"]:
+        from jinja2 import FileSystemBytecodeCache
+
+        os.makedirs(app.config["JINJA_CACHE_DIR"], exist_ok=True)
+        app.jinja_options = {
+            **app.jinja_options,
+            "bytecode_cache": FileSystemBytecodeCache(app.config["JINJA_CACHE_DIR"]),
+        }
+    timer.mark("flask app")
+
     # -------- Babel setup --------
     babel = Babel()
 
@@ -34,21 +72,201 @@ def create_app():
         default_timezone="UTC"
     )
     # -------- End Babel setup --------
+    timer.mark("babel")
 
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret-change-me")
+
+    # Reverse proxies in front of the app that set X-Forwarded-For/-Proto/-Host
+    # (0 = clients connect directly). Trusting them gives request.remote_addr
+    # the real client, which the per-client PIN throttle keys on.
+    app.config["TRUSTED_PROXIES"] = int(os.getenv("TRUSTED_PROXIES", "0"))
+    if app.config["TRUSTED_PROXIES"]:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+
+        hops = app.config["TRUSTED_PROXIES"]
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
     app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 
+    # Sessions: "" = everything in the signed cookie, "sql" / "local" = only
+    # a session id in the cookie, data on the server (app/sessions.py)
+    app.config["SESSION_BACKEND"] = os.getenv("SESSION_BACKEND", "")
+    app.config["SESSION_LOCAL_PATH"] = os.getenv("SESSION_LOCAL_PATH", "instance/sessions.sqlite3")
+    app.config["SESSION_IDLE_SECONDS"] = int(os.getenv("SESSION_IDLE_SECONDS", str(14 * 24 * 3600)))
+    # how long an owner/edit unlock of one tag lasts
+    app.config["GRANT_SECONDS"] = int(os.getenv("GRANT_SECONDS", str(24 * 3600)))
+
     db_url = os.getenv("DATABASE_URL", "sqlite:///lighterlock.db")
     app.config["SQLALCHEMY_DATABASE_URI"] = db_url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # Apply pending migrations at boot (set to 0 in production and run
+    # `flask db-upgrade` once per deploy instead)
+    app.config["DB_AUTO_UPGRADE"] = os.getenv("DB_AUTO_UPGRADE", "1").lower() in ("1", "true", "yes", "on")
+
+    # QR render cache (in-memory LRU + optional shared disk dir)
+    app.config["QR_CACHE_SIZE"] = int(os.getenv("QR_CACHE_SIZE", "512"))
+    app.config["QR_CACHE_DIR"] = os.getenv("QR_CACHE_DIR", "")
+
+    # Public tag pages (/l/<token>, /l/<token>/finder): how long shared caches
+    # (CDN / reverse proxy) may serve them before revalidating with the ETag
+    app.config["PUBLIC_PAGE_MAX_AGE"] = int(os.getenv("PUBLIC_PAGE_MAX_AGE", "60"))
+
+    # Owner PIN hashing (Werkzeug method string; `flask pin-calibrate` suggests
+    # one). Older hashes are upgraded on the owner's next successful unlock.
+    app.config["PIN_HASH_METHOD"] = os.getenv("PIN_HASH_METHOD", "scrypt:32768:8:1")
+
+    # PIN attempt throttle (token buckets per tag and per client address):
+    # "memory" = per worker, "local" = shared SQLite file, "off" = no limit
+    app.config["PIN_THROTTLE"] = os.getenv("PIN_THROTTLE", "memory")
+    app.config["PIN_THROTTLE_PATH"] = os.getenv("PIN_THROTTLE_PATH", "instance/pin_throttle.sqlite3")
+    app.config["PIN_TAG_BURST"] = int(os.getenv("PIN_TAG_BURST", "5"))
+    app.config["PIN_TAG_PER_MINUTE"] = float(os.getenv("PIN_TAG_PER_MINUTE", "5"))
+    app.config["PIN_TAG_TOTAL_BURST"] = int(os.getenv("PIN_TAG_TOTAL_BURST", "30"))
+    app.config["PIN_TAG_TOTAL_PER_MINUTE"] = float(os.getenv("PIN_TAG_TOTAL_PER_MINUTE", "30"))
+    app.config["PIN_CLIENT_BURST"] = int(os.getenv("PIN_CLIENT_BURST", "10"))
+    app.config["PIN_CLIENT_PER_MINUTE"] = float(os.getenv("PIN_CLIENT_PER_MINUTE", "10"))
+
+    # Owner inbox: messages per page (keyset pagination)
+    app.config["INBOX_PAGE_SIZE"] = int(os.getenv("INBOX_PAGE_SIZE", "20"))
+
+    # Tags per page in the /admin tag browser
+    app.config["ADMIN_PAGE_SIZE"] = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+
+    # Retention (`flask purge`): age limits in days, 0 = keep forever
+    app.config["RETENTION_UNCLAIMED_TAG_DAYS"] = int(os.getenv("RETENTION_UNCLAIMED_TAG_DAYS", "30"))
+    app.config["RETENTION_READ_MESSAGE_DAYS"] = int(os.getenv("RETENTION_READ_MESSAGE_DAYS", "0"))
+    app.config["RETENTION_BATCH_SIZE"] = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+    app.config["RETENTION_PAUSE_SECONDS"] = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.2"))
+    app.config["RETENTION_ARCHIVE_DIR"] = os.getenv("RETENTION_ARCHIVE_DIR", "")
+
+    # Max tokens per /admin/generate request (`flask generate-tokens` has no cap)
+    app.config["ADMIN_GENERATE_MAX"] = int(os.getenv("ADMIN_GENERATE_MAX", "5000"))
+
+    # Bulk QR export (admin): max codes per export + render processes (0 = all cores)
+    app.config["QR_EXPORT_MAX"] = int(os.getenv("QR_EXPORT_MAX", "5000"))
+    app.config["QR_EXPORT_WORKERS"] = int(os.getenv("QR_EXPORT_WORKERS", "0"))
+
+    # Scan counting: "" = synchronous, "memory" = per-worker buffer,
+    # "local" = buffer shared by all workers via a SQLite file
+    app.config["SCAN_BUFFER"] = os.getenv("SCAN_BUFFER", "")
+    app.config["SCAN_BUFFER_PATH"] = os.getenv("SCAN_BUFFER_PATH", "instance/scan_buffer.sqlite3")
+    app.config["SCAN_FLUSH_SECONDS"] = float(os.getenv("SCAN_FLUSH_SECONDS", "5"))
+    # flush early once this many tags (memory) / tag-hours (local) are pending
+    app.config["SCAN_FLUSH_MAX_PENDING"] = int(os.getenv("SCAN_FLUSH_MAX_PENDING", "10000"))
+    # Scan analytics: hourly buckets older than this many days are folded
+    # into daily ones by `flask scans-rollup`
+    app.config["SCAN_HOURLY_KEEP_DAYS"] = int(os.getenv("SCAN_HOURLY_KEEP_DAYS", "7"))
+
+    # Public tag view cache: "" = off, "memory" = per worker (TTL/LRU),
+    # "local" = shared SQLite file for all workers on the host
+    app.config["TAG_CACHE"] = os.getenv("TAG_CACHE", "")
+    app.config["TAG_CACHE_TTL"] = float(os.getenv("TAG_CACHE_TTL", "60"))
+    app.config["TAG_CACHE_SIZE"] = int(os.getenv("TAG_CACHE_SIZE", "10000"))
+    app.config["TAG_CACHE_PATH"] = os.getenv("TAG_CACHE_PATH", "instance/tag_cache.sqlite3")
+
+    # In-memory Bloom filter of all tokens: unknown tokens 404 without a query
+    app.config["TOKEN_FILTER"] = os.getenv("TOKEN_FILTER", "").lower() in ("1", "true", "yes", "on")
+    app.config["TOKEN_FILTER_FP_RATE"] = float(os.getenv("TOKEN_FILTER_FP_RATE", "0.001"))
+    app.config["TOKEN_FILTER_REFRESH_SECONDS"] = float(os.getenv("TOKEN_FILTER_REFRESH_SECONDS", "1"))
+
+    # Email outbox delivery: "thread" = background thread in each web worker,
+    # "off" = run `flask outbox-worker` as a separate process instead
+    app.config["MAIL_WORKER"] = os.getenv("MAIL_WORKER", "thread")
+    app.config["MAIL_POOL_SIZE"] = int(os.getenv("MAIL_POOL_SIZE", "2"))
+    app.config["MAIL_BATCH_SIZE"] = int(os.getenv("MAIL_BATCH_SIZE", "20"))
+    app.config["MAIL_POLL_SECONDS"] = float(os.getenv("MAIL_POLL_SECONDS", "2"))
+    app.config["MAIL_MAX_ATTEMPTS"] = int(os.getenv("MAIL_MAX_ATTEMPTS", "6"))
+    app.config["MAIL_BACKOFF_SECONDS"] = float(os.getenv("MAIL_BACKOFF_SECONDS", "30"))
+
+    # Prometheus /metrics: "" = off, "memory" = per worker, "local" = summed
+    # over all workers via a SQLite file. Scrape with METRICS_TOKEN as bearer token.
+    app.config["METRICS"] = os.getenv("METRICS", "")
+    app.config["METRICS_PATH"] = os.getenv("METRICS_PATH", "instance/metrics.sqlite3")
+    app.config["METRICS_FLUSH_SECONDS"] = float(os.getenv("METRICS_FLUSH_SECONDS", "10"))
+    app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN", "")
+
+    # SQL statements per request vs. each route's @query_budget: "warn" logs,
+    # "strict" fails the request (tests/benchmarks), "off" disables the check
+    app.config["QUERY_BUDGET"] = os.getenv("QUERY_BUDGET", "warn")
+    app.config["QUERY_BUDGET_DEFAULT"] = int(os.getenv("QUERY_BUDGET_DEFAULT", "0"))
+    app.config["QUERY_BUDGET_REPEAT"] = int(os.getenv("QUERY_BUDGET_REPEAT", "5"))
+
+    # Built static assets (`flask assets-build`): hashed, resized and
+    # precompressed copies served from /assets; plain /static until built
+    app.config["ASSETS_DIR"] = os.getenv("ASSETS_DIR", "instance/assets")
+
+    timer.mark("config")
+
     db.init_app(app)
 
+    from . import sessions
+    sessions.init_app(app)
+
+    from .assets import assets
+    assets.init_app(app)
+
+    from .qr import qr_cache
+    qr_cache.init_app(app)
+
+    from .scans import scan_buffer
+    scan_buffer.init_app(app)
+
+    from .tagcache import tag_cache
+    tag_cache.init_app(app)
+
+    from .tokenfilter import token_filter
+    token_filter.init_app(app)
+
+    from .mail import outbox_worker
+    outbox_worker.init_app(app)
+
+    from .throttle import pin_throttle
+    pin_throttle.init_app(app)
+
+    from .metrics import metrics
+    metrics.init_app(app)
+
+    from .querybudget import query_budgets
+    query_budgets.init_app(app)
+    timer.mark("extensions")
+
     from .routes import bp
     app.register_blueprint(bp)
 
+    from .commands import register_commands
+    register_commands(app)
+    timer.mark("routes")
+
     with app.app_context():
-        from .models import Lighter
-        db.create_all()
+        from .migrations import check_on_startup
+        check_on_startup(app)
+        timer.mark("schema check")
+
+        if token_filter.enabled:
+            token_filter.rebuild()
+            timer.mark("token filter")
 
+    _register_fork_hooks(app)
+
+    app.extensions["startup_timings"] = timer.phases
     return app
+
+
+def _register_fork_hooks(app):
+    """
+    gunicorn --preload: create_app runs once in the master and the workers
+    are forked from it. Each child drops the DB connections, SMTP sockets,
+    locks and thread handles it inherited; read-only state (token filter,
+    QR/tag caches) is kept and shared copy-on-write.
+    """
+    if not hasattr(os, "register_at_fork"):
+        return
+
+    def after_fork_in_child():
+        with app.app_context():
+            # close=False: the sockets still belong to the parent
+            db.engine.dispose(close=False)
+        for name in ("scan_buffer", "outbox_worker", "tag_cache", "qr_cache", "token_filter", "pin_throttle", "metrics"):
+            app.extensions[name].after_fork()
+
+    os.register_at_fork(after_in_child=after_fork_in_child)
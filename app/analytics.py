@@ -0,0 +1,135 @@
+"""
+Scan analytics from pre-aggregated buckets.
+
+No row per scan: ScanBuffer counts scans per (tag, UTC hour) and its flush
+upserts those buckets into scan_hourly in one batch (scans = scans + n).
+`flask scans-rollup` folds hourly rows older than SCAN_HOURLY_KEEP_DAYS into
+scan_daily, one day per transaction, so scan_hourly stays small. Charts
+read a few dozen rows per tag from these two tables.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import delete, func, select, update
+
+from . import db
+from .models import ScanDaily, ScanHourly
+
+CHART_DAYS = 14
+
+
+def hour_bucket(ts: float) -> int:
+    """
+    Unix time -> hour number (what the scan buffer keys on).
+    """
+    return int(ts // 3600)
+
+
+def bucket_start(hour: int) -> datetime:
+    # naive UTC, like every DateTime column here
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).replace(tzinfo=None)
+
+
+def _upsert_scans(model, keys: tuple[str, ...], rows: list[dict]):
+    """
+    INSERT ... ON CONFLICT (keys) DO UPDATE SET scans = scans + excluded.scans.
+    Caller commits.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.engine.dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={"scans": table.c.scans + stmt.excluded.scans},
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        match = [table.c[k] == row[k] for k in keys]
+        updated = db.session.execute(
+            update(table).where(*match).values(scans=table.c.scans + row["scans"])
+        ).rowcount
+        if not updated:
+            db.session.execute(table.insert().values(**row))
+
+
+def add_hourly(buckets: dict[tuple[int, int], int]):
+    """
+    {(lighter_id, hour_bucket): n} -> scan_hourly. Caller commits.
+    """
+    rows = [
+        {"lighter_id": lighter_id, "hour": bucket_start(hour), "scans": n}
+        for (lighter_id, hour), n in sorted(buckets.items())
+    ]
+    _upsert_scans(ScanHourly, ("lighter_id", "hour"), rows)
+
+
+def rollup(keep_days: int = 7, echo=None) -> tuple[int, int]:
+    """
+    Move hourly rows from before the last `keep_days` days into scan_daily.
+    Each day is summed, upserted and deleted in one transaction, so a crash
+    never counts a scan twice. Returns (days rolled up, hourly rows removed).
+    """
+    cutoff = datetime.combine(datetime.utcnow().date() - timedelta(days=keep_days), time.min)
+    days = removed = 0
+
+    while True:
+        first = db.session.execute(
+            select(func.min(ScanHourly.hour)).where(ScanHourly.hour < cutoff)
+        ).scalar()
+        if first is None:
+            break
+
+        day = first.date()
+        start = datetime.combine(day, time.min)
+        end = start + timedelta(days=1)
+        in_day = (ScanHourly.hour >= start, ScanHourly.hour < end)
+
+        sums = db.session.execute(
+            select(ScanHourly.lighter_id, func.sum(ScanHourly.scans))
+            .where(*in_day)
+            .group_by(ScanHourly.lighter_id)
+        ).all()
+        _upsert_scans(
+            ScanDaily, ("lighter_id", "day"),
+            [{"lighter_id": lighter_id, "day": day, "scans": int(n)} for lighter_id, n in sums],
+        )
+        removed += db.session.execute(delete(ScanHourly).where(*in_day)).rowcount
+        db.session.commit()
+
+        days += 1
+        if echo:
+            echo(f"  {day}: {len(sums)} tags")
+    return days, removed
+
+
+def daily_series(lighter_id: int, days: int = CHART_DAYS) -> list[tuple[date, int]]:
+    """
+    Scans per day for the last `days` days (today included), oldest first:
+    rolled-up days from scan_daily plus recent days summed from scan_hourly.
+    """
+    first = datetime.utcnow().date() - timedelta(days=days - 1)
+    counts = defaultdict(int)
+
+    for day, n in db.session.execute(
+        select(ScanDaily.day, ScanDaily.scans)
+        .where(ScanDaily.lighter_id == lighter_id, ScanDaily.day >= first)
+    ):
+        counts[day] += n
+
+    for hour, n in db.session.execute(
+        select(ScanHourly.hour, ScanHourly.scans)
+        .where(ScanHourly.lighter_id == lighter_id, ScanHourly.hour >= datetime.combine(first, time.min))
+    ):
+        counts[hour.date()] += n
+
+    return [(first + timedelta(days=i), counts[first + timedelta(days=i)]) for i in range(days)]
@@ -0,0 +1,222 @@
+"""
+Built static assets: content-hashed names, resized images, precompressed CSS.
+
+`flask assets-build` (run once per deploy, like `flask db-upgrade`) reads
+app/static and writes into ASSETS_DIR:
+
+  - css/style.<hash>.css, lightly minified, plus .gz (and .br when the
+    optional `brotli` package is installed) next to it
+  - img/<name>.<hash>.png, resized to twice the largest size the CSS ever
+    shows it at (IMAGE_MAX_PX) and recompressed, plus a .webp variant
+  - manifest.json: source name -> built files
+
+Templates ask for `asset_url('css/style.css')` / `asset_webp('img/qr.png')`
+(or the `picture` macro in _picture.html). With a manifest they point at
+/assets/<hashed name>, served with `immutable` far-future caching and the
+best precompressed encoding the browser accepts; a changed file gets a new
+name, so nothing is ever revalidated. Any hashed file still in ASSETS_DIR
+is served, not only the current manifest's, so pages rendered before a
+rebuild keep their styles and images. Without a manifest (dev checkout,
+build not run) they fall back to the plain /static URLs.
+"""
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+
+from flask import abort, request, send_from_directory, url_for
+
+MANIFEST = "manifest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# longest side in px: 2x the CSS box (.how-icon 84px, .hero-logo 300px wide)
+IMAGE_MAX_PX = {
+    "img/logo.png": 600,
+    "img/qr.png": 168,
+    "img/message.png": 168,
+    "img/lock.png": 168,
+}
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+TEXT_EXTS = (".css", ".js", ".svg")
+WEBP_QUALITY = 82
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# what build() names its output: <path>/<name>.<12 hex digits>.<ext>
+HASHED_NAME = re.compile(r"^(?:[\w-]+/)*[\w.-]+\.[0-9a-f]{12}\.(?:css|js|svg|png|jpg|jpeg|webp)$")
+
+
+def _hashed(name: str, data: bytes, ext: str | None = None) -> str:
+    root, own_ext = os.path.splitext(name)
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return f"{root}.{digest}{ext or own_ext}"
+
+
+def _write(out_dir: str, name: str, data: bytes):
+    path = os.path.join(out_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def minify_css(css: str) -> str:
+    """
+    Comments, indentation and blank lines only: safe for any stylesheet.
+    """
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    return "\n".join(line.strip() for line in css.splitlines() if line.strip()) + "\n"
+
+
+def _compressed(data: bytes) -> dict[str, bytes]:
+    out = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        out["br"] = brotli.compress(data, quality=11)
+    return out
+
+
+def _build_image(name: str, data: bytes) -> tuple[bytes, bytes, tuple[int, int]]:
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    max_px = IMAGE_MAX_PX.get(name)
+    if max_px:
+        img.thumbnail((max_px, max_px), Image.LANCZOS)
+
+    png = io.BytesIO()
+    img.save(png, format="PNG", optimize=True)
+    webp = io.BytesIO()
+    img.save(webp, format="WEBP", quality=WEBP_QUALITY, method=6)
+    return png.getvalue(), webp.getvalue(), img.size
+
+
+def build(static_dir: str, out_dir: str, echo=None) -> dict:
+    """
+    Build every image and stylesheet under `static_dir` into `out_dir` and
+    write the manifest. Returns the manifest.
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            ext = os.path.splitext(filename)[1].lower()
+            if ext not in IMAGE_EXTS + TEXT_EXTS:
+                continue
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                data = f.read()
+
+            if ext in IMAGE_EXTS:
+                png, webp, (width, height) = _build_image(name, data)
+                entry = {"file": _hashed(name, png, ".png"), "width": width, "height": height}
+                _write(out_dir, entry["file"], png)
+                sizes = f"{len(data):,} -> {len(png):,} B png"
+                if len(webp) < len(png):
+                    entry["webp"] = _hashed(name, webp, ".webp")
+                    _write(out_dir, entry["webp"], webp)
+                    sizes += f", {len(webp):,} B webp"
+            else:
+                if ext == ".css":
+                    data = minify_css(data.decode("utf-8")).encode("utf-8")
+                entry = {"file": _hashed(name, data), "encodings": []}
+                _write(out_dir, entry["file"], data)
+                sizes = f"{len(data):,} B"
+                packed_by_encoding = _compressed(data)
+                for encoding, suffix in ENCODINGS:
+                    packed = packed_by_encoding.get(encoding)
+                    if packed is not None and len(packed) < len(data):
+                        _write(out_dir, entry["file"] + suffix, packed)
+                        entry["encodings"].append(encoding)
+                        sizes += f", {len(packed):,} B {encoding}"
+
+            manifest[name] = entry
+            if echo:
+                echo(f"  {name} -> {entry['file']} ({sizes})")
+
+    _write(out_dir, MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+class Assets:
+    def __init__(self):
+        self.out_dir = ""
+        self.manifest = {}
+        self.digest = ""  # of the manifest: part of the public pages' ETag
+
+    def init_app(self, app):
+        # send_from_directory resolves relative paths against the package
+        self.out_dir = os.path.abspath(app.config.get("ASSETS_DIR") or "instance/assets")
+        self.load()
+        app.jinja_env.globals["asset_url"] = self.url
+        app.jinja_env.globals["asset_webp"] = self.webp_url
+        app.extensions["assets"] = self
+
+    def load(self):
+        try:
+            with open(os.path.join(self.out_dir, MANIFEST), "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            self.manifest, self.digest = {}, ""
+            return
+        self.manifest = json.loads(raw)
+        self.digest = hashlib.sha256(raw).hexdigest()[:12]
+
+    @property
+    def built(self) -> bool:
+        return bool(self.manifest)
+
+    def url(self, name: str) -> str:
+        entry = self.manifest.get(name)
+        if entry is None:
+            return url_for("static", filename=name)
+        return url_for("main.asset", filename=entry["file"])
+
+    def webp_url(self, name: str) -> str | None:
+        webp = self.manifest.get(name, {}).get("webp")
+        return url_for("main.asset", filename=webp) if webp else None
+
+    def send(self, filename: str):
+        # any build's output, current or earlier; never the manifest or stray files
+        if not HASHED_NAME.match(filename):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+        path = os.path.join(self.out_dir, filename)
+        offered = [(enc, suffix) for enc, suffix in ENCODINGS if os.path.isfile(path + suffix)]
+        served = filename
+        for encoding, suffix in offered:
+            if request.accept_encodings[encoding]:
+                served = filename + suffix
+                break
+        else:
+            encoding = None
+
+        resp = send_from_directory(self.out_dir, served, mimetype=mimetype)
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        if offered:
+            resp.vary.add("Accept-Encoding")
+        resp.headers["Cache-Control"] = IMMUTABLE
+        return resp
+
+    def stats(self) -> dict:
+        return {
+            "built": self.built,
+            "dir": self.out_dir,
+            "manifest": self.digest,
+            "entries": len(self.manifest),
+        }
+
+
+assets = Assets()
@@ -0,0 +1,257 @@
+"""
+Admin / maintenance CLI commands (`flask <command>`).
+"""
+import click
+
+
+def register_commands(app):
+    @app.cli.command("db-upgrade")
+    @click.option("--to", "target", type=int, default=None, help="Stop at this version.")
+    def db_upgrade_cmd(target):
+        """Apply pending schema migrations."""
+        from .migrations import HEAD, current_version, upgrade
+
+        applied = upgrade(target=target, echo=click.echo)
+        click.echo(f"Schema at version {current_version()} (head {HEAD}); applied {len(applied)}.")
+
+    @app.cli.command("db-version")
+    def db_version_cmd():
+        """Show the schema version."""
+        from .migrations import HEAD, current_version
+
+        click.echo(f"Schema at version {current_version()} (head {HEAD}).")
+
+    @app.cli.command("generate-tokens")
+    @click.argument("how_many", type=int)
+    def generate_tokens_cmd(how_many):
+        """Create HOW_MANY new random tokens (no UI cap)."""
+        from .tokens import allocate_tokens
+
+        result = allocate_tokens(how_many, origin="admin")
+        click.echo(f"Created {result.summary()}")
+
+    @app.cli.command("outbox-worker")
+    @click.option("--once", is_flag=True, help="Deliver what is due, then exit.")
+    def outbox_worker_cmd(once):
+        """Deliver queued emails (use with MAIL_WORKER=off)."""
+        from .mail import outbox_worker
+
+        if once:
+            total = 0
+            while True:
+                n = outbox_worker.deliver_batch()
+                total += n
+                if n < outbox_worker.batch_size:
+                    break
+            click.echo(f"Processed {total} emails: {outbox_worker.stats()}")
+            return
+
+        click.echo("Outbox worker running (Ctrl+C to stop)")
+        try:
+            outbox_worker.run_forever()
+        except KeyboardInterrupt:
+            outbox_worker.stop()
+
+    @app.cli.command("token-filter-stats")
+    def token_filter_stats_cmd():
+        """Build the token filter from the DB and print its size / false-positive rate."""
+        from .tokenfilter import token_filter
+
+        token_filter.rebuild()
+        for key, value in token_filter.stats().items():
+            click.echo(f"{key}: {value}")
+
+    @app.cli.command("unread-backfill")
+    @click.option("--batch-size", default=5000, show_default=True)
+    def unread_backfill_cmd(batch_size):
+        """Recompute lighters.unread_count from found_messages."""
+        from .unread import backfill
+
+        click.echo(f"Backfilled {backfill(batch_size)} tags")
+
+    @app.cli.command("items-backfill")
+    @click.option("--batch-size", default=1000, show_default=True)
+    def items_backfill_cmd(batch_size):
+        """Add the default items to claimed tags that have none."""
+        from .items import backfill
+
+        click.echo(f"Filled {backfill(batch_size)} tags")
+
+    @app.cli.command("unread-check")
+    @click.option("--limit", default=50, show_default=True, help="Max mismatches to list.")
+    def unread_check_cmd(limit):
+        """Compare lighters.unread_count with the real unread messages."""
+        from .unread import find_mismatches
+
+        rows = find_mismatches(limit=limit)
+        for token, stored, actual in rows:
+            click.echo(f"{token}: stored={stored} actual={actual}")
+        if rows:
+            raise SystemExit(f"{len(rows)} mismatched tags (run `flask unread-backfill`)")
+        click.echo("unread_count is consistent")
+
+    @app.cli.command("startup-profile")
+    @click.option("--top", default=25, show_default=True, help="How many imports to list.")
+    def startup_profile_cmd(top):
+        """Time a cold create_app() in a fresh interpreter: per phase and per import."""
+        import json
+        import os
+        import subprocess
+        import sys
+
+        script = (
+            "import json, time\n"
+            "start = time.perf_counter()\n"
+            "from app import create_app\n"
+            "imported = time.perf_counter()\n"
+            "app = create_app()\n"
+            "print(json.dumps({'import_ms': (imported - start) * 1000,\n"
+            "                  'total_ms': (time.perf_counter() - start) * 1000,\n"
+            "                  'phases': app.extensions['startup_timings']}))\n"
+        )
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            cwd=os.path.dirname(app.root_path),
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise SystemExit(proc.stderr.strip().splitlines()[-1] if proc.stderr else "create_app failed")
+
+        report = json.loads(proc.stdout.strip().splitlines()[-1])
+        click.echo(f"Cold start: {report['total_ms']:.1f} ms")
+        click.echo(f"  {'import app':<16}{report['import_ms']:>9.1f} ms")
+        for phase, ms in report["phases"]:
+            click.echo(f"  {phase:<16}{ms:>9.1f} ms")
+
+        # -X importtime lines: "import time: self_us | cumulative_us | name"
+        imports = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            if self_us.strip().isdigit():
+                imports.append((int(cumulative_us), int(self_us), name.strip()))
+
+        imports.sort(reverse=True)
+        click.echo(f"\nSlowest imports ({len(imports)} modules; cumulative / self):")
+        for cumulative_us, self_us, name in imports[:top]:
+            click.echo(f"  {cumulative_us / 1000:>8.1f} ms {self_us / 1000:>8.1f} ms  {name}")
+
+    @app.cli.command("pin-calibrate")
+    @click.option("--target-ms", default=100.0, show_default=True, help="Acceptable time per PIN check.")
+    @click.option("--algorithm", type=click.Choice(["scrypt", "pbkdf2"]), default="scrypt", show_default=True)
+    @click.option("--rounds", default=3, show_default=True, help="Timings per candidate (median is used).")
+    def pin_calibrate_cmd(target_ms, algorithm, rounds):
+        """Time PIN hashing on this host and suggest PIN_HASH_METHOD."""
+        from .pins import calibrate, time_method
+
+        current = app.config["PIN_HASH_METHOD"]
+        click.echo(f"Current PIN_HASH_METHOD={current}: {time_method(current, rounds):.1f} ms")
+
+        results, best = calibrate(algorithm, target_ms, rounds)
+        for method, memory, ms in results:
+            mem = f"{memory / 2 ** 20:>6.1f} MiB" if memory else " " * 10
+            mark = "  <- recommended" if method == best else ""
+            click.echo(f"  {method:<24}{ms:>8.1f} ms {mem}{mark}")
+
+        if best is None:
+            click.echo(f"Nothing fits in {target_ms:.0f} ms; use the cheapest or raise --target-ms.")
+            return
+        click.echo(f"PIN_HASH_METHOD={best}")
+        click.echo("Each concurrent unlock costs this much CPU time (and memory for scrypt); "
+                   "size PIN_CLIENT_BURST / worker counts accordingly.")
+
+    @app.cli.command("import-tokens")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--csv", "csv_mode", is_flag=True, default=None,
+                  help="Parse as CSV (default: when the file name ends in .csv).")
+    def import_tokens_cmd(path, csv_mode):
+        """Stream tokens from a .txt/.csv file into the database."""
+        from .tokens import import_file
+
+        if csv_mode is None:
+            csv_mode = path.lower().endswith(".csv")
+
+        def progress(result):
+            click.echo(f"  ... {result.summary()}")
+
+        with open(path, "rb") as f:
+            result = import_file(f, csv_mode=csv_mode, progress=progress, origin="import")
+        click.echo(f"Done: {result.summary()}")
+
+    @app.cli.command("export-tags")
+    @click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), default="csv", show_default=True)
+    @click.option("--output", "-o", type=click.File("w"), default="-", help="File to write (default: stdout).")
+    @click.option("--batch-size", default=5000, show_default=True)
+    def export_tags_cmd(fmt, output, batch_size):
+        """Stream every tag with its scan/unread/item counts as CSV or JSONL."""
+        from .tag_export import stream_export
+
+        for chunk in stream_export(fmt, batch_size=batch_size):
+            output.write(chunk)
+
+    @app.cli.command("purge")
+    @click.option("--policy", "policies", multiple=True, type=click.Choice(["unclaimed-tags", "read-messages"]),
+                  help="Only these policies (default: every one with a limit configured).")
+    @click.option("--days", type=int, default=None, help="Override the age limit (needs one --policy).")
+    @click.option("--dry-run", is_flag=True, help="Only count what would be deleted.")
+    @click.option("--batch-size", type=int, default=None, help="Default RETENTION_BATCH_SIZE.")
+    @click.option("--pause", type=float, default=None, help="Seconds between batches (RETENTION_PAUSE_SECONDS).")
+    @click.option("--archive-dir", default=None, help="Append deleted rows as JSONL here (RETENTION_ARCHIVE_DIR).")
+    @click.option("--max-batches", type=int, default=None, help="Stop after this many batches per policy.")
+    def purge_cmd(policies, days, dry_run, batch_size, pause, archive_dir, max_batches):
+        """Delete stale unclaimed tags / old read messages in small batches."""
+        from .retention import purge, run_policies
+
+        cfg = app.config
+        kwargs = dict(
+            batch_size=batch_size or cfg["RETENTION_BATCH_SIZE"],
+            pause=cfg["RETENTION_PAUSE_SECONDS"] if pause is None else pause,
+            dry_run=dry_run,
+            archive_dir=archive_dir if archive_dir is not None else cfg["RETENTION_ARCHIVE_DIR"] or None,
+            max_batches=max_batches,
+            echo=click.echo,
+        )
+
+        if days is not None:
+            if len(policies) != 1:
+                raise click.UsageError("--days needs exactly one --policy")
+            results = [purge(policies[0], days, **kwargs)]
+        else:
+            results = run_policies(cfg, names=policies or None, **kwargs)
+
+        if not results:
+            click.echo("No retention policy is enabled (RETENTION_*_DAYS are 0).")
+        for result in results:
+            click.echo(result.summary())
+
+    @app.cli.command("scans-rollup")
+    @click.option("--keep-days", type=int, default=None, help="Keep this many days hourly (SCAN_HOURLY_KEEP_DAYS).")
+    def scans_rollup_cmd(keep_days):
+        """Fold old hourly scan buckets into daily ones."""
+        from .analytics import rollup
+
+        keep = app.config["SCAN_HOURLY_KEEP_DAYS"] if keep_days is None else keep_days
+        days, removed = rollup(keep, echo=click.echo)
+        click.echo(f"Rolled up {days} days ({removed} hourly rows), keeping the last {keep} days hourly.")
+
+    @app.cli.command("assets-build")
+    def assets_build_cmd():
+        """Hash, resize and precompress app/static into ASSETS_DIR (restart workers after)."""
+        from .assets import build
+
+        manifest = build(app.static_folder, app.config["ASSETS_DIR"], echo=click.echo)
+        click.echo(f"Built {len(manifest)} assets into {app.config['ASSETS_DIR']}")
+
+    @app.cli.command("sessions-gc")
+    @click.option("--batch-size", default=1000, show_default=True)
+    @click.option("--pause", default=0.1, show_default=True, help="Seconds between batches.")
+    def sessions_gc_cmd(batch_size, pause):
+        """Delete expired server-side sessions (SESSION_BACKEND=sql/local)."""
+        from .sessions import purge_expired
+
+        if not app.config["SESSION_BACKEND"]:
+            click.echo("SESSION_BACKEND is not set: sessions live in the cookie, nothing to do.")
+            return
+        click.echo(f"Removed {purge_expired(app, batch_size, pause, echo=click.echo)} expired sessions")
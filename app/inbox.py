@@ -0,0 +1,83 @@
+"""
+Owner inbox: keyset pagination over a tag's FoundMessages, newest first.
+
+Pages are keyed on (created_at, id) rather than OFFSET, so page 50 costs
+the same as page 1 (served by ix_found_messages_lighter_read_created /
+the lighter_id index). Only messages actually shown to the owner are
+marked read.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, case, or_
+
+from . import db
+from .models import FoundMessage, Lighter
+
+
+def encode_cursor(message: FoundMessage) -> str:
+    return f"{message.created_at.isoformat()}_{message.id}"
+
+
+def decode_cursor(raw: str | None) -> tuple[datetime, int] | None:
+    if not raw:
+        return None
+    try:
+        created, _, msg_id = raw.rpartition("_")
+        return datetime.fromisoformat(created), int(msg_id)
+    except ValueError:
+        return None
+
+
+def load_page(lighter_id: int, cursor: str | None, size: int) -> tuple[list[FoundMessage], str | None]:
+    """
+    One page of messages older than `cursor`. Returns (messages, next_cursor);
+    next_cursor is None on the last page.
+    """
+    q = FoundMessage.query.filter(FoundMessage.lighter_id == lighter_id)
+
+    after = decode_cursor(cursor)
+    if after:
+        created, msg_id = after
+        q = q.filter(or_(
+            FoundMessage.created_at < created,
+            and_(FoundMessage.created_at == created, FoundMessage.id < msg_id),
+        ))
+
+    rows = (
+        q.order_by(FoundMessage.created_at.desc(), FoundMessage.id.desc())
+        .limit(size + 1)
+        .all()
+    )
+
+    if len(rows) > size:
+        rows = rows[:size]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def mark_delivered(lighter: Lighter, messages: list[FoundMessage]) -> int:
+    """
+    Mark just these messages read and take them off unread_count.
+    The loaded objects keep their old is_read so the page can still show
+    which ones are new. Caller commits.
+    """
+    # detached, the caller's commit can't expire them: no reload per message
+    # while rendering (an N+1), and is_read stays as it was when loaded
+    for m in messages:
+        db.session.expunge(m)
+
+    unread_ids = [m.id for m in messages if not m.is_read]
+    if not unread_ids:
+        return 0
+
+    marked = (
+        FoundMessage.query
+        .filter(FoundMessage.id.in_(unread_ids), FoundMessage.is_read.is_(False))
+        .update({"is_read": True}, synchronize_session=False)
+    )
+    if marked:
+        lighter.unread_count = case(
+            (Lighter.unread_count > marked, Lighter.unread_count - marked),
+            else_=0,
+        )
+    return marked
@@ -0,0 +1,68 @@
+"""
+Default items ("Keys", "Wallet", ...) of a claimed tag.
+
+They are written when the tag is claimed, so the finder page and owner
+dashboard never write during a GET. Tags claimed before that (which got
+their items lazily on first view, or never viewed) are filled in by
+migration 007 / `flask items-backfill`.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import exists, select
+
+from . import db
+from .models import Lighter, LighterItem
+
+DEFAULT_LABELS = ("Keys", "Wallet", "Bag", "Lighter", "Other")
+
+
+def default_rows(lighter_ids, now: datetime | None = None) -> list[dict]:
+    # items are listed by created_at: a microsecond apart keeps the order
+    now = now or datetime.utcnow()
+    return [
+        {"lighter_id": lighter_id, "label": label, "created_at": now + timedelta(microseconds=n)}
+        for lighter_id in lighter_ids
+        for n, label in enumerate(DEFAULT_LABELS)
+    ]
+
+
+def add_defaults(lighter: Lighter):
+    """
+    Insert the default items for a tag that has none (one executemany).
+    Caller commits.
+    """
+    has_items = db.session.execute(
+        select(exists().where(LighterItem.lighter_id == lighter.id))
+    ).scalar()
+    if not has_items:
+        db.session.execute(LighterItem.__table__.insert(), default_rows([lighter.id]))
+
+
+def backfill(batch_size: int = 1000, conn=None) -> int:
+    """
+    Default items for every claimed tag without any, `batch_size` tags per
+    transaction. Returns tags filled. With `conn` (a migration) everything
+    runs in the caller's transaction instead.
+    """
+    runner = conn if conn is not None else db.session
+    no_items = ~exists().where(LighterItem.lighter_id == Lighter.id)
+
+    filled = 0
+    last_id = 0
+    while True:
+        ids = runner.execute(
+            select(Lighter.id)
+            .where(Lighter.id > last_id, Lighter.claimed_at.isnot(None), no_items)
+            .order_by(Lighter.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return filled
+        last_id = ids[-1]
+
+        runner.execute(LighterItem.__table__.insert(), default_rows(ids))
+        # the items are on the public page, so its ETag must change
+        runner.execute(Lighter.__table__.update().where(Lighter.id.in_(ids)).values(updated_at=datetime.utcnow()))
+        if conn is None:
+            db.session.commit()
+        filled += len(ids)
@@ -0,0 +1,67 @@
+"""
+Shared local store: a small SQLite file on local disk (WAL mode) that every
+gunicorn worker on the same host can read and write. Used as the optional
+cross-worker backend for in-process buffers/caches.
+
+Not a replacement for the main database; anything kept here is either
+derived data or pending writes that get flushed to the main database.
+"""
+import os
+import sqlite3
+import threading
+
+
+class LocalStore:
+    def __init__(self, path: str, schema: str = ""):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def conn(self) -> sqlite3.Connection:
+        """
+        One connection per thread *and* per process: a connection inherited
+        across fork() must never be reused by the child.
+        """
+        c = getattr(self._local, "conn", None)
+        if c is not None and self._local.pid == os.getpid():
+            return c
+
+        c = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        if self.schema:
+            c.executescript(self.schema)
+
+        self._local.conn = c
+        self._local.pid = os.getpid()
+        return c
+
+    def execute(self, sql: str, params=()):
+        return self.conn().execute(sql, params)
+
+    def transaction(self):
+        """
+        `with store.transaction() as c:` -> BEGIN IMMEDIATE ... COMMIT/ROLLBACK.
+        IMMEDIATE takes the write lock up front, so read-then-delete is atomic
+        across workers.
+        """
+        return _Tx(self.conn())
+
+
+class _Tx:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
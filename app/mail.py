@@ -0,0 +1,441 @@
+"""
+Email: outbox + background delivery.
+
+Request handlers call enqueue_email(), which only adds an EmailOutbox row to
+the current transaction. OutboxWorker (a daemon thread per process, or
+`flask outbox-worker` as its own process) claims pending rows in batches,
+sends them over a small pool of reused SMTP connections, and retries
+failures with exponential backoff. The thread starts with the first request
+a worker serves (so rows left over from before a restart go out without
+waiting for a new email) and is woken right after a transaction that
+queued mail commits; otherwise it polls, and an idle poll is one SELECT.
+
+SMTP settings come from env vars:
+SMTP_HOST, SMTP_PORT (optional), SMTP_USER, SMTP_PASS, SMTP_FROM,
+SMTP_STARTTLS (optional, default on), SMTP_AUTH (optional, default on).
+Email is enabled once all of them are set; SMTP_AUTH=0 (with
+SMTP_STARTTLS=0) drops USER/PASS for a local stand-in server.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+from sqlalchemy import and_, event, exists, or_, select, update
+
+from . import db
+from .models import EmailOutbox
+
+# smtplib / email.mime are imported where used: most workers never send mail
+if TYPE_CHECKING:
+    import smtplib
+
+log = logging.getLogger(__name__)
+
+
+def _flag(name: str) -> bool:
+    return os.getenv(name, "1").lower() not in ("0", "false", "no")
+
+
+def email_enabled() -> bool:
+    if not (os.getenv("SMTP_HOST") and os.getenv("SMTP_FROM")):
+        return False
+    return not _flag("SMTP_AUTH") or bool(os.getenv("SMTP_USER") and os.getenv("SMTP_PASS"))
+
+
+def _smtp_settings() -> dict:
+    return {
+        "host": os.getenv("SMTP_HOST"),
+        "port": int(os.getenv("SMTP_PORT", "587")),
+        "user": os.getenv("SMTP_USER") or None,
+        "pwd": os.getenv("SMTP_PASS") or None,
+        "from_email": os.getenv("SMTP_FROM"),
+        "starttls": _flag("SMTP_STARTTLS"),
+        "auth": _flag("SMTP_AUTH"),
+    }
+
+
+def build_message(from_email: str, to_email: str, subject: str, body: str) -> str:
+    from email.mime.text import MIMEText
+
+    msg = MIMEText(body, "plain", "utf-8")
+    msg["Subject"] = subject
+    msg["From"] = from_email
+    msg["To"] = to_email
+    return msg.as_string()
+
+
+# ---------------- Request side ----------------
+def enqueue_email(to_email: str, subject: str, body: str) -> EmailOutbox | None:
+    """
+    Queue an email. Part of the caller's transaction: nothing is sent
+    unless the caller commits.
+    """
+    if not email_enabled():
+        return None
+
+    row = EmailOutbox(to_email=to_email, subject=subject, body=body)
+    db.session.add(row)
+    # woken by _wake_after_commit: before the commit the row isn't visible
+    db.session.info["outbox_wake"] = True
+    return row
+
+
+def _wake_after_commit(session):
+    if session.info.pop("outbox_wake", False):
+        outbox_worker.wake()
+
+
+def _forget_wake(session):
+    session.info.pop("outbox_wake", None)
+
+
+def send_email(to_email: str, subject: str, body: str) -> bool:
+    """
+    Send one email right now, on a fresh connection. Kept for scripts and
+    one-off checks; request handlers should use enqueue_email().
+    """
+    if not email_enabled():
+        return False
+
+    pool = SMTPPool(size=1)
+    try:
+        with pool.connection() as server:
+            s = _smtp_settings()
+            server.sendmail(s["from_email"], [to_email], build_message(s["from_email"], to_email, subject, body))
+        return True
+    except Exception:
+        return False
+    finally:
+        pool.close()
+
+
+# ---------------- SMTP connection pool ----------------
+class SMTPPool:
+    """
+    Keeps up to `size` logged-in SMTP connections and hands them out one at a
+    time. Connections are checked with NOOP before reuse and recycled after
+    `max_age` seconds (providers drop idle sessions).
+    """
+
+    def __init__(self, size: int = 2, max_age: float = 240.0, timeout: float = 15.0):
+        self.size = size
+        self.max_age = max_age
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+        self.connects = 0
+        self.reuses = 0
+
+    def _connect(self) -> "smtplib.SMTP":
+        import smtplib
+
+        s = _smtp_settings()
+        server = smtplib.SMTP(s["host"], s["port"], timeout=self.timeout)
+        if s["starttls"]:
+            server.starttls()
+        if s["auth"]:
+            server.login(s["user"], s["pwd"])
+        self.connects += 1
+        return server
+
+    def _healthy(self, server: "smtplib.SMTP", opened_at: float) -> bool:
+        import smtplib
+
+        if time.monotonic() - opened_at > self.max_age:
+            return False
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def acquire(self) -> tuple["smtplib.SMTP", float]:
+        while True:
+            try:
+                server, opened_at = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._healthy(server, opened_at):
+                self.reuses += 1
+                return server, opened_at
+            self.discard(server)
+
+        return self._connect(), time.monotonic()
+
+    def release(self, server: "smtplib.SMTP", opened_at: float):
+        if self._idle.qsize() < self.size:
+            self._idle.put((server, opened_at))
+        else:
+            self.discard(server)
+
+    def discard(self, server: "smtplib.SMTP"):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def connection(self):
+        return _PooledConnection(self)
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(server)
+
+
+class _PooledConnection:
+    def __init__(self, pool: SMTPPool):
+        self.pool = pool
+        self.server = None
+        self.opened_at = 0.0
+
+    def __enter__(self) -> "smtplib.SMTP":
+        self.server, self.opened_at = self.pool.acquire()
+        return self.server
+
+    def __exit__(self, exc_type, exc, tb):
+        import smtplib
+
+        if exc_type is None or issubclass(exc_type, smtplib.SMTPRecipientsRefused):
+            # a rejected recipient doesn't mean the connection is bad
+            self.pool.release(self.server, self.opened_at)
+        else:
+            self.pool.discard(self.server)
+        return False
+
+
+# ---------------- Delivery worker ----------------
+class OutboxWorker:
+    def __init__(self):
+        self.app = None
+        self.mode = "thread"
+        self.batch_size = 20
+        self.poll_seconds = 2.0
+        self.max_attempts = 6
+        self.backoff_base = 30.0
+        self.backoff_max = 3600.0
+        self.stale_after = 600.0
+        self.pool = SMTPPool()
+
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = False
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = (app.config.get("MAIL_WORKER") or "thread").lower()
+        self.batch_size = int(app.config.get("MAIL_BATCH_SIZE", self.batch_size))
+        self.poll_seconds = float(app.config.get("MAIL_POLL_SECONDS", self.poll_seconds))
+        self.max_attempts = int(app.config.get("MAIL_MAX_ATTEMPTS", self.max_attempts))
+        self.backoff_base = float(app.config.get("MAIL_BACKOFF_SECONDS", self.backoff_base))
+        self.pool = SMTPPool(size=int(app.config.get("MAIL_POOL_SIZE", 2)))
+
+        if not event.contains(db.session, "after_commit", _wake_after_commit):
+            event.listen(db.session, "after_commit", _wake_after_commit)
+            event.listen(db.session, "after_rollback", _forget_wake)
+        if self.mode == "thread":
+            # not at import/boot: CLI commands shouldn't deliver, and with
+            # --preload the thread must be the forked worker's own
+            app.before_request(self._start_on_request)
+        app.extensions["outbox_worker"] = self
+
+    def _start_on_request(self):
+        if email_enabled():
+            self._ensure_thread()
+
+    def wake(self):
+        if self.mode == "thread":
+            self._ensure_thread()
+        self._wake.set()
+
+    # ---- claim / deliver ----
+    def _has_work(self, now: datetime) -> bool:
+        """
+        Read-only check, so an idle poll doesn't write in every worker.
+        """
+        due = exists().where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        stale = exists().where(
+            EmailOutbox.status == "sending",
+            EmailOutbox.claimed_at < now - timedelta(seconds=self.stale_after),
+        )
+        found = db.session.execute(select(or_(due, stale))).scalar()
+        db.session.rollback()
+        return bool(found)
+
+    def _claim(self) -> list[EmailOutbox]:
+        now = datetime.utcnow()
+        if not self._has_work(now):
+            return []
+        claim = uuid.uuid4().hex
+
+        # requeue rows a crashed worker left in "sending"
+        db.session.execute(
+            update(EmailOutbox)
+            .where(
+                EmailOutbox.status == "sending",
+                EmailOutbox.claimed_at < now - timedelta(seconds=self.stale_after),
+            )
+            .values(status="pending", claimed_by=None)
+        )
+
+        due = (
+            select(EmailOutbox.id)
+            .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.id)
+            .limit(self.batch_size)
+        )
+        # status is re-checked by the outer UPDATE, so two workers racing for
+        # the same ids can't both claim a row
+        db.session.execute(
+            update(EmailOutbox)
+            .where(and_(EmailOutbox.id.in_(due), EmailOutbox.status == "pending"))
+            .values(status="sending", claimed_by=claim, claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        return (
+            EmailOutbox.query
+            .filter_by(claimed_by=claim, status="sending")
+            .order_by(EmailOutbox.id)
+            .all()
+        )
+
+    def _send_slice(self, rows: list[tuple[int, str, str, str]]) -> list[tuple[int, str | None]]:
+        """
+        Sends a slice over one pooled connection, reconnecting only after a failure.
+        """
+        import smtplib
+
+        s = _smtp_settings()
+        results = []
+        server = None
+        opened_at = 0.0
+
+        for row_id, to_email, subject, body in rows:
+            try:
+                if server is None:
+                    server, opened_at = self.pool.acquire()
+                server.sendmail(s["from_email"], [to_email], build_message(s["from_email"], to_email, subject, body))
+                results.append((row_id, None))
+            except smtplib.SMTPRecipientsRefused as e:
+                # bad address, connection is still fine
+                results.append((row_id, f"{type(e).__name__}: {e}"))
+            except Exception as e:
+                results.append((row_id, f"{type(e).__name__}: {e}"))
+                if server is not None:
+                    self.pool.discard(server)
+                    server = None
+
+        if server is not None:
+            self.pool.release(server, opened_at)
+        return results
+
+    def deliver_batch(self) -> int:
+        """
+        Claim + send one batch. Returns rows processed (0 = queue idle).
+        Must run inside an app context.
+        """
+        if not email_enabled():
+            return 0
+
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        jobs = [(r.id, r.to_email, r.subject, r.body) for r in rows]
+        width = max(1, min(self.pool.size, len(jobs)))
+        slices = [jobs[i::width] for i in range(width)]
+
+        outcome = {}
+        with ThreadPoolExecutor(max_workers=width) as ex:
+            for part in ex.map(self._send_slice, slices):
+                outcome.update(part)
+
+        now = datetime.utcnow()
+        for r in rows:
+            err = outcome.get(r.id)
+            r.attempts += 1
+            r.claimed_by = None
+            if err is None:
+                r.status = "sent"
+                r.sent_at = now
+                r.last_error = None
+                self.sent += 1
+            elif r.attempts >= self.max_attempts:
+                r.status = "failed"
+                r.last_error = err
+                self.failed += 1
+                log.warning("email %s to %s failed permanently: %s", r.id, r.to_email, err)
+            else:
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (r.attempts - 1)))
+                r.status = "pending"
+                r.next_attempt_at = now + timedelta(seconds=delay)
+                r.last_error = err
+                self.retried += 1
+        db.session.commit()
+        return len(rows)
+
+    def run_forever(self):
+        while not self._stop:
+            try:
+                with self.app.app_context():
+                    while self.deliver_batch() >= self.batch_size:
+                        pass
+            except Exception:
+                log.exception("outbox delivery loop failed")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+        self.pool.close()
+
+    def after_fork(self):
+        # don't QUIT the inherited SMTP sessions, they are the parent's
+        self.pool = SMTPPool(size=self.pool.size, max_age=self.pool.max_age, timeout=self.pool.timeout)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.run_forever, name="outbox-worker", daemon=True)
+            self._thread.start()
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "smtp_connects": self.pool.connects,
+            "smtp_reuses": self.pool.reuses,
+        }
+
+
+outbox_worker = OutboxWorker()
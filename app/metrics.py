@@ -0,0 +1,291 @@
+"""
+Request / SQL / QR instrumentation, exported as Prometheus text on /metrics.
+
+METRICS="" (default) turns it off. "memory" keeps the numbers per worker
+(fine for a single process). "local" adds each worker's increments into a
+shared SQLite file (METRICS_PATH) every METRICS_FLUSH_SECONDS and at exit,
+and /metrics reads that file, so a scrape sees the sum over all gunicorn
+workers on the host (a worker's last few seconds may lag behind).
+
+Everything is a counter or a histogram with cumulative buckets, so
+samples from different workers merge by plain addition. SQL statements
+per request come from app/querylog.py. /metrics needs METRICS_TOKEN as a
+bearer token, or an admin session.
+"""
+import atexit
+import hmac
+import logging
+import os
+import threading
+import time
+
+from flask import g, request
+
+from . import querylog
+from .localstore import LocalStore
+
+log = logging.getLogger(__name__)
+
+LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+);
+"""
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# name -> (type, help, buckets for histograms)
+FAMILIES = {
+    "flametag_requests_total": ("counter", "Requests by endpoint, method and status.", None),
+    "flametag_request_duration_seconds": ("histogram", "Request handling time by endpoint.", SECONDS_BUCKETS),
+    "flametag_request_sql_statements": ("histogram", "SQL statements issued per request.", STATEMENT_BUCKETS),
+    "flametag_request_sql_seconds": ("histogram", "Time spent in SQL per request.", SECONDS_BUCKETS),
+    "flametag_qr_render_seconds": ("histogram", "QR PNG render time (cache misses).", SECONDS_BUCKETS),
+}
+
+# app.extensions name -> monotonic counters in its stats(), exported as
+# flametag_<extension>_<counter>_total
+SUBSYSTEM_COUNTERS = {
+    "tag_cache": ("hits", "misses", "invalidations"),
+    "qr_cache": ("hits", "disk_hits", "misses"),
+    "scan_buffer": ("recorded", "flushed", "flushes", "flush_errors"),
+    "token_filter": ("rejected", "passed"),
+    "pin_throttle": ("allowed", "rejected_tag", "rejected_tag_total", "rejected_client"),
+    "outbox_worker": ("sent", "failed", "retried"),
+}
+
+
+def _labels(**labels) -> str:
+    return ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in sorted(labels.items())
+    )
+
+
+def _le(bound) -> str:
+    return "+Inf" if bound is None else repr(float(bound))
+
+
+class Metrics:
+    def __init__(self):
+        self.app = None
+        self.mode = ""
+        self.flush_seconds = 10.0
+        self.token = ""
+        self.store = None
+
+        # {(sample name, labels): value} not yet flushed (all of it in memory mode)
+        self._samples = {}
+        self._subsystem_seen = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = (app.config.get("METRICS") or "").lower()
+        self.flush_seconds = float(app.config.get("METRICS_FLUSH_SECONDS", self.flush_seconds))
+        self.token = app.config.get("METRICS_TOKEN") or ""
+        # nothing carried over from an earlier app
+        self._samples = {}
+        self._subsystem_seen = {}
+
+        if self.mode == "local":
+            self.store = LocalStore(app.config["METRICS_PATH"], LOCAL_SCHEMA)
+        elif self.mode not in ("", "off", "memory"):
+            raise ValueError(f"Unknown METRICS mode: {self.mode!r}")
+
+        if self.enabled:
+            querylog.install(app)
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            if self.mode == "local":
+                atexit.register(self.flush)
+        app.extensions["metrics"] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("memory", "local")
+
+    # ---------------- recording ----------------
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels(**labels))
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + value
+        self._ensure_flusher()
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        buckets = FAMILIES[name][2]
+        # every bucket gets a sample (0 if the value is above it): a scrape
+        # must see the full set of bounds for each label combination
+        updates = [((f"{name}_bucket", _labels(le=_le(b), **labels)), int(value <= b)) for b in buckets]
+        updates.append(((f"{name}_bucket", _labels(le="+Inf", **labels)), 1))
+        base = _labels(**labels)
+        with self._lock:
+            for key, n in updates:
+                self._samples[key] = self._samples.get(key, 0) + n
+            for key, v in (((f"{name}_sum", base), value), ((f"{name}_count", base), 1)):
+                self._samples[key] = self._samples.get(key, 0) + v
+        self._ensure_flusher()
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+
+    def _after_request(self, response):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        self.observe("flametag_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint)
+        sql = querylog.current()
+        if sql is not None:
+            self.observe("flametag_request_sql_statements", sql.count, endpoint=endpoint)
+            self.observe("flametag_request_sql_seconds", sql.seconds, endpoint=endpoint)
+        self.inc("flametag_requests_total", endpoint=endpoint, method=request.method,
+                 status=response.status_code)
+        return response
+
+    def _subsystem_deltas(self) -> dict:
+        """
+        Growth of the subsystems' own counters since the last call.
+        """
+        deltas = {}
+        for ext, counters in SUBSYSTEM_COUNTERS.items():
+            obj = self.app.extensions.get(ext)
+            if obj is None:
+                continue
+            stats = obj.stats()
+            for counter in counters:
+                name = f"flametag_{ext}_{counter}_total"
+                value = stats.get(counter, 0)
+                delta = value - self._subsystem_seen.get(name, 0)
+                self._subsystem_seen[name] = value
+                if delta:
+                    deltas[(name, "")] = delta
+        return deltas
+
+    # ---------------- local store ----------------
+    def flush(self) -> int:
+        """
+        Add this worker's increments to the shared file. Returns samples written.
+        """
+        if self.mode != "local":
+            return 0
+
+        with self._lock:
+            samples, self._samples = self._samples, {}
+            for key, v in self._subsystem_deltas().items():
+                samples[key] = samples.get(key, 0) + v
+        if not samples:
+            return 0
+
+        try:
+            with self.store.transaction() as c:
+                c.executemany(
+                    "INSERT INTO metric_samples (name, labels, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value",
+                    [(name, labels, v) for (name, labels), v in samples.items()],
+                )
+        except Exception:
+            log.exception("metrics flush failed; keeping %d samples", len(samples))
+            with self._lock:
+                for key, v in samples.items():
+                    self._samples[key] = self._samples.get(key, 0) + v
+            return 0
+        return len(samples)
+
+    def after_fork(self):
+        """
+        The parent keeps (and flushes) what it recorded before the fork.
+        """
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._thread = None
+        self._pid = None
+
+    def _ensure_flusher(self):
+        if self.mode != "local":
+            return
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="metrics-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("metrics flusher crashed during flush")
+
+    # ---------------- export ----------------
+    def collect(self) -> dict:
+        """
+        All samples: this worker's in memory mode, every worker's in local mode.
+        """
+        if self.mode == "local":
+            self.flush()
+            rows = self.store.execute("SELECT name, labels, value FROM metric_samples").fetchall()
+            return {(name, labels): v for name, labels, v in rows}
+
+        with self._lock:
+            samples = dict(self._samples)
+            for key, v in self._subsystem_deltas().items():
+                self._samples[key] = self._samples.get(key, 0) + v
+                samples[key] = samples.get(key, 0) + v
+        return samples
+
+    def render(self) -> str:
+        samples = self.collect()
+        families = {}
+        for (name, labels), v in samples.items():
+            family = name
+            for suffix in ("_bucket", "_sum", "_count"):
+                if name.endswith(suffix) and name[: -len(suffix)] in FAMILIES:
+                    family = name[: -len(suffix)]
+            families.setdefault(family, []).append((name, labels, v))
+
+        lines = []
+        for family in sorted(families):
+            kind, help_text, _ = FAMILIES.get(family, ("counter", "", None))
+            if help_text:
+                lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for name, labels, v in sorted(families[family], key=_sample_order):
+                value = int(v) if float(v).is_integer() else v
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def authorized(self) -> bool:
+        header = request.headers.get("Authorization", "")
+        # constant time: don't leak how much of the token matched
+        return bool(self.token) and hmac.compare_digest(header.encode(), f"Bearer {self.token}".encode())
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._samples)
+        return {"mode": self.mode or "off", "pending_samples": pending}
+
+
+def _sample_order(sample):
+    name, labels, _ = sample
+    # buckets in numeric le order, +Inf last
+    le = labels.rsplit('le="', 1)[1][:-1] if 'le="' in labels else ""
+    bound = float("inf") if le == "+Inf" else float(le) if le else 0.0
+    return name, labels.split('le="')[0], bound
+
+
+metrics = Metrics()
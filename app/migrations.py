@@ -0,0 +1,321 @@
+"""
+Versioned schema migrations.
+
+`schema_version` records which numbered migrations have run. `flask
+db-upgrade` applies the missing ones in order, each in its own transaction
+together with its version row. On boot the app only reads MAX(version)
+(one cheap query); it upgrades itself only when DB_AUTO_UPGRADE is on and
+the database is actually behind.
+
+Every migration is idempotent (checks before it adds), so a database that
+was patched by hand or built by the old create_all-on-boot is brought to
+the same state. Works on SQLite and Postgres.
+
+Adding a migration: append a function to MIGRATIONS. Never renumber or
+edit one that has shipped. Tables are created from frozen copies of their
+definition as of the migration that adds them (below), never from the live
+models, so a later model change can't alter what an old migration creates:
+the change needs its own migration.
+"""
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import (
+    Boolean, Column, Date, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    inspect, text,
+)
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from . import db
+
+log = logging.getLogger(__name__)
+
+VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    applied_at TIMESTAMP NOT NULL
+)
+"""
+
+# arbitrary constant so concurrent `db-upgrade`s on Postgres serialize
+PG_LOCK_KEY = 7140423
+
+
+# ---------------- helpers for migrations ----------------
+def has_column(conn, table: str, column: str) -> bool:
+    return column in {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def has_index(conn, table: str, index: str) -> bool:
+    return index in {i["name"] for i in inspect(conn).get_indexes(table)}
+
+
+def add_column(conn, table: str, column: str, ddl: str):
+    if not has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def create_index(conn, table: str, index: str, columns: str, unique: bool = False):
+    if not has_index(conn, table, index):
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        conn.execute(text(f"CREATE {kind} {index} ON {table} ({columns})"))
+
+
+def create_tables(conn, *names: str):
+    """
+    Create frozen tables (and their indexes) that don't exist yet.
+    """
+    tables = [FROZEN.tables[n] for n in names]
+    FROZEN.create_all(bind=conn, tables=tables, checkfirst=True)
+
+
+# ---------------- frozen table definitions ----------------
+# As each table was when its migration shipped. Don't edit: add columns and
+# indexes in a new migration (add_column / create_index).
+FROZEN = MetaData()
+
+# 001 baseline
+Table(
+    "lighters", FROZEN,
+    Column("id", Integer, primary_key=True),
+    Column("token", String(32), nullable=False),
+    Column("claimed_at", DateTime, nullable=True),
+    Column("owner_pin_hash", String(255), nullable=True),
+    Column("public_message", Text, nullable=True),
+    Column("private_message", Text, nullable=True),
+    Column("owner_phone", String(40), nullable=True),
+    Column("show_owner_phone", Boolean, nullable=False),
+    Column("owner_email", String(120), nullable=True),
+    Column("scan_count", Integer, nullable=False),
+    Column("unread_count", Integer, nullable=False, server_default="0"),
+    Column("found_at", DateTime, nullable=True),
+    Column("found_note", Text, nullable=True),
+    Column("updated_at", DateTime, nullable=False),
+    Index("ix_lighters_token", "token", unique=True),
+)
+Table(
+    "lighter_items", FROZEN,
+    Column("id", Integer, primary_key=True),
+    Column("lighter_id", Integer, ForeignKey("lighters.id"), nullable=False),
+    Column("label", String(64), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_lighter_items_lighter_id", "lighter_id"),
+)
+Table(
+    "found_messages", FROZEN,
+    Column("id", Integer, primary_key=True),
+    Column("lighter_id", Integer, ForeignKey("lighters.id"), nullable=False),
+    Column("item_label", String(64), nullable=False),
+    Column("note", Text, nullable=False),
+    Column("finder_name", String(80), nullable=True),
+    Column("finder_contact", String(120), nullable=True),
+    Column("is_read", Boolean, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_found_messages_lighter_id", "lighter_id"),
+    Index("ix_found_messages_lighter_read_created", "lighter_id", "is_read", "created_at"),
+)
+Table(
+    "email_outbox", FROZEN,
+    Column("id", Integer, primary_key=True),
+    Column("to_email", String(255), nullable=False),
+    Column("subject", String(255), nullable=False),
+    Column("body", Text, nullable=False),
+    Column("status", String(16), nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("next_attempt_at", DateTime, nullable=False),
+    Column("last_error", Text, nullable=True),
+    Column("claimed_by", String(64), nullable=True),
+    Column("claimed_at", DateTime, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("sent_at", DateTime, nullable=True),
+    Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+)
+
+# 006 scan analytics
+Table(
+    "scan_hourly", FROZEN,
+    Column("lighter_id", Integer, ForeignKey("lighters.id"), primary_key=True),
+    Column("hour", DateTime, primary_key=True),
+    Column("scans", Integer, nullable=False),
+)
+Table(
+    "scan_daily", FROZEN,
+    Column("lighter_id", Integer, ForeignKey("lighters.id"), primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("scans", Integer, nullable=False),
+)
+
+# 008 server-side sessions
+Table(
+    "web_sessions", FROZEN,
+    Column("id", String(64), primary_key=True),
+    Column("data", Text, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+    Index("ix_web_sessions_expires_at", "expires_at"),
+)
+
+
+# ---------------- migrations ----------------
+def m001_baseline(conn):
+    create_tables(conn, "lighters", "lighter_items", "found_messages", "email_outbox")
+
+
+def m002_owner_contact(conn):
+    # replaces the old /admin/db-fix-owner-email and /admin/db-fix-owner-phone
+    add_column(conn, "lighters", "owner_email", "VARCHAR(120)")
+    add_column(conn, "lighters", "owner_phone", "VARCHAR(40)")
+    add_column(conn, "lighters", "show_owner_phone", "BOOLEAN NOT NULL DEFAULT FALSE")
+
+
+def m003_unread_count(conn):
+    from .unread import backfill
+
+    add_column(conn, "lighters", "unread_count", "INTEGER NOT NULL DEFAULT 0")
+    create_index(
+        conn, "found_messages", "ix_found_messages_lighter_read_created",
+        "lighter_id, is_read, created_at",
+    )
+    backfill(conn=conn)
+
+
+def m004_admin_browser_indexes(conn):
+    create_index(conn, "lighters", "ix_lighters_claimed_at", "claimed_at")
+    create_index(conn, "lighters", "ix_lighters_updated_at", "updated_at")
+
+
+def m005_retention(conn):
+    add_column(conn, "lighters", "created_at", "TIMESTAMP")
+    add_column(conn, "lighters", "origin", "VARCHAR(16)")
+    create_index(conn, "lighters", "ix_lighters_origin_created", "origin, created_at")
+    create_index(conn, "found_messages", "ix_found_messages_read_created", "is_read, created_at")
+
+
+def m006_scan_analytics(conn):
+    create_tables(conn, "scan_hourly", "scan_daily")
+
+
+def m007_default_items(conn):
+    # default items used to be inserted by the first GET of a tag's page;
+    # now they come with the claim, so fill in every claimed tag without any
+    from .items import backfill
+
+    backfill(conn=conn)
+
+
+def m008_web_sessions(conn):
+    create_tables(conn, "web_sessions")
+
+
+MIGRATIONS = [
+    (1, "baseline", m001_baseline),
+    (2, "owner contact columns", m002_owner_contact),
+    (3, "lighters.unread_count + found_messages composite index", m003_unread_count),
+    (4, "lighters claimed_at / updated_at indexes", m004_admin_browser_indexes),
+    (5, "lighters.created_at / origin + retention indexes", m005_retention),
+    (6, "scan_hourly / scan_daily", m006_scan_analytics),
+    (7, "default items for claimed tags", m007_default_items),
+    (8, "web_sessions", m008_web_sessions),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+
+# ---------------- runner ----------------
+@contextmanager
+def _upgrade_lock():
+    """
+    One upgrader at a time, so workers booting together with DB_AUTO_UPGRADE
+    don't all run the same migration: pg_advisory_lock on Postgres, an
+    flock()ed file next to the database on SQLite.
+    """
+    url = db.engine.url
+    if url.get_backend_name() == "postgresql":
+        with db.engine.connect() as lock_conn:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": PG_LOCK_KEY})
+            lock_conn.commit()
+            try:
+                yield
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": PG_LOCK_KEY})
+                lock_conn.commit()
+        return
+
+    database = url.database if url.get_backend_name() == "sqlite" else None
+    try:
+        import fcntl
+    except ImportError:  # not on POSIX: no cross-process lock
+        fcntl = None
+    if not database or database == ":memory:" or database.startswith("file:") or fcntl is None:
+        # in-memory databases are private to one process anyway
+        yield
+        return
+
+    with open(os.path.abspath(database) + ".migrate-lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def current_version() -> int:
+    """
+    The startup check: one query. 0 = never migrated.
+    """
+    try:
+        with db.engine.connect() as conn:
+            return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        return 0
+
+
+def upgrade(target: int | None = None, echo=print) -> list[int]:
+    """
+    Apply pending migrations up to `target` (default: all). Returns the
+    versions applied.
+    """
+    target = HEAD if target is None else target
+    applied = []
+
+    with _upgrade_lock():
+        with db.engine.begin() as conn:
+            conn.execute(text(VERSION_TABLE_SQL))
+
+        # read under the lock: whoever held it before may have done the work
+        with db.engine.connect() as conn:
+            done = {r[0] for r in conn.execute(text("SELECT version FROM schema_version"))}
+
+        for version, name, fn in MIGRATIONS:
+            if version in done or version > target:
+                continue
+            echo(f"Applying {version:03d} {name} ...")
+            with db.engine.begin() as conn:
+                fn(conn)
+                conn.execute(
+                    text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": version, "n": name, "t": datetime.utcnow()},
+                )
+            applied.append(version)
+
+    return applied
+
+
+def check_on_startup(app):
+    """
+    Cheap version check for create_app; upgrades only if allowed and needed.
+    """
+    version = current_version()
+    if version >= HEAD:
+        return
+
+    if app.config.get("DB_AUTO_UPGRADE"):
+        upgrade(echo=log.info)
+        return
+
+    log.warning(
+        "Database schema is at version %s, app expects %s. Run `flask db-upgrade`.",
+        version, HEAD,
+    )
@@ -4,11 +4,16 @@ from . import db
 
 class Lighter(db.Model):
     __tablename__ = "lighters"
+    __table_args__ = (
+        # retention: unclaimed public tags past their age limit (app/retention.py)
+        db.Index("ix_lighters_origin_created", "origin", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String(32), unique=True, index=True, nullable=False)
 
-    claimed_at = db.Column(db.DateTime, nullable=True)
+    # indexed for the admin tag browser filters (migration 004)
+    claimed_at = db.Column(db.DateTime, nullable=True, index=True)
     owner_pin_hash = db.Column(db.String(255), nullable=True)
 
     public_message = db.Column(db.Text, nullable=True)
@@ -19,11 +24,19 @@ class Lighter(db.Model):
 
     scan_count = db.Column(db.Integer, nullable=False, default=0)
 
+    # denormalized COUNT(*) of unread found_messages (see app/unread.py)
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
     # (keep these if you want, but we won't rely on them anymore)
     found_at = db.Column(db.DateTime, nullable=True)
     found_note = db.Column(db.Text, nullable=True)
 
-    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    # NULL on tags created before migration 005 (those are never auto-purged)
+    created_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+    # "web" (generate_tag), "admin" (generated batch), "import"
+    origin = db.Column(db.String(16), nullable=True)
 
     # NEW: items on this tag (keys/bag/etc)
     items = db.relationship(
@@ -62,6 +75,10 @@ class FoundMessage(db.Model):
     All finder messages live here.
     """
     __tablename__ = "found_messages"
+    __table_args__ = (
+        db.Index("ix_found_messages_lighter_read_created", "lighter_id", "is_read", "created_at"),
+        db.Index("ix_found_messages_read_created", "is_read", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -82,3 +99,63 @@ class FoundMessage(db.Model):
     is_read = db.Column(db.Boolean, nullable=False, default=False)
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class EmailOutbox(db.Model):
+    """
+    Outgoing emails. Requests only insert rows here; mail.OutboxWorker
+    delivers them in the background (pooled SMTP, retries with backoff).
+    """
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    to_email = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+
+    # pending -> sending -> sent | failed (pending again between retries)
+    status = db.Column(db.String(16), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+
+    claimed_by = db.Column(db.String(64), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+
+class ScanHourly(db.Model):
+    """
+    Scans per tag per UTC hour, upserted in batches by the scan buffer.
+    Compacted into ScanDaily by `flask scans-rollup` (see app/analytics.py).
+    """
+    __tablename__ = "scan_hourly"
+
+    lighter_id = db.Column(db.Integer, db.ForeignKey("lighters.id"), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True)
+    scans = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ScanDaily(db.Model):
+    __tablename__ = "scan_daily"
+
+    lighter_id = db.Column(db.Integer, db.ForeignKey("lighters.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    scans = db.Column(db.Integer, nullable=False, default=0)
+
+
+class WebSession(db.Model):
+    """
+    Server-side session data (SESSION_BACKEND=sql, see app/sessions.py).
+    """
+    __tablename__ = "web_sessions"
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,97 @@
+"""
+Owner PIN hashing.
+
+The method and cost come from PIN_HASH_METHOD (any Werkzeug method string,
+e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"). Stored hashes made with
+other parameters keep working; verify_pin() re-hashes them with the current
+ones the next time the owner unlocks successfully, so a cost change rolls
+out without a reset. `flask pin-calibrate` picks a cost for this host.
+"""
+import statistics
+import time
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from . import db
+
+
+def _method() -> str:
+    return current_app.config["PIN_HASH_METHOD"]
+
+
+@lru_cache(maxsize=8)
+def _canonical(method: str) -> str:
+    """
+    "scrypt" -> "scrypt:32768:8:1": the prefix Werkzeug actually stores,
+    with its defaults filled in. Costs one hash per method per process.
+    """
+    return generate_password_hash("", method).split("$", 1)[0]
+
+
+def hash_pin(pin: str) -> str:
+    return generate_password_hash(pin, _method())
+
+
+def needs_rehash(pin_hash: str) -> bool:
+    return pin_hash.split("$", 1)[0] != _canonical(_method())
+
+
+def verify_pin(lighter, pin: str) -> bool:
+    """
+    Check `pin` against lighter.owner_pin_hash. On success an outdated hash
+    is replaced (and committed) with one using the current parameters.
+    """
+    if not pin or not lighter.owner_pin_hash:
+        return False
+    if not check_password_hash(lighter.owner_pin_hash, pin):
+        return False
+
+    if needs_rehash(lighter.owner_pin_hash):
+        lighter.owner_pin_hash = hash_pin(pin)
+        db.session.commit()
+    return True
+
+
+# ---------------- calibration ----------------
+def time_method(method: str, rounds: int = 3) -> float:
+    """
+    Median milliseconds for one hash with `method` on this host.
+    """
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash("123456", method)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def candidates(algorithm: str) -> list[tuple[str, int]]:
+    """
+    (method, memory bytes per hash) in increasing cost.
+    """
+    if algorithm == "scrypt":
+        # scrypt memory is 128 * n * r bytes, per concurrent unlock
+        return [(f"scrypt:{2 ** e}:8:1", 128 * 2 ** e * 8) for e in range(12, 19)]
+    if algorithm == "pbkdf2":
+        return [(f"pbkdf2:sha256:{i}", 0) for i in (100_000, 200_000, 400_000, 600_000, 1_000_000, 2_000_000)]
+    raise ValueError(f"Unknown algorithm: {algorithm!r}")
+
+
+def calibrate(algorithm: str, target_ms: float, rounds: int = 3) -> tuple[list[tuple[str, int, float]], str | None]:
+    """
+    Time each candidate; returns (results, recommended method). The
+    recommendation is the most expensive one still within target_ms.
+    Stops at the first candidate that is more than twice the target.
+    """
+    results = []
+    best = None
+    for method, memory in candidates(algorithm):
+        ms = time_method(method, rounds)
+        results.append((method, memory, ms))
+        if ms <= target_ms:
+            best = method
+        elif ms > target_ms * 2:
+            break
+    return results, best
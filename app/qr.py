@@ -0,0 +1,160 @@
+"""
+QR rendering + render cache.
+
+A token's QR code never changes, so rendered PNGs are cached by token and
+render parameters: a bounded in-memory LRU, plus an optional on-disk store
+(QR_CACHE_DIR) that survives restarts and is shared by all workers.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+from .metrics import metrics
+
+QR_BASE_URL = "https://flametag.app/l/"
+
+# Bump when the rendering itself changes so old cache entries/ETags are ignored.
+RENDER_VERSION = "1"
+
+
+def qr_url(token: str) -> str:
+    return f"{QR_BASE_URL}{token}"
+
+
+def render_qr_png(token: str, box_size: int = 10, border: int = 2) -> bytes:
+    # qrcode pulls in PIL; only pay for it once something is actually rendered
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(qr_url(token))
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="white", back_color="black")
+
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def render_key(token: str, box_size: int, border: int) -> str:
+    """
+    Content address for one render: same key -> byte-identical PNG.
+    Also used as the (strong) ETag, so a 304 never needs the image itself.
+    """
+    raw = f"v{RENDER_VERSION}|{token}|{box_size}|{border}|white|black"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class QRCache:
+    def __init__(self, max_entries: int = 512, disk_dir: str | None = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_entries = int(app.config.get("QR_CACHE_SIZE", self.max_entries))
+        self.disk_dir = app.config.get("QR_CACHE_DIR") or None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+        app.extensions["qr_cache"] = self
+
+    # ---- memory ----
+    def _mem_get(self, key: str) -> bytes | None:
+        with self._lock:
+            png = self._lru.get(key)
+            if png is not None:
+                self._lru.move_to_end(key)
+            return png
+
+    def _mem_put(self, key: str, png: bytes):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._lru[key] = png
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    # ---- disk ----
+    def _disk_path(self, key: str) -> str:
+        # fan out so one directory never holds every tag in the database
+        return os.path.join(self.disk_dir, key[:2], f"{key}.png")
+
+    def _disk_get(self, key: str) -> bytes | None:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, png: bytes):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(png)
+            os.replace(tmp, path)
+        except OSError:
+            # disk cache is best-effort; memory still has it
+            pass
+
+    # ---- public ----
+    def get_or_render(self, token: str, box_size: int = 10, border: int = 2) -> tuple[bytes, str]:
+        """
+        Returns (png_bytes, etag).
+        """
+        key = render_key(token, box_size, border)
+
+        png = self._mem_get(key)
+        if png is not None:
+            self.hits += 1
+            return png, key
+
+        png = self._disk_get(key)
+        if png is not None:
+            self.disk_hits += 1
+            self._mem_put(key, png)
+            return png, key
+
+        self.misses += 1
+        start = time.perf_counter()
+        png = render_qr_png(token, box_size=box_size, border=border)
+        metrics.observe("flametag_qr_render_seconds", time.perf_counter() - start)
+        self._mem_put(key, png)
+        self._disk_put(key, png)
+        return png, key
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._lru)
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_dir": self.disk_dir,
+        }
+
+
+qr_cache = QRCache()
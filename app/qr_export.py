@@ -0,0 +1,246 @@
+"""
+Bulk QR export for admins: a ZIP of PNG/SVG files or a print-ready
+multi-page PDF sheet with the token printed under each code.
+
+QR + PIL encoding is CPU-bound, so renders are spread over a process pool.
+Output is streamed as it is produced (a ZIP member or a PDF page at a
+time), so the first bytes go out right away and a 5000-code batch never
+sits in memory or waits on disk as one big file.
+"""
+import multiprocessing
+import os
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+
+from .qr import qr_url, render_qr_png
+
+# Print sheet: A4 portrait at 300 DPI, 4 x 6 labels per page.
+PAGE_DPI = 300
+PAGE_SIZE = (2480, 3508)
+PAGE_MARGIN = 120
+SHEET_COLS = 4
+SHEET_ROWS = 6
+
+# Below this many codes the pool start-up costs more than it saves.
+POOL_MIN_BATCH = 64
+
+FORMATS = ("png", "svg", "pdf")
+
+
+# ---------------- Renderers (top-level so they pickle into workers) ----------------
+def render_qr_svg(token: str) -> bytes:
+    qr = qrcode.QRCode(version=1, border=2)
+    qr.add_data(qr_url(token))
+    qr.make(fit=True)
+    return qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).to_string()
+
+
+def render_label_png(token: str, box_size: int = 10) -> bytes:
+    """
+    QR code with the token printed underneath, same white-on-black look as /qr.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    qr_img = Image.open(BytesIO(render_qr_png(token, box_size=box_size, border=2)))
+    qr_img = qr_img.convert("L")
+
+    text_h = box_size * 5
+    label = Image.new("L", (qr_img.width, qr_img.height + text_h), 0)
+    label.paste(qr_img, (0, 0))
+
+    draw = ImageDraw.Draw(label)
+    font = ImageFont.load_default(size=int(text_h * 0.6))
+    draw.text(
+        (label.width // 2, qr_img.height + text_h // 2 - box_size),
+        token,
+        fill=255,
+        font=font,
+        anchor="mm",
+    )
+
+    buf = BytesIO()
+    label.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _render_one(job: tuple[str, str, bool]) -> tuple[str, bytes]:
+    token, fmt, labels = job
+    if fmt == "svg":
+        return token, render_qr_svg(token)
+    if fmt == "pdf" or labels:
+        return token, render_label_png(token)
+    return token, render_qr_png(token)
+
+
+def render_many(tokens: list[str], fmt: str, labels: bool = True, workers: int | None = None):
+    """
+    Yields (token, bytes) in input order. Large batches go through a
+    ProcessPoolExecutor; small ones render inline.
+    """
+    jobs = [(t, fmt, labels) for t in tokens]
+    workers = workers or os.cpu_count() or 1
+
+    if len(jobs) < POOL_MIN_BATCH or workers <= 1:
+        for job in jobs:
+            yield _render_one(job)
+        return
+
+    # spawn: never fork a web worker that may be holding locks/threads/DB sockets
+    ctx = multiprocessing.get_context("spawn")
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+    try:
+        chunksize = max(1, min(64, len(jobs) // (workers * 4)))
+        yield from executor.map(_render_one, jobs, chunksize=chunksize)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# ---------------- Streaming writers ----------------
+class _ChunkSink:
+    """
+    Write-only, non-seekable file object; zipfile falls back to data
+    descriptors, so each member can be flushed to the client as soon as it's written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+def stream_zip(tokens: list[str], fmt: str = "png", labels: bool = True, workers: int | None = None):
+    ext = "svg" if fmt == "svg" else "png"
+    sink = _ChunkSink()
+
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        # PNG is already deflated; storing avoids burning CPU twice
+        for token, data in render_many(tokens, fmt, labels=labels, workers=workers):
+            zf.writestr(f"flametag-{token}.{ext}", data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+    tail = sink.drain()
+    if tail:
+        yield tail
+
+
+class _PdfWriter:
+    """
+    Just enough PDF for the sheet: one full-page grayscale image per page.
+    A page's objects are emitted as soon as it is laid out; the page tree,
+    catalog and xref (which need every page's offset) come last. Object 1
+    is the catalog and 2 the page tree, referenced by pages before they exist.
+    """
+
+    def __init__(self, size_px: tuple[int, int], dpi: int):
+        self.size_px = size_px
+        self.size_pt = tuple(f"{px * 72 / dpi:.2f}".encode() for px in size_px)
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+        self.pos = 0
+
+    def _emit(self, data: bytes) -> bytes:
+        self.pos += len(data)
+        return data
+
+    def _obj(self, num: int, body: bytes, stream: bytes | None = None) -> bytes:
+        self.offsets[num] = self.pos
+        if stream is not None:
+            body += b"\nstream\n" + stream + b"\nendstream"
+        return self._emit(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+
+    def header(self) -> bytes:
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def page(self, img) -> bytes:
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+        self.page_ids.append(page_id)
+        w_pt, h_pt = self.size_pt
+
+        pixels = zlib.compress(img.tobytes(), 6)
+        image = self._obj(
+            image_id,
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray"
+            b" /BitsPerComponent 8 /Filter /FlateDecode /Length %d >>" % (img.width, img.height, len(pixels)),
+            pixels,
+        )
+        draw = b"q " + w_pt + b" 0 0 " + h_pt + b" 0 0 cm /Im0 Do Q"
+        content = self._obj(content_id, b"<< /Length %d >>" % len(draw), draw)
+        page = self._obj(
+            page_id,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 " + w_pt + b" " + h_pt + b"]"
+            b" /Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>" % (image_id, content_id),
+        )
+        return image + content + page
+
+    def trailer(self) -> bytes:
+        kids = b" ".join(b"%d 0 R" % n for n in self.page_ids)
+        out = self._obj(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(self.page_ids))
+        out += self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_at = self.pos
+        lines = [b"xref", b"0 %d" % self.next_id, b"0000000000 65535 f "]
+        lines += [b"%010d 00000 n " % self.offsets[n] for n in range(1, self.next_id)]
+        lines += [b"trailer", b"<< /Size %d /Root 1 0 R >>" % self.next_id, b"startxref", b"%d" % xref_at, b"%%EOF", b""]
+        return out + self._emit(b"\n".join(lines))
+
+
+def stream_pdf(tokens: list[str], workers: int | None = None):
+    """
+    Lays labels out SHEET_COLS x SHEET_ROWS per A4 page and yields each page
+    as soon as it is full, so the download starts with the first 24 codes
+    and memory holds a single page, never the sheet.
+    """
+    from PIL import Image
+
+    per_page = SHEET_COLS * SHEET_ROWS
+    cell_w = (PAGE_SIZE[0] - 2 * PAGE_MARGIN) // SHEET_COLS
+    cell_h = (PAGE_SIZE[1] - 2 * PAGE_MARGIN) // SHEET_ROWS
+
+    pdf = _PdfWriter(PAGE_SIZE, PAGE_DPI)
+    page = None
+    placed = 0
+
+    for token, data in render_many(tokens, "pdf", workers=workers):
+        if page is None:
+            if not pdf.page_ids:
+                yield pdf.header()
+            page = Image.new("L", PAGE_SIZE, 255)
+            placed = 0
+
+        label = Image.open(BytesIO(data))
+        label.thumbnail((cell_w - 40, cell_h - 40))
+
+        col = placed % SHEET_COLS
+        row = placed // SHEET_COLS
+        x = PAGE_MARGIN + col * cell_w + (cell_w - label.width) // 2
+        y = PAGE_MARGIN + row * cell_h + (cell_h - label.height) // 2
+        page.paste(label, (x, y))
+
+        placed += 1
+        if placed == per_page:
+            yield pdf.page(page)
+            page = None
+
+    if page is not None:
+        yield pdf.page(page)
+    if pdf.page_ids:
+        yield pdf.trailer()
@@ -0,0 +1,114 @@
+"""
+SQL query budgets per route.
+
+A view declares how many statements a request may issue:
+
+    @bp.get("/l/<token>/finder")
+    @query_budget(6)
+    def finder_page(token): ...
+
+After each request the statements from app/querylog.py are checked
+against the budget (or QUERY_BUDGET_DEFAULT for undecorated views, 0 = no
+limit), and any statement run QUERY_BUDGET_REPEAT times or more is
+reported as a likely N+1 (a lazy load per row). QUERY_BUDGET="warn"
+(default) logs a warning; "strict" raises QueryBudgetExceeded, which fails
+the request, for tests and the benchmark; "off" skips all of it.
+"""
+import logging
+
+from flask import current_app, request
+
+from . import querylog
+
+log = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(max_queries: int):
+    """
+    Route decorator (put it below @bp.get/@bp.post): at most `max_queries` statements.
+    """
+    def decorate(view):
+        view.query_budget = max_queries
+        return view
+    return decorate
+
+
+def _short(sql: str, limit: int = 160) -> str:
+    sql = " ".join(sql.split())
+    return sql if len(sql) <= limit else sql[:limit] + "..."
+
+
+class QueryBudget:
+    def __init__(self):
+        self.mode = "warn"
+        self.default = 0
+        self.repeat = 5
+
+        self.checked = 0
+        self.over_budget = 0
+        self.repeats = 0
+
+    def init_app(self, app):
+        self.mode = (app.config.get("QUERY_BUDGET") or "off").lower()
+        self.default = int(app.config.get("QUERY_BUDGET_DEFAULT", self.default))
+        self.repeat = int(app.config.get("QUERY_BUDGET_REPEAT", self.repeat))
+
+        if self.mode not in ("off", "warn", "strict"):
+            raise ValueError(f"Unknown QUERY_BUDGET mode: {self.mode!r}")
+
+        if self.enabled:
+            querylog.install(app)
+            app.after_request(self._check)
+        app.extensions["query_budget"] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("warn", "strict")
+
+    def budget_for(self, endpoint: str | None) -> int:
+        view = current_app.view_functions.get(endpoint) if endpoint else None
+        return getattr(view, "query_budget", self.default)
+
+    def problems(self, sql: querylog.QueryLog, budget: int) -> list[str]:
+        out = []
+        if budget and sql.count > budget:
+            self.over_budget += 1
+            out.append(f"{sql.count} statements (budget {budget})")
+        if self.repeat:
+            for statement, n in sql.repeated(self.repeat):
+                self.repeats += 1
+                out.append(f"likely N+1, {n}x: {_short(statement)}")
+        return out
+
+    def _check(self, response):
+        sql = querylog.current()
+        if sql is None:
+            return response
+
+        self.checked += 1
+        problems = self.problems(sql, self.budget_for(request.endpoint))
+        if not problems:
+            return response
+
+        message = f"query budget: {request.method} {request.endpoint or request.path}: " + "; ".join(problems)
+        if self.mode == "strict":
+            raise QueryBudgetExceeded(message)
+        log.warning(message)
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "default": self.default,
+            "repeat_threshold": self.repeat,
+            "checked": self.checked,
+            "over_budget": self.over_budget,
+            "repeats": self.repeats,
+        }
+
+
+query_budgets = QueryBudget()
@@ -0,0 +1,68 @@
+"""
+Per-request SQL log, fed by engine cursor events.
+
+Shared by metrics (statement count / SQL time per request) and the query
+budget (N+1 detection), which each call install(app). Statements are
+keyed by their SQL text: bound parameters are not part of it, so the same
+lazy load issued once per row shows up as one statement with a count.
+"""
+import time
+from collections import Counter
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+from . import db
+
+
+class QueryLog:
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        Statements run at least `threshold` times, most frequent first.
+        """
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+def current() -> QueryLog | None:
+    if not has_request_context():
+        # background flushers run with an app context but no request
+        return None
+    return g.get("query_log")
+
+
+def _start_request():
+    g.query_log = QueryLog()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_log_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_log_start", None)
+    log = current()
+    if started is None or log is None:
+        return
+    log.count += 1
+    log.seconds += time.perf_counter() - started
+    log.statements[statement] += 1
+
+
+def install(app):
+    """
+    Idempotent: listeners are added once per app, whoever asks first.
+    """
+    if app.extensions.get("query_log"):
+        return
+    app.before_request(_start_request)
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db.engine, "after_cursor_execute", _after_cursor_execute)
+    app.extensions["query_log"] = True
@@ -0,0 +1,197 @@
+"""
+Retention: purge (optionally archive) old rows in small batches.
+
+Policies (age limits in days, <= 0 turns one off):
+  unclaimed-tags  tags from the public "generate" button (origin = "web")
+                  never claimed within RETENTION_UNCLAIMED_TAG_DAYS.
+                  Admin-generated / imported codes may be printed on
+                  something, so they are never purged; neither are tags
+                  from before migration 005 (no created_at / origin).
+  read-messages   found messages already read by the owner, older than
+                  RETENTION_READ_MESSAGE_DAYS.
+
+Each batch selects at most `batch_size` ids, re-checks the condition while
+deleting (a tag claimed meanwhile survives), commits, and sleeps `pause`
+seconds, so no lock is held for long and replicas/other writers keep up.
+Run it from cron: `flask purge` (add --dry-run to just count).
+"""
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import and_, delete, func, select
+
+from . import db
+from .models import FoundMessage, Lighter, LighterItem, ScanDaily, ScanHourly
+from .tagcache import tag_cache
+from .tokenfilter import token_filter
+
+
+@dataclass
+class Policy:
+    name: str
+    model: type
+    config_key: str
+    # cutoff -> WHERE clause for rows to purge
+    condition: Callable
+    # child tables (model, fk column) deleted before the parent
+    children: tuple = ()
+
+
+def _unclaimed_web_tags(cutoff: datetime):
+    return and_(
+        Lighter.origin == "web",
+        Lighter.claimed_at.is_(None),
+        Lighter.created_at < cutoff,
+    )
+
+
+def _read_messages(cutoff: datetime):
+    return and_(FoundMessage.is_read.is_(True), FoundMessage.created_at < cutoff)
+
+
+POLICIES = {
+    "unclaimed-tags": Policy(
+        "unclaimed-tags", Lighter, "RETENTION_UNCLAIMED_TAG_DAYS", _unclaimed_web_tags,
+        children=(
+            (LighterItem, LighterItem.lighter_id),
+            (FoundMessage, FoundMessage.lighter_id),
+            (ScanHourly, ScanHourly.lighter_id),
+            (ScanDaily, ScanDaily.lighter_id),
+        ),
+    ),
+    "read-messages": Policy("read-messages", FoundMessage, "RETENTION_READ_MESSAGE_DAYS", _read_messages),
+}
+
+
+@dataclass
+class PurgeResult:
+    policy: str
+    days: int
+    cutoff: datetime
+    dry_run: bool = False
+    matched: int = 0
+    deleted: int = 0
+    archived: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+
+    def summary(self) -> str:
+        if self.dry_run:
+            return f"{self.policy}: {self.matched} rows older than {self.days} days would be deleted (dry run)"
+        return (
+            f"{self.policy}: deleted {self.deleted} rows older than {self.days} days "
+            f"in {self.batches} batches, {self.elapsed:.1f}s"
+            + (f", archived {self.archived}" if self.archived else "")
+        )
+
+
+def _archive(archive_dir: str, policy: Policy, ids: list[int]) -> int:
+    """
+    Append the rows about to be deleted to <archive_dir>/<policy>-YYYYMMDD.jsonl:
+    one line per row, with the child rows deleted along with it nested
+    under their table name (e.g. a tag's "found_messages").
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{policy.name}-{datetime.utcnow():%Y%m%d}.jsonl")
+    table = policy.model.__table__
+    rows = [dict(r) for r in db.session.execute(select(table).where(table.c.id.in_(ids))).mappings()]
+
+    by_id = {row["id"]: row for row in rows}
+    for child, fk in policy.children:
+        name = child.__tablename__
+        for row in by_id.values():
+            row[name] = []
+        for child_row in db.session.execute(select(child.__table__).where(fk.in_(ids))).mappings():
+            by_id[child_row[fk.key]][name].append(dict(child_row))
+
+    with open(path, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, default=str, separators=(",", ":")) + "\n")
+    return len(rows)
+
+
+def _delete_batch(policy: Policy, cutoff: datetime, ids: list[int], archive_dir: str | None) -> tuple[list, int]:
+    """
+    Delete (and archive) one batch in one transaction. Returns the deleted
+    rows, (id, token) for tags, and how many were archived.
+    """
+    model = policy.model
+    # lock + re-check: rows that stopped matching since the id scan are kept
+    q = select(model.id).where(model.id.in_(ids), policy.condition(cutoff)).with_for_update()
+    if model is Lighter:
+        q = q.add_columns(Lighter.token)
+    rows = db.session.execute(q).all()
+    if not rows:
+        return [], 0
+
+    keep = [r[0] for r in rows]
+    archived = _archive(archive_dir, policy, keep) if archive_dir else 0
+    for child, fk in policy.children:
+        db.session.execute(delete(child).where(fk.in_(keep)))
+    db.session.execute(delete(model).where(model.id.in_(keep)))
+    return rows, archived
+
+
+def purge(policy_name: str, days: int, batch_size: int = 1000, pause: float = 0.2,
+          dry_run: bool = False, archive_dir: str | None = None, max_batches: int | None = None,
+          echo=None) -> PurgeResult:
+    policy = POLICIES[policy_name]
+    model = policy.model
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = PurgeResult(policy_name, days, cutoff, dry_run=dry_run)
+
+    if dry_run:
+        result.matched = db.session.execute(
+            select(func.count()).select_from(model).where(policy.condition(cutoff))
+        ).scalar()
+        return result
+
+    start = time.perf_counter()
+    last_id = 0
+    while max_batches is None or result.batches < max_batches:
+        ids = db.session.execute(
+            select(model.id)
+            .where(model.id > last_id, policy.condition(cutoff))
+            .order_by(model.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        deleted, archived = _delete_batch(policy, cutoff, ids, archive_dir)
+        db.session.commit()
+
+        if model is Lighter:
+            for _, token in deleted:
+                tag_cache.invalidate(token)
+                token_filter.note_deleted()
+
+        result.batches += 1
+        result.deleted += len(deleted)
+        result.archived += archived
+        if echo:
+            echo(f"  batch {result.batches}: {result.deleted} deleted so far")
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def run_policies(config, names=None, **kwargs) -> list[PurgeResult]:
+    """
+    Every enabled policy (or just `names`) with its configured age limit.
+    """
+    results = []
+    for name in names or POLICIES:
+        days = int(config.get(POLICIES[name].config_key) or 0)
+        if days <= 0:
+            continue
+        results.append(purge(name, days, **kwargs))
+    return results
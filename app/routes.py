@@ -1,63 +1,38 @@
+import hashlib
+import math
 import os
-import secrets
-import smtplib
-from email.mime.text import MIMEText
 from datetime import datetime
-from io import BytesIO
 
-import qrcode
 from flask import (
     Blueprint, render_template, request, redirect, url_for,
-    flash, abort, session, make_response, current_app, send_file
+    flash, abort, session, make_response, current_app, Response, jsonify,
+    stream_with_context,
 )
+from flask_babel import get_locale
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from sqlalchemy import text
-from werkzeug.security import generate_password_hash, check_password_hash
-
-from . import db
-from .models import Lighter, LighterItem, FoundMessage
+from sqlalchemy.orm import joinedload
+
+from . import db, inbox, items, tagbrowser
+from .assets import assets
+from .mail import email_enabled, enqueue_email, outbox_worker
+from .metrics import metrics
+from .analytics import daily_series
+from .models import Lighter, LighterItem, FoundMessage, ScanDaily, ScanHourly
+from .pins import hash_pin, verify_pin
+from .qr import qr_cache
+from .querybudget import query_budget, query_budgets
+from .scans import scan_buffer
+from .sessions import grant, has_grant, revoke, rotate_session
+from .tagcache import TagView, tag_cache
+from .throttle import pin_throttle
+from .tokenfilter import token_filter
+from .tokens import allocate_tokens, import_file
 
 bp = Blueprint("main", __name__)
 
-
-# ---------------- Email helpers ----------------
-def _email_enabled() -> bool:
-    return bool(
-        os.getenv("SMTP_HOST")
-        and os.getenv("SMTP_USER")
-        and os.getenv("SMTP_PASS")
-        and os.getenv("SMTP_FROM")
-    )
-
-
-def send_email(to_email: str, subject: str, body: str) -> bool:
-    """
-    Uses SMTP settings from env vars:
-    SMTP_HOST, SMTP_PORT (optional), SMTP_USER, SMTP_PASS, SMTP_FROM
-    """
-    if not _email_enabled():
-        return False
-
-    host = os.getenv("SMTP_HOST")
-    port = int(os.getenv("SMTP_PORT", "587"))
-    user = os.getenv("SMTP_USER")
-    pwd = os.getenv("SMTP_PASS")
-    from_email = os.getenv("SMTP_FROM")
-
-    msg = MIMEText(body, "plain", "utf-8")
-    msg["Subject"] = subject
-    msg["From"] = from_email
-    msg["To"] = to_email
-
-    try:
-        server = smtplib.SMTP(host, port, timeout=15)
-        server.starttls()
-        server.login(user, pwd)
-        server.sendmail(from_email, [to_email], msg.as_string())
-        server.quit()
-        return True
-    except Exception:
-        return False
+# Bump when choice.html / finder.html change so cached copies get replaced.
+PUBLIC_PAGE_VERSION = "1"
 
 
 def make_serializer() -> URLSafeTimedSerializer:
@@ -78,16 +53,12 @@ def generate_tag():
     if existing and Lighter.query.filter_by(token=existing).first():
         return redirect(url_for("main.lighter_page", token=existing))
 
-    alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
-    for _ in range(20):
-        token = "".join(secrets.choice(alphabet) for _ in range(8))
-        if not Lighter.query.filter_by(token=token).first():
-            lighter = Lighter(token=token)
-            db.session.add(lighter)
-            db.session.commit()
-            session["generated_token"] = token
-            flash("Tag generated. Set your PIN to claim it.", "ok")
-            return redirect(url_for("main.lighter_page", token=token))
+    result = allocate_tokens(1, max_rounds=20, origin="web")
+    if result.tokens:
+        token = result.tokens[0]
+        session["generated_token"] = token
+        flash("Tag generated. Set your PIN to claim it.", "ok")
+        return redirect(url_for("main.lighter_page", token=token))
 
     flash("Could not generate a tag right now. Please try again.", "err")
     return redirect(url_for("main.home"))
@@ -120,21 +91,130 @@ def require_admin():
 
 
 # ---------------- Helpers ----------------
-def get_or_404(token: str) -> Lighter:
-    lighter = Lighter.query.filter_by(token=token).first()
+def _own_generated_token(token: str) -> bool:
+    # The browser that just generated this tag may land on a worker whose
+    # token filter hasn't seen it yet. Only look at the session if there is one.
+    if current_app.config["SESSION_COOKIE_NAME"] not in request.cookies:
+        return False
+    return session.get("generated_token") == token
+
+
+def _load_lighter(token: str, with_items: bool = False) -> Lighter | None:
+    if not token_filter.might_exist(token) and not _own_generated_token(token):
+        return None
+
+    q = Lighter.query.filter_by(token=token)
+    if with_items:
+        # tag + items in one statement instead of a lazy load while rendering
+        q = q.options(joinedload(Lighter.items))
+    lighter = q.one_or_none()
+    if lighter is None:
+        token_filter.note_false_positive()
+    return lighter
+
+
+def _load_lighter_with_items(token: str) -> Lighter | None:
+    return _load_lighter(token, with_items=True)
+
+
+def get_or_404(token: str, with_items: bool = False) -> Lighter:
+    lighter = _load_lighter(token, with_items)
     if not lighter:
         abort(404)
     return lighter
 
 
-def ensure_default_items(lighter: Lighter):
-    if lighter.items and len(lighter.items) > 0:
-        return
+def get_view_or_404(token: str, with_items: bool = False) -> TagView | Lighter:
+    """
+    Public, read-only view of a tag (a TagView from tag_cache when enabled,
+    which always carries the items). Use get_or_404 for anything that writes.
+    """
+    loader = _load_lighter_with_items if with_items or tag_cache.enabled else _load_lighter
+    view = tag_cache.get(token, loader)
+    if not view:
+        abort(404)
+    return view
+
+
+def _throttle_client() -> str | None:
+    """
+    The address to ration PIN attempts by, or None when it would be a
+    proxy's (forwarded, but TRUSTED_PROXIES isn't set): see app/throttle.py.
+    """
+    if "X-Forwarded-For" in request.headers and not current_app.config["TRUSTED_PROXIES"]:
+        return None
+    return request.remote_addr or ""
 
-    defaults = ["Keys", "Wallet", "Bag", "Lighter", "Other"]
-    for label in defaults:
-        db.session.add(LighterItem(lighter_id=lighter.id, label=label))
-    db.session.commit()
+
+def pin_throttled(token: str) -> int:
+    """
+    Spend one PIN attempt for this tag + client. Returns 0 if the PIN may
+    be checked, else flashes and returns the seconds to wait (for
+    throttled_redirect). Call before verify_pin.
+    """
+    wait = pin_throttle.attempt(token, _throttle_client())
+    if not wait:
+        return 0
+    seconds = math.ceil(wait)
+    flash(f"Too many PIN attempts. Try again in {seconds} seconds.", "err")
+    return seconds
+
+
+def throttled_redirect(location: str, seconds: int):
+    resp = redirect(location)
+    resp.headers["Retry-After"] = str(seconds)
+    return resp
+
+
+def _inbox_page_size() -> int:
+    size = request.args.get("size", type=int) or current_app.config["INBOX_PAGE_SIZE"]
+    return max(1, min(size, 100))
+
+
+def public_etag(view, template: str) -> str:
+    """
+    Validator for a public tag page: changes with the tag's content
+    (updated_at), the language, the template and the built assets it links
+    to (a rebuild renames them), but not with scans.
+    """
+    raw = (
+        f"{PUBLIC_PAGE_VERSION}|{template}|{view.token}|{view.updated_at.isoformat()}"
+        f"|{get_locale()}|{assets.digest}"
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def public_page(template: str, view, **context):
+    """
+    Render a public tag page so a browser or CDN/reverse proxy can keep it:
+    ETag + 304s, shared-cacheable for PUBLIC_PAGE_MAX_AGE seconds, and the
+    session is never touched for visitors without a session cookie.
+    Only pages whose language comes from Accept-Language are shared: a
+    `lang` cookie (🌍 menu) makes the response private, since a proxy that
+    keys on the URL alone would hand that language to everyone.
+    """
+    has_session = current_app.config["SESSION_COOKIE_NAME"] in request.cookies
+    if has_session and session.get("_flashes"):
+        # one-off flash message for this browser: render it, cache nothing
+        resp = make_response(render_template(template, lighter=view, **context))
+        resp.headers["Cache-Control"] = "private, no-store"
+        return resp
+
+    etag = public_etag(view, template)
+    if request.if_none_match.contains(etag):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = make_response(render_template(template, lighter=view, public_page=True, **context))
+    resp.set_etag(etag)
+    resp.vary.add("Accept-Language")
+
+    if has_session or "lang" in request.cookies:
+        resp.headers["Cache-Control"] = "private, no-cache"
+        resp.vary.add("Cookie")
+    else:
+        max_age = current_app.config["PUBLIC_PAGE_MAX_AGE"]
+        resp.headers["Cache-Control"] = f"public, max-age=0, s-maxage={max_age}"
+    return resp
 
 
 # ---------------- Public pages ----------------
@@ -149,35 +229,37 @@ def how_it_works():
 
 
 @bp.get("/l/<token>")
+@query_budget(3)
 def lighter_page(token):
-    lighter = get_or_404(token)
-    return render_template("choice.html", lighter=lighter)
+    lighter = get_view_or_404(token)
+    return public_page("choice.html", lighter)
 @bp.get("/l/<token>/finder")
+@query_budget(1)
 def finder_page(token):
-    lighter = get_or_404(token)
+    # read-only: default items are written at claim time (app/items.py)
+    lighter = get_view_or_404(token, with_items=True)
 
-    lighter.scan_count += 1
-    lighter.updated_at = datetime.utcnow()
-    db.session.commit()
+    # the scan itself is counted by the page's beacon (scan_beacon below)
+    return public_page("finder.html", lighter)
 
-    unread_count = 0
-    if lighter.is_claimed():
-        ensure_default_items(lighter)
-        unread_count = FoundMessage.query.filter_by(
-            lighter_id=lighter.id,
-            is_read=False
-        ).count()
 
-    return render_template(
-        "finder.html",
-        lighter=lighter,
-        unread_count=unread_count
-    )
+@bp.post("/l/<token>/scan")
+@query_budget(4)
+def scan_beacon(token):
+    """
+    Counts one finder scan; finder.html posts here after it loads, so the
+    page can come from a cache while every real visit is still counted.
+    """
+    lighter = get_view_or_404(token)
+    resp = jsonify(scan_count=scan_buffer.record(lighter))
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 
 @bp.get("/l/<token>/owner")
+@query_budget(3)
 def owner_page(token):
-    lighter = get_or_404(token)
+    lighter = get_view_or_404(token)
 
     if not lighter.is_claimed():
         return redirect(url_for("main.finder_page", token=token))
@@ -186,6 +268,7 @@ def owner_page(token):
 
 
 @bp.post("/l/<token>/owner")
+@query_budget(4)
 def owner_unlock(token):
     lighter = get_or_404(token)
 
@@ -193,37 +276,37 @@ def owner_unlock(token):
         return redirect(url_for("main.finder_page", token=token))
 
     pin = (request.form.get("pin") or "").strip()
-    if not pin or not lighter.owner_pin_hash or not check_password_hash(lighter.owner_pin_hash, pin):
+    wait = pin and pin_throttled(token)
+    if wait:
+        return throttled_redirect(url_for("main.owner_page", token=token), wait)
+    if not verify_pin(lighter, pin):
         flash("Wrong owner PIN.", "err")
         return redirect(url_for("main.owner_page", token=token))
 
-    session[f"owner_ok_{token}"] = True
+    grant("owner", token)
     flash("Owner dashboard unlocked.", "ok")
     return redirect(url_for("main.owner_dashboard", token=token))
 
 
 @bp.get("/l/<token>/owner/dashboard")
+@query_budget(4)
 def owner_dashboard(token):
-    lighter = get_or_404(token)
+    lighter = get_or_404(token, with_items=True)
 
     if not lighter.is_claimed():
         return redirect(url_for("main.finder_page", token=token))
 
-    if not (session.get(f"edit_ok_{token}") or session.get(f"owner_ok_{token}")):
+    if not has_grant(token):
         flash("Owner PIN required.", "err")
         return redirect(url_for("main.owner_page", token=token))
 
-    ensure_default_items(lighter)
-
-    unread_count = FoundMessage.query.filter_by(
-        lighter_id=lighter.id,
-        is_read=False
-    ).count()
-
+    series = daily_series(lighter.id)
     return render_template(
         "owner.html",
         lighter=lighter,
-        unread_count=unread_count
+        unread_count=lighter.unread_count,
+        scan_series=series,
+        scan_series_max=max(n for _, n in series) or 1,
     )
 
 # ---------------- Claim / Edit ----------------
@@ -249,15 +332,16 @@ def claim_lighter(token):
     lighter.private_message = private_message or "Thanks for finding this."
     lighter.owner_phone = owner_phone or None
     lighter.show_owner_phone = False
-    lighter.owner_pin_hash = generate_password_hash(pin)
+    lighter.owner_pin_hash = hash_pin(pin)
     lighter.claimed_at = datetime.utcnow()
     lighter.updated_at = datetime.utcnow()
 
     if owner_email:
         lighter.owner_email = owner_email
 
+    items.add_defaults(lighter)
     db.session.commit()
-    ensure_default_items(lighter)
+    tag_cache.invalidate(token)
 
     flash("Claimed! You can now download your QR in Edit.", "ok")
     return redirect(url_for("main.lighter_page", token=token))
@@ -271,7 +355,7 @@ def edit_lighter(token):
         flash("Claim it first.", "err")
         return redirect(url_for("main.lighter_page", token=token))
 
-    if not session.get(f"edit_ok_{token}"):
+    if not has_grant(token, "edit"):
         flash("Owner PIN required to edit.", "err")
         return redirect(url_for("main.lighter_page", token=token) + "#tab-edit")
 
@@ -300,6 +384,7 @@ def edit_lighter(token):
 
     lighter.updated_at = datetime.utcnow()
     db.session.commit()
+    tag_cache.invalidate(token)
 
     flash("Updated.", "ok")
     return redirect(url_for("main.lighter_page", token=token))
@@ -314,34 +399,41 @@ def edit_unlock(token):
         return redirect(url_for("main.lighter_page", token=token))
 
     pin = (request.form.get("pin") or "").strip()
-    if not pin or not lighter.owner_pin_hash or not check_password_hash(lighter.owner_pin_hash, pin):
+    wait = pin and pin_throttled(token)
+    if wait:
+        return throttled_redirect(url_for("main.lighter_page", token=token) + "#tab-edit", wait)
+    if not verify_pin(lighter, pin):
         flash("Wrong owner PIN.", "err")
         return redirect(url_for("main.lighter_page", token=token) + "#tab-edit")
 
-    session[f"edit_ok_{token}"] = True
+    grant("edit", token)
     flash("Edit unlocked.", "ok")
     return redirect(url_for("main.lighter_page", token=token) + "#tab-edit")
 
 
 @bp.post("/l/<token>/delete")
+@query_budget(8)
 def delete_lighter(token):
     lighter = get_or_404(token)
 
     # Owner session OR admin can delete
-    if not (session.get(f"owner_ok_{token}") or session.get(f"edit_ok_{token}") or admin_authed()):
+    if not (has_grant(token) or admin_authed()):
         flash("Owner PIN required to delete this tag.", "err")
         return redirect(url_for("main.owner_page", token=token))
 
     # delete related records first
     FoundMessage.query.filter_by(lighter_id=lighter.id).delete()
     LighterItem.query.filter_by(lighter_id=lighter.id).delete()
+    ScanHourly.query.filter_by(lighter_id=lighter.id).delete()
+    ScanDaily.query.filter_by(lighter_id=lighter.id).delete()
 
     db.session.delete(lighter)
     db.session.commit()
+    tag_cache.invalidate(token)
+    token_filter.note_deleted()
 
     # clear sessions
-    session.pop(f"owner_ok_{token}", None)
-    session.pop(f"edit_ok_{token}", None)
+    revoke(token)
 
     # clear generated token if it matches
     if session.get("generated_token") == token:
@@ -353,6 +445,7 @@ def delete_lighter(token):
 
 # ---------------- Finder -> leave a message (EMAIL ALERT) ----------------
 @bp.post("/l/<token>/found")
+@query_budget(6)
 def found_lighter(token):
     lighter = get_or_404(token)
 
@@ -385,9 +478,10 @@ def found_lighter(token):
     lighter.found_at = datetime.utcnow()
     lighter.found_note = note
     lighter.updated_at = datetime.utcnow()
-    db.session.commit()
+    lighter.unread_count = Lighter.unread_count + 1
 
-    if lighter.has_owner_email() and _email_enabled():
+    # queued in the same transaction; the outbox worker sends it
+    if lighter.has_owner_email() and email_enabled():
         subject = f"FlameTag: Someone found your item ({lighter.token})"
         body = (
             f"Someone left a note for your FlameTag {lighter.token}.\n\n"
@@ -396,7 +490,11 @@ def found_lighter(token):
             f"Open your tag:\nhttps://flametag.app/l/{lighter.token}\n\n"
             f"To read all messages, unlock with your PIN."
         )
-        send_email(lighter.owner_email, subject, body)
+        enqueue_email(lighter.owner_email, subject, body)
+
+    db.session.commit()
+    # updated_at moved: the cached view (and the ETag built from it) is stale
+    tag_cache.invalidate(token)
 
     flash("Thanks — your message has been saved for the owner.", "ok")
     return redirect(url_for("main.lighter_page", token=token))
@@ -404,6 +502,7 @@ def found_lighter(token):
 
 # ---------------- Owner -> unlock messages page ----------------
 @bp.post("/l/<token>/unlock")
+@query_budget(6)
 def unlock_private(token):
     lighter = get_or_404(token)
 
@@ -412,31 +511,64 @@ def unlock_private(token):
         return redirect(url_for("main.lighter_page", token=token))
 
     pin = (request.form.get("pin") or "").strip()
-    if not pin or not lighter.owner_pin_hash or not check_password_hash(lighter.owner_pin_hash, pin):
+    wait = pin and pin_throttled(token)
+    if wait:
+        return throttled_redirect(url_for("main.lighter_page", token=token), wait)
+    if not verify_pin(lighter, pin):
         flash("Wrong PIN.", "err")
         return redirect(url_for("main.lighter_page", token=token))
 
-    found_messages = (
-        FoundMessage.query
-        .filter_by(lighter_id=lighter.id)
-        .order_by(FoundMessage.created_at.desc())
-        .all()
-    )
+    # lets "load more" fetch further pages without re-sending the PIN
+    grant("owner", token)
 
-    FoundMessage.query.filter_by(
-        lighter_id=lighter.id,
-        is_read=False,
-    ).update({"is_read": True})
+    found_messages, next_cursor = inbox.load_page(lighter.id, None, _inbox_page_size())
+    inbox.mark_delivered(lighter, found_messages)
     db.session.commit()
 
     flash("Unlocked.", "ok")
-    return render_template("unlocked.html", lighter=lighter, found_messages=found_messages)
+    return render_template(
+        "unlocked.html",
+        lighter=lighter,
+        found_messages=found_messages,
+        next_cursor=next_cursor,
+    )
+
+
+@bp.get("/l/<token>/messages")
+@query_budget(6)
+def inbox_page(token):
+    """
+    Older inbox messages ("load more"). ?partial=1 returns just the message
+    cards for the page's fetch(); without it, a full page (no-JS fallback).
+    """
+    lighter = get_or_404(token)
+
+    if not has_grant(token):
+        flash("Owner PIN required.", "err")
+        return redirect(url_for("main.owner_page", token=token))
+
+    cursor = request.args.get("cursor")
+    found_messages, next_cursor = inbox.load_page(lighter.id, cursor, _inbox_page_size())
+    inbox.mark_delivered(lighter, found_messages)
+    db.session.commit()
+
+    if request.args.get("partial"):
+        resp = make_response(render_template("_inbox_messages.html", found_messages=found_messages))
+        resp.headers["X-Next-Cursor"] = next_cursor or ""
+        return resp
+
+    return render_template(
+        "unlocked.html",
+        lighter=lighter,
+        found_messages=found_messages,
+        next_cursor=next_cursor,
+    )
 
 
 # ---------------- PIN reset (EMAIL LINK) ----------------
 @bp.get("/l/<token>/reset-pin")
 def reset_pin_request(token):
-    lighter = get_or_404(token)
+    lighter = get_view_or_404(token)
     return render_template("reset_pin_request.html", lighter=lighter)
 
 
@@ -453,7 +585,7 @@ def reset_pin_send(token):
         flash("That email doesn't match this tag.", "err")
         return redirect(url_for("main.reset_pin_request", token=token))
 
-    if not _email_enabled():
+    if not email_enabled():
         flash("Email reset is not configured yet (SMTP).", "err")
         return redirect(url_for("main.reset_pin_request", token=token))
 
@@ -469,11 +601,10 @@ def reset_pin_send(token):
         f"If you didn't request this, you can ignore this email."
     )
 
-    ok = send_email(email, subject, body)
-    if ok:
-        flash("Reset link sent to your email.", "ok")
-    else:
-        flash("Could not send email. Try again.", "err")
+    enqueue_email(email, subject, body)
+    db.session.commit()
+    # only queued here: the outbox worker sends it (and retries) shortly
+    flash("Reset link queued: it should reach your email within a few minutes.", "ok")
 
     return redirect(url_for("main.lighter_page", token=token))
 
@@ -520,57 +651,93 @@ def reset_pin_save(signed):
         flash("PIN must be at least 4 characters.", "err")
         return redirect(url_for("main.reset_pin_form", signed=signed))
 
-    lighter.owner_pin_hash = generate_password_hash(new_pin)
+    lighter.owner_pin_hash = hash_pin(new_pin)
     lighter.updated_at = datetime.utcnow()
     db.session.commit()
+    tag_cache.invalidate(token)
+    # the owner proved who they are; don't leave the tag locked out
+    pin_throttle.reset(token, _throttle_client())
 
-    session.pop(f"edit_ok_{token}", None)
+    revoke(token, "edit")
 
     flash("PIN reset successfully. Use your new PIN to unlock.", "ok")
     return redirect(url_for("main.lighter_page", token=token))
 
 
-# ---------------- TEMP DB FIX ----------------
-@bp.get("/admin/db-fix-owner-email")
-def admin_db_fix_owner_email():
-    require_admin()
-
-    db.session.execute(text("""
-        ALTER TABLE lighters
-        ADD COLUMN IF NOT EXISTS owner_email VARCHAR(120);
-    """))
-    db.session.commit()
+# ---------------- Admin pages ----------------
+@bp.get("/admin")
+@query_budget(3)
+def admin():
+    if not admin_authed():
+        return render_template("admin_login.html")
 
-    flash("DB fixed: owner_email column added.", "ok")
-    return redirect(url_for("main.admin"))
+    filters = tagbrowser.TagFilters.from_args(request.args)
+    lighters, newer_cursor, older_cursor = tagbrowser.load_page(
+        filters,
+        before=request.args.get("before", type=int),
+        after=request.args.get("after", type=int),
+        size=current_app.config["ADMIN_PAGE_SIZE"],
+    )
+    return render_template(
+        "admin.html",
+        lighters=lighters,
+        filters=filters,
+        filter_args=filters.to_args(),
+        newer_cursor=newer_cursor,
+        older_cursor=older_cursor,
+    )
 
 
-@bp.get("/admin/db-fix-owner-phone")
-def admin_db_fix_owner_phone():
+@bp.get("/admin/stats")
+def admin_stats():
+    """
+    Cache / buffer / worker counters for tuning.
+    """
     require_admin()
 
-    db.session.execute(text("""
-        ALTER TABLE lighters
-        ADD COLUMN IF NOT EXISTS owner_phone VARCHAR(40);
-    """))
-    db.session.execute(text("""
-        ALTER TABLE lighters
-        ADD COLUMN IF NOT EXISTS show_owner_phone BOOLEAN NOT NULL DEFAULT FALSE;
-    """))
-    db.session.commit()
+    return jsonify({
+        "tag_cache": tag_cache.stats(),
+        "qr_cache": qr_cache.stats(),
+        "scan_buffer": scan_buffer.stats(),
+        "outbox": outbox_worker.stats(),
+        "token_filter": token_filter.stats(),
+        "pin_throttle": pin_throttle.stats(),
+        "metrics": metrics.stats(),
+        "query_budget": query_budgets.stats(),
+        "assets": assets.stats(),
+    })
+
+
+@bp.get("/metrics")
+def metrics_export():
+    """
+    Prometheus scrape target: METRICS_TOKEN as bearer token, or an admin session.
+    """
+    if not metrics.enabled or not (metrics.authorized() or admin_authed()):
+        abort(404)
 
-    flash("DB fixed: owner_phone and show_owner_phone columns added.", "ok")
-    return redirect(url_for("main.admin"))
+    resp = Response(metrics.render(), mimetype="text/plain")
+    resp.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 
-# ---------------- Admin pages ----------------
-@bp.get("/admin")
-def admin():
-    if not admin_authed():
-        return render_template("admin_login.html")
+@bp.post("/admin/token-filter/rebuild")
+def admin_rebuild_token_filter():
+    require_admin()
+
+    if not token_filter.enabled:
+        flash("Token filter is off (TOKEN_FILTER).", "err")
+        return redirect(url_for("main.admin"))
 
-    lighters = Lighter.query.order_by(Lighter.id.desc()).limit(50).all()
-    return render_template("admin.html", lighters=lighters)
+    token_filter.rebuild()
+    st = token_filter.stats()
+    flash(
+        f"Token filter rebuilt: {st['tokens']} tokens, {st['memory_bytes'] // 1024} KiB, "
+        f"expected false-positive rate {st['expected_fp_rate']:.4%}.",
+        "ok",
+    )
+    return redirect(url_for("main.admin"))
 
 
 @bp.post("/admin/login")
@@ -583,6 +750,7 @@ def admin_login():
         return redirect(url_for("main.admin"))
 
     session["is_admin"] = True
+    rotate_session()
     flash("Admin access granted.", "ok")
     return redirect(url_for("main.admin"))
 
@@ -592,44 +760,65 @@ def admin_generate():
     require_admin()
 
     how_many = int(request.form.get("how_many") or 0)
-    how_many = max(0, min(how_many, 5000))
+    how_many = max(0, min(how_many, current_app.config["ADMIN_GENERATE_MAX"]))
 
-    created = []
-    for _ in range(how_many):
-        token = "".join(secrets.choice("ABCDEFGHJKLMNPQRSTUVWXYZ23456789") for _ in range(8))
-        if Lighter.query.filter_by(token=token).first():
-            continue
-        lighter = Lighter(token=token)
-        db.session.add(lighter)
-        created.append(token)
+    result = allocate_tokens(how_many, origin="admin")
+    current_app.logger.info("admin_generate: %s", result.summary())
 
-    db.session.commit()
-    flash(f"Created {len(created)} tokens.", "ok")
+    created = result.tokens
+    flash(f"Created {len(created)} tokens in {result.elapsed:.2f}s.", "ok")
     return render_template("admin_created.html", created=created)
 
 
 @bp.post("/admin/import")
 def admin_import():
+    """
+    Tokens from an uploaded .csv/.txt file (streamed, any size) or the textarea.
+    """
     require_admin()
 
-    raw = (request.form.get("tokens") or "").strip()
-    tokens = [t.strip().upper() for t in raw.replace(",", "\n").splitlines() if t.strip()]
+    def log_progress(result):
+        current_app.logger.info("admin_import progress: %s", result.summary())
 
-    created = 0
-    for token in tokens:
-        if len(token) < 4 or len(token) > 32:
-            continue
-        if Lighter.query.filter_by(token=token).first():
-            continue
-        db.session.add(Lighter(token=token))
-        created += 1
+    upload = request.files.get("file")
+    if upload and upload.filename:
+        csv_mode = upload.filename.lower().endswith(".csv")
+        result = import_file(upload.stream, csv_mode=csv_mode, progress=log_progress, origin="import")
+    else:
+        result = import_file((request.form.get("tokens") or "").splitlines(), progress=log_progress, origin="import")
+    current_app.logger.info("admin_import: %s", result.summary())
 
-    db.session.commit()
-    flash(f"Imported {created} tokens.", "ok")
+    flash(
+        f"Imported {result.imported} tokens ({result.duplicates} duplicates, "
+        f"{result.skipped} invalid skipped).",
+        "ok",
+    )
     return redirect(url_for("main.admin"))
 
 
+@bp.get("/admin/export-tags")
+def admin_export_tags():
+    """
+    Every tag matching the browser's filters, with its counts, as a
+    streamed CSV or JSONL download.
+    """
+    require_admin()
+    from .tag_export import FORMATS as TAG_EXPORT_FORMATS, stream_export
+
+    fmt = (request.args.get("format") or "csv").lower()
+    if fmt not in TAG_EXPORT_FORMATS:
+        fmt = "csv"
+    filters = tagbrowser.TagFilters.from_args(request.args)
+
+    filename = f"flametag-tags-{datetime.utcnow():%Y%m%d-%H%M}.{fmt}"
+    resp = Response(stream_with_context(stream_export(fmt, filters)), mimetype=TAG_EXPORT_FORMATS[fmt])
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
 @bp.post("/admin/delete/<token>")
+@query_budget(8)
 def admin_delete_tag(token):
     require_admin()
 
@@ -644,6 +833,14 @@ def admin_delete_tag(token):
         text("DELETE FROM lighter_items WHERE lighter_id = :id"),
         {"id": lighter.id}
     )
+    db.session.execute(
+        text("DELETE FROM scan_hourly WHERE lighter_id = :id"),
+        {"id": lighter.id}
+    )
+    db.session.execute(
+        text("DELETE FROM scan_daily WHERE lighter_id = :id"),
+        {"id": lighter.id}
+    )
 
     # delete the tag
     db.session.execute(
@@ -652,25 +849,104 @@ def admin_delete_tag(token):
     )
 
     db.session.commit()
+    tag_cache.invalidate(token)
+    token_filter.note_deleted()
 
     flash(f"Tag {token} deleted.", "ok")
     return redirect(url_for("main.admin"))
 
+@bp.post("/admin/export-qr")
+def admin_export_qr():
+    """
+    Bulk QR download: tokens pasted/just created, or an id range.
+    Streams a ZIP (png/svg) or a printable multi-page PDF sheet.
+    """
+    require_admin()
+    # qrcode/PIL + multiprocessing: only loaded by the worker that exports
+    from .qr_export import FORMATS as QR_EXPORT_FORMATS, stream_pdf, stream_zip
+
+    fmt = (request.form.get("format") or "pdf").lower()
+    if fmt not in QR_EXPORT_FORMATS:
+        fmt = "pdf"
+    labels = request.form.get("labels", "on") == "on"
+    limit = current_app.config["QR_EXPORT_MAX"]
+
+    raw = (request.form.get("tokens") or "").strip()
+    from_id = request.form.get("from_id", type=int)
+    to_id = request.form.get("to_id", type=int)
+
+    if raw:
+        wanted = []
+        seen = set()
+        for t in raw.replace(",", "\n").splitlines():
+            t = t.strip().upper()
+            if t and t not in seen:
+                seen.add(t)
+                wanted.append(t)
+        wanted = wanted[:limit]
+
+        # one IN query per chunk, then keep the order the admin gave us
+        existing = set()
+        for i in range(0, len(wanted), 500):
+            chunk = wanted[i:i + 500]
+            rows = db.session.query(Lighter.token).filter(Lighter.token.in_(chunk)).all()
+            existing.update(r[0] for r in rows)
+        tokens = [t for t in wanted if t in existing]
+    elif from_id is not None and to_id is not None:
+        lo, hi = sorted((from_id, to_id))
+        rows = (
+            db.session.query(Lighter.token)
+            .filter(Lighter.id >= lo, Lighter.id <= hi)
+            .order_by(Lighter.id.asc())
+            .limit(limit)
+            .all()
+        )
+        tokens = [r[0] for r in rows]
+    else:
+        tokens = []
+
+    if not tokens:
+        flash("No matching tokens to export.", "err")
+        return redirect(url_for("main.admin"))
+
+    workers = current_app.config["QR_EXPORT_WORKERS"] or None
+    if fmt == "pdf":
+        body = stream_pdf(tokens, workers=workers)
+        mimetype = "application/pdf"
+        filename = f"flametag-sheet-{len(tokens)}.pdf"
+    else:
+        body = stream_zip(tokens, fmt=fmt, labels=labels, workers=workers)
+        mimetype = "application/zip"
+        filename = f"flametag-qr-{fmt}-{len(tokens)}.zip"
+
+    resp = Response(body, mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
 # ---------------- QR ----------------
 @bp.get("/qr/<token>")
+@query_budget(2)
 def qr_code(token):
-    Lighter.query.filter_by(token=token).first_or_404()
-    url = f"https://flametag.app/l/{token}"
+    get_view_or_404(token)
+
+    # optional smaller renders (thumbnails); clamp so nobody can ask for huge images
+    box_size = request.args.get("box", type=int) or 10
+    box_size = max(2, min(box_size, 20))
 
-    qr = qrcode.QRCode(version=1, box_size=10, border=2)
-    qr.add_data(url)
-    qr.make(fit=True)
+    png, etag = qr_cache.get_or_render(token, box_size=box_size, border=2)
 
-    img = qr.make_image(fill_color="white", back_color="black")
+    resp = Response(png, mimetype="image/png")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp.make_conditional(request)
 
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
 
-    return send_file(buf, mimetype="image/png")
- 
+# ---------------- built static assets ----------------
+@bp.get("/assets/<path:filename>")
+def asset(filename):
+    """
+    Hashed files from `flask assets-build`: cached forever, precompressed copy if accepted.
+    """
+    return assets.send(filename)
@@ -0,0 +1,260 @@
+"""
+Write-behind scan counter.
+
+With SCAN_BUFFER unset every finder scan is one UPDATE + commit, as before.
+With SCAN_BUFFER=memory increments are collected per worker; with
+SCAN_BUFFER=local they go to a shared SQLite file (SCAN_BUFFER_PATH) so all
+gunicorn workers on the host share one buffer. Either way a background
+thread folds them into lighters.scan_count with one batched UPDATE every
+SCAN_FLUSH_SECONDS, and whatever is pending is flushed at process exit.
+
+Scans are kept per (tag, UTC hour), and the same flush upserts them into
+scan_hourly for the owner's chart (see app/analytics.py). The beacon's
+count never comes from a cached TagView alone: unbuffered it is read back
+from the UPDATE, and a flush drops the flushed tags from tag_cache.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import select, text
+
+from . import db
+from .analytics import add_hourly, hour_bucket
+from .localstore import LocalStore
+from .models import Lighter
+from .tagcache import tag_cache
+
+log = logging.getLogger(__name__)
+
+LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_pending_hourly (
+    lighter_id INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (lighter_id, hour)
+);
+"""
+
+# updated_at is left alone: it marks content edits and feeds the public
+# page ETag, which must not change on every scan
+UPDATE_SQL = text("UPDATE lighters SET scan_count = scan_count + :n WHERE id = :id")
+# unbuffered: the new count comes from the row itself, not from the caller's
+# (possibly cached) view of the tag
+RECORD_SQL = text("UPDATE lighters SET scan_count = scan_count + 1 WHERE id = :id RETURNING scan_count")
+
+# local mode: look at the shared buffer's size every this many scans per worker
+LOCAL_SIZE_CHECK_EVERY = 64
+
+
+class ScanBuffer:
+    def __init__(self):
+        self.app = None
+        self.mode = ""
+        self.flush_seconds = 5.0
+        self.max_pending = 10000
+        self.store = None
+
+        # {(lighter_id, hour): n}; _pending holds the per-tag totals
+        self._hourly = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        self.recorded = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = (app.config.get("SCAN_BUFFER") or "").lower()
+        self.flush_seconds = float(app.config.get("SCAN_FLUSH_SECONDS", self.flush_seconds))
+        self.max_pending = int(app.config.get("SCAN_FLUSH_MAX_PENDING", self.max_pending))
+
+        if self.mode == "local":
+            self.store = LocalStore(app.config["SCAN_BUFFER_PATH"], LOCAL_SCHEMA)
+        elif self.mode not in ("", "off", "memory"):
+            raise ValueError(f"Unknown SCAN_BUFFER mode: {self.mode!r}")
+
+        if self.enabled:
+            atexit.register(self.flush)
+        app.extensions["scan_buffer"] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("memory", "local")
+
+    # ---------------- record ----------------
+    def record(self, lighter) -> int:
+        """
+        Count one scan of `lighter` (a Lighter or TagView); returns the count
+        to display. Synchronous (UPDATE + commit, as before) when buffering is off.
+        """
+        if not self.enabled:
+            count = db.session.execute(RECORD_SQL, {"id": lighter.id}).scalar()
+            add_hourly({(lighter.id, hour_bucket(time.time())): 1})
+            db.session.commit()
+            return lighter.scan_count if count is None else count
+
+        self._add(lighter.id)
+        return lighter.scan_count + self.pending_for(lighter.id)
+
+    def _add(self, lighter_id: int):
+        self._ensure_flusher()
+        self.recorded += 1
+        key = (lighter_id, hour_bucket(time.time()))
+
+        if self.mode == "local":
+            self.store.execute(
+                "INSERT INTO scan_pending_hourly (lighter_id, hour, n) VALUES (?, ?, 1) "
+                "ON CONFLICT(lighter_id, hour) DO UPDATE SET n = n + 1",
+                key,
+            )
+            # SCAN_FLUSH_MAX_PENDING caps the shared file too, checked now and
+            # then rather than on every scan; any worker's flush drains it all
+            if self.recorded % LOCAL_SIZE_CHECK_EVERY == 0:
+                rows = self.store.execute("SELECT COUNT(*) FROM scan_pending_hourly").fetchone()[0]
+                if rows >= self.max_pending:
+                    self._wake.set()
+            return
+
+        with self._lock:
+            self._hourly[key] = self._hourly.get(key, 0) + 1
+            self._pending[lighter_id] = self._pending.get(lighter_id, 0) + 1
+            too_many = len(self._pending) >= self.max_pending
+        if too_many:
+            self._wake.set()
+
+    def pending_for(self, lighter_id: int) -> int:
+        """
+        Scans counted but not yet flushed, so pages can show an up-to-date number.
+        """
+        if self.mode == "local":
+            row = self.store.execute(
+                "SELECT SUM(n) FROM scan_pending_hourly WHERE lighter_id = ?", (lighter_id,)
+            ).fetchone()
+            return row[0] or 0
+        with self._lock:
+            return self._pending.get(lighter_id, 0)
+
+    # ---------------- flush ----------------
+    def _drain(self) -> dict:
+        """
+        Take everything pending as {(lighter_id, hour): n}.
+        """
+        if self.mode == "local":
+            with self.store.transaction() as c:
+                rows = c.execute("SELECT lighter_id, hour, n FROM scan_pending_hourly").fetchall()
+                c.execute("DELETE FROM scan_pending_hourly")
+            return {(i, h): n for i, h, n in rows}
+
+        with self._lock:
+            pending, self._hourly, self._pending = self._hourly, {}, {}
+        return pending
+
+    def _restore(self, pending: dict):
+        if self.mode == "local":
+            with self.store.transaction() as c:
+                c.executemany(
+                    "INSERT INTO scan_pending_hourly (lighter_id, hour, n) VALUES (?, ?, ?) "
+                    "ON CONFLICT(lighter_id, hour) DO UPDATE SET n = n + excluded.n",
+                    [(i, h, n) for (i, h), n in pending.items()],
+                )
+            return
+
+        with self._lock:
+            for (lighter_id, hour), n in pending.items():
+                self._hourly[(lighter_id, hour)] = self._hourly.get((lighter_id, hour), 0) + n
+                self._pending[lighter_id] = self._pending.get(lighter_id, 0) + n
+
+    def flush(self) -> int:
+        """
+        Apply pending increments in one executemany UPDATE, plus one upsert of
+        the hourly buckets, in the same transaction. Returns scans written.
+        """
+        if not self.enabled or self.app is None:
+            return 0
+
+        pending = self._drain()
+        if not pending:
+            return 0
+
+        totals = defaultdict(int)
+        for (lighter_id, _), n in pending.items():
+            totals[lighter_id] += n
+        # ordered by id so concurrent flushers take row locks in the same order
+        params = [{"n": n, "id": i} for i, n in sorted(totals.items())]
+
+        try:
+            with self.app.app_context():
+                db.session.execute(UPDATE_SQL, params)
+                # tags deleted since the scan: nothing to chart (and no FK target)
+                live = dict(db.session.execute(
+                    select(Lighter.id, Lighter.token).where(Lighter.id.in_(totals))
+                ).all())
+                add_hourly({key: n for key, n in pending.items() if key[0] in live})
+                db.session.commit()
+        except Exception:
+            self.flush_errors += 1
+            log.exception("scan flush failed; keeping %d tags for retry", len(totals))
+            self._restore(pending)
+            return 0
+
+        # cached views still carry the old count, and pending_for() just dropped
+        for token in live.values():
+            tag_cache.invalidate(token)
+
+        written = sum(pending.values())
+        self.flushed += written
+        self.flushes += 1
+        return written
+
+    # ---------------- background thread ----------------
+    def after_fork(self):
+        """
+        The parent keeps (and flushes) whatever was pending at fork time.
+        """
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._hourly = {}
+        self._pending = {}
+        self._thread = None
+        self._pid = None
+
+    def _ensure_flusher(self):
+        # pid check: a thread started before a fork does not exist in the child
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="scan-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception("scan flusher crashed during flush")
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode or "off",
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+        }
+
+
+scan_buffer = ScanBuffer()
@@ -0,0 +1,253 @@
+"""
+Owner/editor grants and the optional server-side session store.
+
+Grants: unlocking a tag used to add an `owner_ok_<token>` / `edit_ok_<token>`
+key per tag to the session. They now live in one `grants` dict,
+"<kind>:<token>" -> expiry (unix time), pruned whenever a grant is added,
+so a session stays small however many tags a browser manages.
+
+Store: with SESSION_BACKEND="" (default) Flask's signed cookie holds the
+whole session, as before. With "sql" (web_sessions table) or "local"
+(SQLite file shared by the workers on the host, SESSION_LOCAL_PATH) the
+cookie only carries a signed session id; the data stays on the server for
+SESSION_IDLE_SECONDS after the last write (refreshed at most hourly), and
+the cookie is re-issued with the same lifetime on every such write.
+Expired rows are removed in batches: a few on the odd write, all of them
+with `flask sessions-gc`. The cookie name is unchanged, so "has a session
+cookie" checks (public page caching) work with either.
+"""
+import random
+import secrets
+import time
+from datetime import datetime, timezone
+
+from flask import current_app, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, select, update
+
+from . import db
+from .localstore import LocalStore
+from .models import WebSession
+
+GRANT_KINDS = ("owner", "edit")
+
+LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS web_sessions (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_web_sessions_expires ON web_sessions (expires);
+"""
+
+# an unchanged session is rewritten (to push its expiry) at most this often
+REFRESH_SECONDS = 3600
+
+
+# ---------------- grants ----------------
+def grant(kind: str, token: str):
+    """
+    Remember that this browser proved it owns `token` (kind "owner" or "edit").
+    """
+    now = time.time()
+    grants = {k: exp for k, exp in session.get("grants", {}).items() if exp > now}
+    grants[f"{kind}:{token}"] = int(now + current_app.config["GRANT_SECONDS"])
+    session["grants"] = grants
+    rotate_session()
+
+
+def rotate_session():
+    """
+    New privileges: a server-side session gets a fresh id, so an id that
+    may have been seen before isn't upgraded. The signed cookie has no id.
+    """
+    if isinstance(session, ServerSession):
+        session.rotate = True
+
+
+def has_grant(token: str, *kinds: str) -> bool:
+    """
+    Any of `kinds` (default: any kind) unlocked for `token` and not expired.
+    """
+    grants = session.get("grants")
+    if not grants:
+        return False
+    now = time.time()
+    return any(grants.get(f"{kind}:{token}", 0) > now for kind in kinds or GRANT_KINDS)
+
+
+def revoke(token: str, *kinds: str):
+    grants = session.get("grants")
+    if not grants:
+        return
+    keys = [f"{kind}:{token}" for kind in kinds or GRANT_KINDS]
+    if any(k in grants for k in keys):
+        session["grants"] = {k: exp for k, exp in grants.items() if k not in keys}
+
+
+# ---------------- server-side store ----------------
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid: str | None = None, expires: float = 0.0):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires = expires
+        self.rotate = False
+
+
+class _SqlBackend:
+    def load(self, sid: str) -> tuple[str, float] | None:
+        row = db.session.execute(
+            select(WebSession.data, WebSession.expires_at).where(WebSession.id == sid)
+        ).first()
+        if row is None:
+            return None
+        return row.data, row.expires_at.replace(tzinfo=timezone.utc).timestamp()
+
+    def save(self, sid: str, data: str, expires: float, new: bool):
+        expires_at = datetime.fromtimestamp(expires, timezone.utc).replace(tzinfo=None)
+        table = WebSession.__table__
+        # own connection + transaction: independent of the request's db.session
+        with db.engine.begin() as conn:
+            if new or not conn.execute(
+                update(table).where(table.c.id == sid).values(data=data, expires_at=expires_at)
+            ).rowcount:
+                conn.execute(table.insert().values(id=sid, data=data, expires_at=expires_at))
+
+    def delete(self, sid: str):
+        with db.engine.begin() as conn:
+            conn.execute(delete(WebSession.__table__).where(WebSession.id == sid))
+
+    def purge_expired(self, batch_size: int) -> int:
+        table = WebSession.__table__
+        with db.engine.begin() as conn:
+            ids = select(table.c.id).where(table.c.expires_at < datetime.utcnow()).limit(batch_size)
+            return conn.execute(delete(table).where(table.c.id.in_(ids.scalar_subquery()))).rowcount
+
+
+class _LocalBackend:
+    def __init__(self, path: str):
+        self.store = LocalStore(path, LOCAL_SCHEMA)
+
+    def load(self, sid: str) -> tuple[str, float] | None:
+        return self.store.execute("SELECT data, expires FROM web_sessions WHERE id = ?", (sid,)).fetchone()
+
+    def save(self, sid: str, data: str, expires: float, new: bool):
+        self.store.execute(
+            "INSERT OR REPLACE INTO web_sessions (id, data, expires) VALUES (?, ?, ?)",
+            (sid, data, expires),
+        )
+
+    def delete(self, sid: str):
+        self.store.execute("DELETE FROM web_sessions WHERE id = ?", (sid,))
+
+    def purge_expired(self, batch_size: int) -> int:
+        return self.store.execute(
+            "DELETE FROM web_sessions WHERE id IN "
+            "(SELECT id FROM web_sessions WHERE expires < ? LIMIT ?)",
+            (time.time(), batch_size),
+        ).rowcount
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend, idle_seconds: int, gc_batch: int = 200, gc_chance: float = 0.01):
+        self.backend = backend
+        self.idle_seconds = idle_seconds
+        self.gc_batch = gc_batch
+        self.gc_chance = gc_chance
+
+    def _signer(self, app) -> Signer:
+        return Signer(app.secret_key, salt="flametag-session-id")
+
+    def open_session(self, app, request):
+        raw = request.cookies.get(self.get_cookie_name(app))
+        if not raw:
+            return ServerSession()
+        try:
+            sid = self._signer(app).unsign(raw).decode("ascii")
+        except BadSignature:
+            return ServerSession()
+
+        row = self.backend.load(sid)
+        if row is None or row[1] < time.time():
+            return ServerSession()
+        data, expires = row
+        return ServerSession(self.serializer.loads(data), sid=sid, expires=expires)
+
+    def save_session(self, app, session: ServerSession, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.sid is not None:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        now = time.time()
+        new_sid = session.sid is None or session.rotate
+        stale = session.expires - now < self.idle_seconds - REFRESH_SECONDS
+        if not (new_sid or session.modified or stale):
+            return
+
+        if session.rotate and session.sid is not None:
+            self.backend.delete(session.sid)
+        sid = secrets.token_urlsafe(32) if new_sid else session.sid
+        self.backend.save(sid, self.serializer.dumps(dict(session)), now + self.idle_seconds, new=new_sid)
+
+        # the row's expiry was just pushed: the cookie lives exactly as long
+        response.set_cookie(
+            name,
+            self._signer(app).sign(sid).decode("ascii"),
+            max_age=self.idle_seconds,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+        if random.random() < self.gc_chance:
+            self.backend.purge_expired(self.gc_batch)
+
+
+def init_app(app):
+    # templates: {% if has_grant(lighter.token, 'edit') %}
+    app.jinja_env.globals["has_grant"] = has_grant
+
+    backend = (app.config.get("SESSION_BACKEND") or "").lower()
+    if backend == "sql":
+        store = _SqlBackend()
+    elif backend == "local":
+        store = _LocalBackend(app.config["SESSION_LOCAL_PATH"])
+    elif backend in ("", "cookie"):
+        return
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend!r}")
+    app.session_interface = ServerSessionInterface(store, app.config["SESSION_IDLE_SECONDS"])
+
+
+def purge_expired(app, batch_size: int = 1000, pause: float = 0.1, echo=None) -> int:
+    """
+    Delete every expired server-side session, `batch_size` per transaction.
+    """
+    interface = app.session_interface
+    if not isinstance(interface, ServerSessionInterface):
+        return 0
+
+    removed = 0
+    while True:
+        n = interface.backend.purge_expired(batch_size)
+        removed += n
+        if echo and n:
+            echo(f"  {removed} removed so far")
+        if n < batch_size:
+            return removed
+        time.sleep(pause)
@@ -0,0 +1,96 @@
+"""
+Streaming export of tags (+ per-tag stats) as CSV or JSONL for reporting.
+
+Rows are read in batches and written out as they arrive, so memory stays
+flat whatever the table size. On Postgres (and other servers) one
+server-side cursor is used (yield_per); on SQLite, where a long read would
+block writers for the whole download, each batch is its own short read
+keyed on id.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import func, select
+
+from . import db
+from .models import Lighter, LighterItem
+
+BATCH_SIZE = 5000
+
+COLUMNS = ("id", "token", "claimed_at", "scan_count", "unread_count", "item_count", "updated_at")
+
+FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+def export_query(filters=None):
+    item_count = (
+        select(func.count(LighterItem.id))
+        .where(LighterItem.lighter_id == Lighter.id)
+        .correlate(Lighter)
+        .scalar_subquery()
+    )
+    stmt = select(
+        Lighter.id, Lighter.token, Lighter.claimed_at, Lighter.scan_count,
+        Lighter.unread_count, item_count.label("item_count"), Lighter.updated_at,
+    )
+    if filters is not None:
+        stmt = filters.apply(stmt)
+    return stmt
+
+
+def iter_rows(filters=None, batch_size: int = BATCH_SIZE):
+    """
+    Yields lists of rows, `batch_size` at a time, in id order.
+    """
+    stmt = export_query(filters).order_by(Lighter.id)
+
+    if db.engine.dialect.name != "sqlite":
+        result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+        yield from result.partitions()
+        return
+
+    last_id = 0
+    while True:
+        rows = db.session.execute(stmt.where(Lighter.id > last_id).limit(batch_size)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+        # end the read transaction between batches so writers get in
+        db.session.rollback()
+
+
+def _value(v):
+    return v.isoformat() if hasattr(v, "isoformat") else v
+
+
+def stream_csv(filters=None, batch_size: int = BATCH_SIZE):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS)
+    for rows in iter_rows(filters, batch_size):
+        writer.writerows([_value(v) for v in row] for row in rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.getvalue():
+        # header only: nothing matched
+        yield buf.getvalue()
+
+
+def stream_jsonl(filters=None, batch_size: int = BATCH_SIZE):
+    for rows in iter_rows(filters, batch_size):
+        yield "".join(
+            json.dumps({k: _value(v) for k, v in zip(COLUMNS, row)}, separators=(",", ":")) + "\n"
+            for row in rows
+        )
+
+
+def stream_export(fmt: str, filters=None, batch_size: int = BATCH_SIZE):
+    if fmt == "jsonl":
+        return stream_jsonl(filters, batch_size)
+    return stream_csv(filters, batch_size)
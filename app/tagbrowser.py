@@ -0,0 +1,134 @@
+"""
+Admin tag browser: filtered, keyset-paginated list of lighters.
+
+Pages are keyed on id (newest first), so any page costs the same as the
+first. Token search is a prefix match written as a range
+(token >= 'AB' AND token < 'AC') so it walks the unique token index.
+Claimed/date filters use ix_lighters_claimed_at / ix_lighters_updated_at
+(migration 004). scan_count is deliberately not indexed: it changes on
+every scan flush and an index there would tax the hottest write path.
+"""
+from dataclasses import dataclass, fields
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.orm import load_only
+
+from .models import Lighter
+
+DATE_FIELDS = {"claimed": Lighter.claimed_at, "updated": Lighter.updated_at}
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """
+    Smallest string greater than every string starting with `prefix`.
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _int(raw: str | None) -> int | None:
+    try:
+        return int(raw) if raw not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def _date(raw: str | None) -> date | None:
+    try:
+        return date.fromisoformat(raw) if raw else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class TagFilters:
+    q: str = ""
+    status: str = ""          # "", "claimed", "unclaimed"
+    scans_min: int | None = None
+    scans_max: int | None = None
+    date_field: str = "claimed"
+    date_from: date | None = None
+    date_to: date | None = None
+
+    @classmethod
+    def from_args(cls, args) -> "TagFilters":
+        status = args.get("status", "")
+        date_field = args.get("date_field", "claimed")
+        return cls(
+            q=(args.get("q") or "").strip().upper(),
+            status=status if status in ("claimed", "unclaimed") else "",
+            scans_min=_int(args.get("scans_min")),
+            scans_max=_int(args.get("scans_max")),
+            date_field=date_field if date_field in DATE_FIELDS else "claimed",
+            date_from=_date(args.get("date_from")),
+            date_to=_date(args.get("date_to")),
+        )
+
+    def to_args(self) -> dict:
+        """
+        Non-empty filters as query args (for page links).
+        """
+        out = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if value not in (None, ""):
+                out[f.name] = value.isoformat() if isinstance(value, date) else value
+        if "date_from" not in out and "date_to" not in out:
+            out.pop("date_field", None)
+        return out
+
+    def apply(self, q):
+        if self.q:
+            q = q.filter(
+                Lighter.token >= self.q,
+                Lighter.token < prefix_upper_bound(self.q),
+                # the range is for the index; LIKE keeps it exact under any collation
+                Lighter.token.like(f"{self.q}%"),
+            )
+
+        if self.status == "claimed":
+            q = q.filter(Lighter.claimed_at.isnot(None))
+        elif self.status == "unclaimed":
+            q = q.filter(Lighter.claimed_at.is_(None))
+
+        if self.scans_min is not None:
+            q = q.filter(Lighter.scan_count >= self.scans_min)
+        if self.scans_max is not None:
+            q = q.filter(Lighter.scan_count <= self.scans_max)
+
+        column = DATE_FIELDS[self.date_field]
+        if self.date_from:
+            q = q.filter(column >= datetime.combine(self.date_from, datetime.min.time()))
+        if self.date_to:
+            # inclusive: everything before the start of the next day
+            q = q.filter(column < datetime.combine(self.date_to + timedelta(days=1), datetime.min.time()))
+        return q
+
+
+def load_page(filters: TagFilters, before: int | None = None, after: int | None = None,
+              size: int = 50) -> tuple[list[Lighter], int | None, int | None]:
+    """
+    One page, newest first. `before` = older than this id, `after` = newer.
+    Returns (lighters, newer_cursor, older_cursor); a cursor is None when
+    there is nothing further in that direction.
+    """
+    q = filters.apply(Lighter.query).options(load_only(
+        Lighter.id, Lighter.token, Lighter.claimed_at, Lighter.scan_count,
+        Lighter.unread_count, Lighter.updated_at,
+    ))
+
+    if after is not None:
+        rows = q.filter(Lighter.id > after).order_by(Lighter.id.asc()).limit(size + 1).all()
+        more_newer = len(rows) > size
+        rows = rows[:size][::-1]
+        newer = rows[0].id if rows and more_newer else None
+        older = rows[-1].id if rows else None
+        return rows, newer, older
+
+    if before is not None:
+        q = q.filter(Lighter.id < before)
+    rows = q.order_by(Lighter.id.desc()).limit(size + 1).all()
+    more_older = len(rows) > size
+    rows = rows[:size]
+    newer = rows[0].id if rows and before is not None else None
+    older = rows[-1].id if rows and more_older else None
+    return rows, newer, older
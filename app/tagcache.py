@@ -0,0 +1,226 @@
+"""
+Read-through cache for the public view of a tag (+ its items).
+
+Public pages (tag landing, finder page, owner PIN page, QR) only need the
+public fields, so they read a TagView from here instead of querying
+`lighters` + `lighter_items` on every scan. Anything that changes those
+fields must call tag_cache.invalidate(token).
+
+TAG_CACHE = ""      -> off, every lookup hits the DB (default)
+TAG_CACHE = memory -> per-process TTL/LRU; other workers may serve a stale
+                      view for up to TAG_CACHE_TTL seconds after an edit
+TAG_CACHE = local  -> shared SQLite file (TAG_CACHE_PATH) for all workers on
+                      the host, so invalidation is seen by every worker
+"""
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from .localstore import LocalStore
+
+LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tag_cache (
+    token TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+# Only public data goes into the cache; never the PIN hash, private message or email.
+PUBLIC_FIELDS = (
+    "id", "token", "claimed_at", "public_message", "owner_phone",
+    "show_owner_phone", "scan_count", "updated_at",
+)
+DATETIME_FIELDS = ("claimed_at", "updated_at")
+
+
+class ItemView:
+    __slots__ = ("id", "label")
+
+    def __init__(self, id: int, label: str):
+        self.id = id
+        self.label = label
+
+
+class TagView:
+    """
+    Read-only stand-in for Lighter in public templates.
+    """
+
+    def __init__(self, data: dict):
+        for name in PUBLIC_FIELDS:
+            setattr(self, name, data.get(name))
+        self.items = [ItemView(i, label) for i, label in data.get("items", [])]
+
+    def is_claimed(self) -> bool:
+        return self.claimed_at is not None
+
+    @classmethod
+    def from_lighter(cls, lighter) -> "TagView":
+        return cls(to_data(lighter))
+
+
+def to_data(lighter) -> dict:
+    data = {name: getattr(lighter, name) for name in PUBLIC_FIELDS}
+    data["items"] = [(it.id, it.label) for it in lighter.items]
+    return data
+
+
+def _dumps(data: dict) -> str:
+    out = dict(data)
+    for name in DATETIME_FIELDS:
+        if out.get(name) is not None:
+            out[name] = out[name].isoformat()
+    return json.dumps(out, separators=(",", ":"))
+
+
+def _loads(raw: str) -> dict:
+    data = json.loads(raw)
+    for name in DATETIME_FIELDS:
+        if data.get(name) is not None:
+            data[name] = datetime.fromisoformat(data[name])
+    return data
+
+
+class TagCache:
+    def __init__(self):
+        self.mode = ""
+        self.ttl = 60.0
+        self.max_entries = 10000
+        self.store = None
+
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.mode = (app.config.get("TAG_CACHE") or "").lower()
+        self.ttl = float(app.config.get("TAG_CACHE_TTL", self.ttl))
+        self.max_entries = int(app.config.get("TAG_CACHE_SIZE", self.max_entries))
+        # nothing carried over from an earlier app (another database)
+        self._lru = OrderedDict()
+        self.hits = self.misses = self.invalidations = 0
+
+        if self.mode == "local":
+            self.store = LocalStore(app.config["TAG_CACHE_PATH"], LOCAL_SCHEMA)
+        elif self.mode not in ("", "off", "memory"):
+            raise ValueError(f"Unknown TAG_CACHE mode: {self.mode!r}")
+        app.extensions["tag_cache"] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("memory", "local")
+
+    # ---------------- backend ----------------
+    def _get(self, token: str) -> dict | None:
+        now = time.time()
+
+        if self.mode == "local":
+            row = self.store.execute(
+                "SELECT data, expires FROM tag_cache WHERE token = ?", (token,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                return None
+            return _loads(row[0])
+
+        with self._lock:
+            entry = self._lru.get(token)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires < now:
+                del self._lru[token]
+                return None
+            self._lru.move_to_end(token)
+            return data
+
+    def _put(self, token: str, data: dict):
+        expires = time.time() + self.ttl
+
+        if self.mode == "local":
+            self.store.execute(
+                "INSERT OR REPLACE INTO tag_cache (token, data, expires) VALUES (?, ?, ?)",
+                (token, _dumps(data), expires),
+            )
+            # occasional sweep so tokens that are never looked up again don't pile up
+            if random.random() < 0.01:
+                self.store.execute("DELETE FROM tag_cache WHERE expires < ?", (time.time(),))
+            return
+
+        with self._lock:
+            self._lru[token] = (data, expires)
+            self._lru.move_to_end(token)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    # ---------------- public ----------------
+    def get(self, token: str, loader):
+        """
+        Cached view for `token`; on a miss `loader(token)` returns the Lighter
+        (or None). Missing tags aren't cached. With the cache off the Lighter
+        itself is returned, so nothing (e.g. items) is loaded that isn't used.
+        """
+        if not self.enabled:
+            return loader(token)
+
+        data = self._get(token)
+        if data is not None:
+            self.hits += 1
+            return TagView(data)
+
+        self.misses += 1
+        lighter = loader(token)
+        if lighter is None:
+            return None
+
+        data = to_data(lighter)
+        self._put(token, data)
+        return TagView(data)
+
+    def invalidate(self, token: str):
+        if not self.enabled:
+            return
+        self.invalidations += 1
+
+        if self.mode == "local":
+            self.store.execute("DELETE FROM tag_cache WHERE token = ?", (token,))
+            return
+
+        with self._lock:
+            self._lru.pop(token, None)
+
+    def clear(self):
+        if self.mode == "local":
+            self.store.execute("DELETE FROM tag_cache")
+        with self._lock:
+            self._lru.clear()
+
+    def after_fork(self):
+        # LocalStore reconnects per pid by itself; only the lock needs replacing
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        if self.mode == "local":
+            entries = self.store.execute("SELECT COUNT(*) FROM tag_cache").fetchone()[0]
+        else:
+            with self._lock:
+                entries = len(self._lru)
+        return {
+            "mode": self.mode or "off",
+            "entries": entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+tag_cache = TagCache()
@@ -0,0 +1,222 @@
+"""
+Token-bucket throttle for PIN attempts.
+
+Every PIN check runs a deliberately slow hash, so guesses are rationed
+before the hash. An attempt needs a token from three buckets:
+
+  - tag + client: the tight one (PIN_TAG_BURST / PIN_TAG_PER_MINUTE), so
+    a guesser on a tag runs out without locking the tag's owner out
+  - tag: a looser ceiling over all clients (PIN_TAG_TOTAL_*), which still
+    stops a guesser spread over many addresses
+  - client: stops one client sweeping many tags
+
+An empty bucket rejects the request without hashing anything. A request
+that came through a proxy the app doesn't trust (X-Forwarded-For without
+TRUSTED_PROXIES) has no usable client address: it shares one "unknown
+client" bucket per tag and spends no client bucket, since keying on the
+proxy's address would put every client in one bucket.
+
+PIN_THROTTLE = memory -> per-process buckets (default); with N workers a
+                         client effectively gets N times the budget
+PIN_THROTTLE = local  -> buckets in a shared SQLite file (PIN_THROTTLE_PATH)
+                         for all workers on the host
+PIN_THROTTLE = off    -> no limit
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from .localstore import LocalStore
+
+LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pin_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pin_buckets_updated ON pin_buckets (updated);
+"""
+
+# memory backend: past this many buckets, drop the least recently used
+MAX_BUCKETS = 100000
+# local backend: share of attempts that sweep buckets full again anyway
+SWEEP_RATE = 0.01
+
+UNKNOWN_CLIENT = "-"
+
+
+class Bucket:
+    __slots__ = ("burst", "per_second")
+
+    def __init__(self, burst: int, per_minute: float):
+        self.burst = float(burst)
+        self.per_second = float(per_minute) / 60.0
+
+    def refill(self, tokens: float, updated: float, now: float) -> float:
+        return min(self.burst, tokens + (now - updated) * self.per_second)
+
+    def wait(self, tokens: float) -> float:
+        """
+        Seconds until `tokens` reaches one whole token.
+        """
+        if self.per_second <= 0:
+            return 3600.0
+        return (1 - tokens) / self.per_second
+
+    def full_after(self) -> float:
+        return self.burst / self.per_second if self.per_second > 0 else 3600.0
+
+
+class PinThrottle:
+    def __init__(self):
+        self.mode = "memory"
+        self.tag = Bucket(5, 5)
+        self.tag_total = Bucket(30, 30)
+        self.client = Bucket(10, 10)
+        self.store = None
+
+        # key -> (tokens, updated), least recently used first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.allowed = 0
+        self.rejected_tag = 0
+        self.rejected_tag_total = 0
+        self.rejected_client = 0
+
+    def init_app(self, app):
+        self.mode = (app.config.get("PIN_THROTTLE") or "off").lower()
+        self.tag = Bucket(app.config.get("PIN_TAG_BURST", 5), app.config.get("PIN_TAG_PER_MINUTE", 5))
+        self.tag_total = Bucket(
+            app.config.get("PIN_TAG_TOTAL_BURST", 30), app.config.get("PIN_TAG_TOTAL_PER_MINUTE", 30)
+        )
+        self.client = Bucket(app.config.get("PIN_CLIENT_BURST", 10), app.config.get("PIN_CLIENT_PER_MINUTE", 10))
+
+        self._buckets = OrderedDict()
+        self.allowed = self.rejected_tag = self.rejected_tag_total = self.rejected_client = 0
+        if self.mode == "local":
+            self.store = LocalStore(app.config["PIN_THROTTLE_PATH"], LOCAL_SCHEMA)
+        elif self.mode not in ("", "off", "memory"):
+            raise ValueError(f"Unknown PIN_THROTTLE mode: {self.mode!r}")
+        app.extensions["pin_throttle"] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("memory", "local")
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+
+    # ---------------- backends ----------------
+    def _horizon(self) -> float:
+        return max(self.tag.full_after(), self.tag_total.full_after(), self.client.full_after())
+
+    def _take_memory(self, keys, now: float) -> tuple[str, float] | None:
+        with self._lock:
+            levels = []
+            for kind, key, bucket in keys:
+                tokens, updated = self._buckets.get(key, (bucket.burst, now))
+                tokens = bucket.refill(tokens, updated, now)
+                if tokens < 1:
+                    return kind, bucket.wait(tokens)
+                levels.append((key, tokens))
+
+            for key, tokens in levels:
+                self._buckets[key] = (tokens - 1, now)
+                self._buckets.move_to_end(key)
+            # O(1) per attempt however many keys a guesser cycles through;
+            # an evicted bucket only forgets attempts, it never blocks anyone
+            while len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        return None
+
+    def _take_local(self, keys, now: float) -> tuple[str, float] | None:
+        with self.store.transaction() as c:
+            levels = []
+            for kind, key, bucket in keys:
+                row = c.execute("SELECT tokens, updated FROM pin_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (bucket.burst, now)
+                tokens = bucket.refill(tokens, updated, now)
+                if tokens < 1:
+                    return kind, bucket.wait(tokens)
+                levels.append((key, tokens))
+
+            c.executemany(
+                "INSERT OR REPLACE INTO pin_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, tokens - 1, now) for key, tokens in levels],
+            )
+            # occasional sweep of buckets that are full again anyway
+            if random.random() < SWEEP_RATE:
+                c.execute("DELETE FROM pin_buckets WHERE updated < ?", (now - self._horizon(),))
+        return None
+
+    # ---------------- public ----------------
+    def attempt(self, token: str, client: str | None) -> float:
+        """
+        Take one attempt from the tag + client, the tag and the client
+        buckets (client None: no client bucket). Returns 0.0 if the PIN may
+        be checked, else seconds to wait.
+        """
+        if not self.enabled:
+            return 0.0
+
+        keys = (
+            ("tag", f"tag:{token}:{UNKNOWN_CLIENT if client is None else client}", self.tag),
+            ("tag_total", f"tag:{token}", self.tag_total),
+        )
+        if client is not None:
+            keys += (("client", f"ip:{client}", self.client),)
+        take = self._take_local if self.mode == "local" else self._take_memory
+        denied = take(keys, time.time())
+
+        if denied is None:
+            self.allowed += 1
+            return 0.0
+
+        kind, wait = denied
+        if kind == "tag":
+            self.rejected_tag += 1
+        elif kind == "tag_total":
+            self.rejected_tag_total += 1
+        else:
+            self.rejected_client += 1
+        return max(wait, 1.0)
+
+    def reset(self, token: str, client: str | None = None):
+        """
+        Refill the tag's buckets for this client, e.g. after a PIN reset.
+        """
+        keys = [f"tag:{token}", f"tag:{token}:{UNKNOWN_CLIENT if client is None else client}"]
+
+        if self.mode == "local":
+            for key in keys:
+                self.store.execute("DELETE FROM pin_buckets WHERE key = ?", (key,))
+            return
+        with self._lock:
+            for key in keys:
+                self._buckets.pop(key, None)
+
+    def stats(self) -> dict:
+        if self.mode == "local":
+            buckets = self.store.execute("SELECT COUNT(*) FROM pin_buckets").fetchone()[0]
+        else:
+            with self._lock:
+                buckets = len(self._buckets)
+        return {
+            "mode": self.mode or "off",
+            "tag_burst": self.tag.burst,
+            "tag_per_minute": round(self.tag.per_second * 60, 3),
+            "tag_total_burst": self.tag_total.burst,
+            "tag_total_per_minute": round(self.tag_total.per_second * 60, 3),
+            "client_burst": self.client.burst,
+            "client_per_minute": round(self.client.per_second * 60, 3),
+            "buckets": buckets,
+            "allowed": self.allowed,
+            "rejected_tag": self.rejected_tag,
+            "rejected_tag_total": self.rejected_tag_total,
+            "rejected_client": self.rejected_client,
+        }
+
+
+pin_throttle = PinThrottle()
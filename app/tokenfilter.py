@@ -0,0 +1,250 @@
+"""
+Negative-lookup filter for tokens.
+
+A Bloom filter of every token in `lighters`, held in memory per worker.
+Routes ask it first: "definitely not a tag" -> 404 with zero queries, which
+is what almost every random enumeration probe gets. "Maybe" falls through to
+the normal DB lookup.
+
+Tokens created by this worker are added immediately. Tokens created by
+other workers are picked up by an incremental refresh (new ids only), which
+runs at most once every TOKEN_FILTER_REFRESH_SECONDS and only when a lookup
+misses. Deleted tokens stay in the filter (Bloom filters can't remove)
+until the next rebuild; they just cost a query, like any false positive.
+When big generate/import batches overfill it, a rebuild at twice the size
+runs in a background thread; until it is done every lookup goes to the DB.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from . import db
+from .models import Lighter
+
+log = logging.getLogger(__name__)
+
+# ids can commit out of order; re-read this many ids below the high-water mark
+REFRESH_OVERLAP = 1000
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.target_fp_rate = fp_rate
+        self.num_bits = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.num_bits
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % m
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def expected_fp_rate(self) -> float:
+        """
+        Theoretical false-positive rate at the current fill.
+        """
+        if self.count == 0:
+            return 0.0
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+
+class TokenFilter:
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.fp_rate = 0.001
+        self.refresh_seconds = 1.0
+        self.bloom = None
+        self.high_water = 0
+        self.built_at = 0.0
+        self.build_seconds = 0.0
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+        self.rejected = 0
+        self.passed = 0
+        self.false_positives = 0
+        self.refreshes = 0
+        self.background_rebuilds = 0
+        self.deleted_since_build = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = bool(app.config.get("TOKEN_FILTER"))
+        self.fp_rate = float(app.config.get("TOKEN_FILTER_FP_RATE", self.fp_rate))
+        self.refresh_seconds = float(app.config.get("TOKEN_FILTER_REFRESH_SECONDS", self.refresh_seconds))
+        # built by create_app from this app's database, never an earlier one's
+        self.bloom = None
+        self.high_water = 0
+        self.rejected = self.passed = self.false_positives = 0
+        self.refreshes = self.background_rebuilds = self.deleted_since_build = 0
+        app.extensions["token_filter"] = self
+
+    # ---------------- build ----------------
+    def rebuild(self):
+        """
+        Full rebuild from the DB (streams tokens; needs an app context).
+        Sized at 2x the current count so normal growth doesn't degrade it.
+        """
+        start = time.perf_counter()
+        total, max_id = db.session.execute(
+            select(func.count(Lighter.id), func.coalesce(func.max(Lighter.id), 0))
+        ).one()
+
+        bloom = BloomFilter(max(total * 2, 10000), self.fp_rate)
+        rows = db.session.execute(
+            select(Lighter.token).execution_options(yield_per=10000)
+        )
+        for (token,) in rows:
+            bloom.add(token)
+
+        with self._lock:
+            self.bloom = bloom
+            self.high_water = max_id
+            self.deleted_since_build = 0
+            self.built_at = time.time()
+            self._last_refresh = time.monotonic()
+        self.build_seconds = time.perf_counter() - start
+
+    def _rebuild_in_background(self):
+        """
+        One rebuild thread per process; the request that noticed doesn't wait.
+        """
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        self.background_rebuilds += 1
+
+        def run():
+            try:
+                with self.app.app_context():
+                    self.rebuild()
+            except Exception:
+                log.exception("token filter rebuild failed")
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=run, name="token-filter-rebuild", daemon=True).start()
+
+    def _refresh(self) -> bool:
+        """
+        Pull tokens added by other workers since the last look. Throttled.
+        """
+        now = time.monotonic()
+        if now - self._last_refresh < self.refresh_seconds:
+            return False
+        self._last_refresh = now
+        self.refreshes += 1
+
+        rows = db.session.execute(
+            select(Lighter.id, Lighter.token).where(Lighter.id > self.high_water - REFRESH_OVERLAP)
+        ).all()
+        for row_id, token in rows:
+            if token not in self.bloom:
+                self.add(token)
+            if row_id > self.high_water:
+                self.high_water = row_id
+        return True
+
+    # ---------------- lookups ----------------
+    def might_exist(self, token: str) -> bool:
+        if not self.enabled or self.bloom is None:
+            return True
+
+        # overfilled (big generate/import batches): its false-positive rate is
+        # past the target. Resize off the request path and answer "maybe"
+        # (a normal DB lookup) until the new one is in
+        if self._rebuilding or self.bloom.count > self.bloom.capacity:
+            self._rebuild_in_background()
+            return True
+
+        if token in self.bloom:
+            self.passed += 1
+            return True
+
+        # not in our copy: maybe another worker just created it
+        if self._refresh() and token in self.bloom:
+            self.passed += 1
+            return True
+
+        self.rejected += 1
+        return False
+
+    def add(self, token: str):
+        if self.bloom is not None:
+            self.bloom.add(token)
+
+    def add_many(self, tokens):
+        for t in tokens:
+            self.add(t)
+
+    def after_fork(self):
+        # the inherited bloom stays valid; the refresh picks up anything newer.
+        # A rebuild thread running in the parent doesn't exist here.
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def note_deleted(self):
+        if self.bloom is not None:
+            self.deleted_since_build += 1
+
+    def note_false_positive(self):
+        """
+        The filter said "maybe" but the DB had no such token.
+        """
+        if self.enabled and self.bloom is not None:
+            self.false_positives += 1
+
+    def stats(self) -> dict:
+        bloom = self.bloom
+        checked = self.passed + self.rejected
+        # of the lookups for tokens that don't exist, how many got past the filter
+        unknown = self.rejected + self.false_positives
+        return {
+            "enabled": self.enabled,
+            "tokens": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else 0,
+            "bits": bloom.num_bits if bloom else 0,
+            "hashes": bloom.num_hashes if bloom else 0,
+            "memory_bytes": bloom.memory_bytes if bloom else 0,
+            "expected_fp_rate": round(bloom.expected_fp_rate(), 6) if bloom else 0.0,
+            "observed_fp_rate": round(self.false_positives / unknown, 6) if unknown else 0.0,
+            "checked": checked,
+            "rejected": self.rejected,
+            "passed": self.passed,
+            "false_positives": self.false_positives,
+            "refreshes": self.refreshes,
+            "rebuilding": self._rebuilding,
+            "background_rebuilds": self.background_rebuilds,
+            "deleted_since_build": self.deleted_since_build,
+            "high_water_id": self.high_water,
+            "build_seconds": round(self.build_seconds, 3),
+        }
+
+
+token_filter = TokenFilter()
@@ -0,0 +1,254 @@
+"""
+Token allocation shared by admin_generate, admin_import and generate_tag.
+
+Candidates are generated in bulk, checked against the DB with one IN query
+per chunk, and inserted with INSERT ... ON CONFLICT DO NOTHING, so a batch
+costs a handful of round trips instead of one (or two) per token. Imports
+stream through the same path chunk by chunk (import_file / import_stream).
+"""
+import csv
+import secrets
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+
+from sqlalchemy import insert as sa_insert
+
+from . import db
+from .models import Lighter
+from .tokenfilter import token_filter
+
+TOKEN_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+TOKEN_LENGTH = 8
+
+# Keeps IN lists / multi-row VALUES well under SQLite's bound-parameter limit.
+CHUNK_SIZE = 500
+
+# 32 symbols divide 256 evenly, so masking a random byte is unbiased.
+_BYTE_TO_SYMBOL = bytes(ord(TOKEN_ALPHABET[b % len(TOKEN_ALPHABET)]) for b in range(256))
+
+
+@dataclass
+class AllocationResult:
+    tokens: list = field(default_factory=list)
+    requested: int = 0
+    duplicates: int = 0
+    rounds: int = 0
+    queries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def created(self) -> int:
+        return len(self.tokens)
+
+    @property
+    def per_second(self) -> float:
+        return self.created / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.created}/{self.requested} tokens in {self.elapsed:.2f}s "
+            f"({self.per_second:,.0f}/s, {self.queries} queries, {self.rounds} rounds)"
+        )
+
+
+def random_tokens(n: int, length: int = TOKEN_LENGTH) -> list[str]:
+    raw = secrets.token_bytes(n * length).translate(_BYTE_TO_SYMBOL).decode("ascii")
+    return [raw[i:i + length] for i in range(0, n * length, length)]
+
+
+def is_valid_token(token: str) -> bool:
+    return 4 <= len(token) <= 32
+
+
+def _chunks(items: list, size: int = CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _batched(iterable, size: int = CHUNK_SIZE):
+    """
+    Like _chunks, for iterators of unknown length.
+    """
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def existing_tokens(candidates: list[str]) -> set[str]:
+    """
+    One set-based query per chunk.
+    """
+    found = set()
+    for chunk in _chunks(candidates):
+        rows = db.session.query(Lighter.token).filter(Lighter.token.in_(chunk)).all()
+        found.update(r[0] for r in rows)
+    return found
+
+
+def _insert_stmt():
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return sa_insert(Lighter.__table__), False
+    return insert(Lighter.__table__).on_conflict_do_nothing(index_elements=["token"]), True
+
+
+def insert_tokens(tokens: list[str], **values) -> list[str]:
+    """
+    Bulk insert; rows whose token already exists are skipped by the DB
+    (ON CONFLICT DO NOTHING). Returns the tokens that were actually inserted.
+    Caller commits.
+    """
+    if not tokens:
+        return []
+
+    stmt, on_conflict = _insert_stmt()
+    inserted = []
+    for chunk in _chunks(tokens):
+        rows = [{"token": t, **values} for t in chunk]
+        if on_conflict:
+            result = db.session.execute(stmt.returning(Lighter.__table__.c.token), rows)
+            inserted.extend(r[0] for r in result)
+        else:
+            db.session.execute(stmt, rows)
+            inserted.extend(chunk)
+
+    token_filter.add_many(inserted)
+    return inserted
+
+
+def allocate_tokens(n: int, max_rounds: int = 10, **values) -> AllocationResult:
+    """
+    Create n new random tokens. Collisions are astronomically rare at 32^8,
+    but each round re-checks and tops up whatever is still missing.
+    """
+    result = AllocationResult(requested=n)
+    start = time.perf_counter()
+
+    while len(result.tokens) < n and result.rounds < max_rounds:
+        result.rounds += 1
+        need = n - len(result.tokens)
+
+        candidates = list(dict.fromkeys(random_tokens(need)))
+        taken = existing_tokens(candidates)
+        result.queries += -(-len(candidates) // CHUNK_SIZE)
+
+        fresh = [t for t in candidates if t not in taken]
+        result.tokens.extend(insert_tokens(fresh, **values))
+        result.queries += -(-len(fresh) // CHUNK_SIZE)
+
+    db.session.commit()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+@dataclass
+class ImportResult:
+    lines: int = 0
+    imported: int = 0
+    skipped: int = 0
+    duplicates: int = 0
+    chunks: int = 0
+    queries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def per_second(self) -> float:
+        return self.lines / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.imported} imported, {self.duplicates} duplicates, {self.skipped} skipped "
+            f"from {self.lines} lines in {self.elapsed:.2f}s "
+            f"({self.per_second:,.0f} lines/s, {self.queries} queries)"
+        )
+
+
+# ---------------- Streaming import pipeline ----------------
+# Each stage is a generator, so a file of any size is held one chunk at a time.
+def decode_lines(raw_lines):
+    """
+    Bytes lines (an uploaded file) -> text lines; drops a UTF-8 BOM.
+    """
+    for i, raw in enumerate(raw_lines):
+        line = raw.decode("utf-8", errors="replace") if isinstance(raw, bytes) else raw
+        yield line.lstrip("\ufeff") if i == 0 else line
+
+
+def split_cells(lines, result: ImportResult, csv_mode: bool = False):
+    """
+    Text: every comma/whitespace-separated value is a token.
+    CSV: the "token" column if there's a header naming one, else the first column.
+    """
+    if not csv_mode:
+        for line in lines:
+            result.lines += 1
+            yield from line.replace(",", " ").split()
+        return
+
+    column = None
+    for row in csv.reader(lines):
+        result.lines += 1
+        if not row:
+            continue
+        if result.lines == 1:
+            header = [c.strip().lower() for c in row]
+            if "token" in header:
+                column = header.index("token")
+                continue
+        cell = row[column or 0] if len(row) > (column or 0) else ""
+        if cell.strip():
+            yield cell
+
+
+def normalise(cells, result: ImportResult):
+    for cell in cells:
+        token = cell.strip().upper()
+        if is_valid_token(token):
+            yield token
+        else:
+            result.skipped += 1
+
+
+def import_stream(tokens, result: ImportResult | None = None, progress=None,
+                  progress_every: int = 20, **values) -> ImportResult:
+    """
+    Insert tokens from any iterable in CHUNK_SIZE chunks: one existence
+    query + one INSERT ... ON CONFLICT DO NOTHING + one commit per chunk.
+    Repeats within the input are caught by the next chunk's existence query,
+    so no set of everything seen is kept. `progress(result)` is called every
+    `progress_every` chunks.
+    """
+    result = result or ImportResult()
+    start = time.perf_counter()
+
+    for chunk in _batched(tokens, CHUNK_SIZE):
+        unique = list(dict.fromkeys(chunk))
+        taken = existing_tokens(unique)
+        fresh = [t for t in unique if t not in taken]
+        inserted = insert_tokens(fresh, **values)
+        db.session.commit()
+
+        result.chunks += 1
+        result.queries += 2 if fresh else 1
+        result.imported += len(inserted)
+        result.duplicates += len(chunk) - len(inserted)
+        if progress and result.chunks % progress_every == 0:
+            result.elapsed = time.perf_counter() - start
+            progress(result)
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def import_file(raw_lines, csv_mode: bool = False, progress=None, **values) -> ImportResult:
+    """
+    Uploaded file / open file (bytes or text lines) -> ImportResult.
+    """
+    result = ImportResult()
+    cells = split_cells(decode_lines(raw_lines), result, csv_mode=csv_mode)
+    return import_stream(normalise(cells, result), result=result, progress=progress, **values)
@@ -0,0 +1,63 @@
+"""
+Lighter.unread_count: a denormalized count of unread FoundMessages.
+
+found_lighter increments it and reading messages decrements it, so pages
+never need COUNT(*) over found_messages. The column itself is added by
+migration 003; the helpers here backfill it in id-range batches and check
+it against the real counts.
+"""
+from sqlalchemy import func, select, text
+
+from . import db
+from .models import FoundMessage, Lighter
+
+BACKFILL_SQL = text("""
+    UPDATE lighters
+    SET unread_count = (
+        SELECT COUNT(*) FROM found_messages f
+        WHERE f.lighter_id = lighters.id AND f.is_read = :false
+    )
+    WHERE id >= :lo AND id < :hi
+""")
+
+
+def backfill(batch_size: int = 5000, conn=None) -> int:
+    """
+    Recompute unread_count for every tag, one id range per transaction so
+    no single statement holds row locks on the whole table. Returns rows
+    updated. With `conn` (a migration) everything runs in the caller's
+    transaction instead.
+    """
+    runner = conn if conn is not None else db.session
+    max_id = runner.execute(select(func.coalesce(func.max(Lighter.id), 0))).scalar()
+
+    updated = 0
+    for lo in range(1, max_id + 1, batch_size):
+        result = runner.execute(BACKFILL_SQL, {"false": False, "lo": lo, "hi": lo + batch_size})
+        if conn is None:
+            db.session.commit()
+        updated += result.rowcount or 0
+    return updated
+
+
+def find_mismatches(limit: int | None = None) -> list[tuple[str, int, int]]:
+    """
+    (token, stored unread_count, actual unread messages) for every tag where
+    they disagree.
+    """
+    actual = (
+        select(FoundMessage.lighter_id, func.count().label("n"))
+        .where(FoundMessage.is_read.is_(False))
+        .group_by(FoundMessage.lighter_id)
+        .subquery()
+    )
+    real = func.coalesce(actual.c.n, 0)
+    q = (
+        select(Lighter.token, Lighter.unread_count, real)
+        .outerjoin(actual, actual.c.lighter_id == Lighter.id)
+        .where(Lighter.unread_count != real)
+        .order_by(Lighter.id)
+    )
+    if limit:
+        q = q.limit(limit)
+    return [tuple(r) for r in db.session.execute(q)]
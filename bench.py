@@ -0,0 +1,394 @@
+"""
+Load benchmark for the hot paths: finder page, scan beacon, QR image, owner
+unlock and the admin pages.
+
+Seeds a database (a throwaway SQLite file by default, or --database-url
+for a local Postgres) with N tags, M items and K found messages per tag,
+drives a weighted traffic mix from several threads through the WSGI app
+(Flask test clients, no network), and prints per-route throughput and
+p50/p95/p99 latency as JSON.
+
+    python bench.py --tags 5000 --duration 20 --output before.json
+    python bench.py --tags 5000 --duration 20 --baseline before.json
+
+With --baseline the run is compared route by route and the exit status is
+1 if p95/p99 got slower or throughput dropped by more than the thresholds.
+Settings such as SCAN_BUFFER or TAG_CACHE are read from the environment as
+usual, so the same command compares configurations too.
+"""
+import argparse
+import atexit
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from itertools import accumulate
+
+PIN = "2468"
+
+# route -> weight; "name=weight,..." on the command line works too
+MIXES = {
+    "default": {"finder_page": 55, "scan_beacon": 15, "qr_code": 20, "unlock_private": 5,
+                "admin": 3, "admin_generate": 2},
+    "scan": {"finder_page": 70, "scan_beacon": 20, "qr_code": 10},
+    "owner": {"unlock_private": 100},
+    "admin": {"admin": 60, "admin_generate": 40},
+}
+
+
+# ---------------- setup ----------------
+def make_app(database_url: str):
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("ADMIN_KEY", "bench")
+    # no background SMTP delivery competing for the CPU
+    os.environ.setdefault("MAIL_WORKER", "off")
+    # a route going over its query budget shows up as errors in the report
+    os.environ.setdefault("QUERY_BUDGET", "strict")
+
+    from app import create_app
+    return create_app()
+
+
+def seed(app, tags: int, items: int, messages: int, rng: random.Random, echo) -> list[str]:
+    """
+    Claimed tags with `items` items and `messages` found messages each (half
+    of them read). Returns the tokens.
+    """
+    from datetime import datetime, timedelta
+
+    from app import db
+    from app.models import FoundMessage, Lighter, LighterItem
+    from app.pins import hash_pin
+    from app.tokens import TOKEN_ALPHABET, TOKEN_LENGTH
+
+    with app.app_context():
+        if db.session.query(Lighter.id).limit(1).first() is not None:
+            raise SystemExit("Refusing to seed a database that already has tags (use --reuse).")
+
+        # one hash for every tag: hashing N PINs would dominate the setup
+        pin_hash = hash_pin(PIN)
+        now = datetime.utcnow()
+
+        tokens = set()
+        while len(tokens) < tags:
+            tokens.add("".join(rng.choice(TOKEN_ALPHABET) for _ in range(TOKEN_LENGTH)))
+        tokens = sorted(tokens)
+
+        unread = messages - messages // 2
+        for start in range(0, tags, 5000):
+            chunk = tokens[start:start + 5000]
+            db.session.execute(Lighter.__table__.insert(), [
+                {
+                    "token": t, "claimed_at": now, "owner_pin_hash": pin_hash,
+                    "public_message": "Please return this, thanks!", "private_message": "Spare key in the blue box.",
+                    "show_owner_phone": False, "scan_count": 0, "unread_count": unread,
+                    "updated_at": now, "created_at": now, "origin": "admin",
+                }
+                for t in chunk
+            ])
+            db.session.commit()
+        echo(f"seeded {tags} tags")
+
+        ids = [i for (i,) in db.session.query(Lighter.id).order_by(Lighter.id)]
+        labels = ["Keys", "Wallet", "Bag", "Lighter", "Other"]
+        item_rows, message_rows = [], []
+
+        def flush_rows():
+            if item_rows:
+                db.session.execute(LighterItem.__table__.insert(), item_rows)
+            if message_rows:
+                db.session.execute(FoundMessage.__table__.insert(), message_rows)
+            db.session.commit()
+            item_rows.clear()
+            message_rows.clear()
+
+        for lighter_id in ids:
+            for n in range(items):
+                item_rows.append({"lighter_id": lighter_id, "label": labels[n % len(labels)], "created_at": now})
+            for n in range(messages):
+                message_rows.append({
+                    "lighter_id": lighter_id, "item_label": labels[n % len(labels)],
+                    "note": "Found it at the bus stop.", "finder_name": "Sam",
+                    "is_read": n < messages // 2, "created_at": now - timedelta(minutes=n),
+                })
+            if len(item_rows) + len(message_rows) >= 5000:
+                flush_rows()
+        flush_rows()
+        echo(f"seeded {items} items and {messages} messages per tag")
+        return tokens
+
+
+def load_tokens(app) -> list[str]:
+    from app import db
+    from app.models import Lighter
+
+    with app.app_context():
+        return [t for (t,) in db.session.query(Lighter.token).filter(Lighter.claimed_at.isnot(None))]
+
+
+# ---------------- traffic ----------------
+def parse_mix(spec: str) -> dict[str, float]:
+    if spec in MIXES:
+        return MIXES[spec]
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES:
+            raise SystemExit(f"Unknown route in --mix: {name!r} (known: {', '.join(ROUTES)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _finder_page(client, token):
+    return client.get(f"/l/{token}/finder")
+
+
+def _scan_beacon(client, token):
+    return client.post(f"/l/{token}/scan")
+
+
+def _qr_code(client, token):
+    return client.get(f"/qr/{token}")
+
+
+def _unlock_private(client, token):
+    return client.post(f"/l/{token}/unlock", data={"pin": PIN})
+
+
+def _admin(client, token):
+    return client.get("/admin")
+
+
+def _admin_generate(client, token):
+    return client.post("/admin/generate", data={"how_many": "10"})
+
+
+ROUTES = {
+    "finder_page": _finder_page,
+    "scan_beacon": _scan_beacon,
+    "qr_code": _qr_code,
+    "unlock_private": _unlock_private,
+    "admin": _admin,
+    "admin_generate": _admin_generate,
+}
+
+
+def run_load(app, tokens: list[str], mix: dict, threads: int, duration: float, warmup: float,
+             seed_value: int) -> tuple[dict, float]:
+    """
+    Returns ({route: [latency seconds, ...], route + ":errors": n ...}, measured seconds).
+    """
+    names = list(mix)
+    cum_mix = list(accumulate(mix[n] for n in names))
+    # popularity follows Zipf: a few tags get most of the scans
+    cum_tags = list(accumulate(1 / (rank + 1) for rank in range(len(tokens))))
+
+    results = [dict() for _ in range(threads)]
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def worker(n: int):
+        rng = random.Random(seed_value * 1000 + n)
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s["is_admin"] = True
+        out = results[n]
+
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                return
+            route = rng.choices(names, cum_weights=cum_mix)[0]
+            token = rng.choices(tokens, cum_weights=cum_tags)[0]
+            # a different client address per request, like real finders
+            client.environ_base["REMOTE_ADDR"] = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+            t0 = time.perf_counter()
+            resp = ROUTES[route](client, token)
+            elapsed = time.perf_counter() - t0
+            resp.close()
+
+            if t0 < start_at:
+                continue
+            out.setdefault(route, []).append(elapsed)
+            if resp.status_code >= 500:
+                out[f"{route}:errors"] = out.get(f"{route}:errors", 0) + 1
+
+    pool = [threading.Thread(target=worker, args=(n,), name=f"bench-{n}") for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    merged = {}
+    for out in results:
+        for key, value in out.items():
+            if key.endswith(":errors"):
+                merged[key] = merged.get(key, 0) + value
+            else:
+                merged.setdefault(key, []).extend(value)
+    return merged, duration
+
+
+# ---------------- report ----------------
+def percentile(sorted_values: list[float], p: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(p / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list[float], errors: int, seconds: float) -> dict:
+    values = sorted(latencies)
+
+    def ms(v):
+        return round(v * 1000, 3)
+
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / seconds, 2) if seconds else 0.0,
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else 0.0,
+    }
+
+
+def report(samples: dict, seconds: float) -> dict:
+    routes = {
+        name: summarize(values, samples.get(f"{name}:errors", 0), seconds)
+        for name, values in sorted(samples.items()) if not name.endswith(":errors")
+    }
+    everything = [v for name, values in samples.items() if not name.endswith(":errors") for v in values]
+    errors = sum(v for name, v in samples.items() if name.endswith(":errors"))
+    return {"routes": routes, "total": summarize(everything, errors, seconds)}
+
+
+def compare(current: dict, baseline: dict, max_latency_pct: float, max_throughput_pct: float,
+            noise_ms: float) -> tuple[dict, list[str]]:
+    """
+    Per route: p95/p99 may grow by max_latency_pct (and at least noise_ms),
+    throughput may drop by max_throughput_pct. Returns (details, regressions).
+    """
+    details, regressions = {}, []
+    for route, now in current["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            continue
+        row = {}
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            old, new = before[key], now[key]
+            change = round((new - old) / old * 100, 1) if old else 0.0
+            if key == "throughput_rps":
+                bad = change < -max_throughput_pct
+            elif key == "p50_ms":
+                bad = False
+            else:
+                bad = change > max_latency_pct and new - old > noise_ms
+            row[key] = {"baseline": old, "current": new, "change_pct": change, "regression": bad}
+            if bad:
+                regressions.append(f"{route} {key}: {old} -> {new} ({change:+.1f}%)")
+        details[route] = row
+    return details, regressions
+
+
+def git_revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+# ---------------- main ----------------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url", help="Default: a temporary SQLite file.")
+    parser.add_argument("--reuse", action="store_true", help="Use the tags already in --database-url, don't seed.")
+    parser.add_argument("--tags", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=5, help="Items per tag.")
+    parser.add_argument("--messages", type=int, default=4, help="Found messages per tag.")
+    parser.add_argument("--mix", default="default", help=f"{', '.join(MIXES)} or route=weight,...")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds.")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of traffic before measuring.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON here instead of stdout.")
+    parser.add_argument("--baseline", help="Earlier --output to compare against.")
+    parser.add_argument("--max-latency-regression", type=float, default=15.0, help="Percent (p95/p99).")
+    parser.add_argument("--max-throughput-drop", type=float, default=15.0, help="Percent.")
+    parser.add_argument("--noise-ms", type=float, default=1.0, help="Ignore latency changes smaller than this.")
+    args = parser.parse_args(argv)
+
+    def echo(msg):
+        print(msg, file=sys.stderr)
+
+    mix = parse_mix(args.mix)
+    database_url = args.database_url
+    if not database_url:
+        tmpdir = tempfile.mkdtemp(prefix="flametag-bench-")
+        database_url = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        # registered first so it runs last, after the app's own exit flushes
+        atexit.register(shutil.rmtree, tmpdir, ignore_errors=True)
+
+    app = make_app(database_url)
+    rng = random.Random(args.seed)
+    tokens = load_tokens(app) if args.reuse else seed(app, args.tags, args.items, args.messages, rng, echo)
+    if not tokens:
+        raise SystemExit("No claimed tags to drive traffic at.")
+
+    echo(f"running {args.mix!r} with {args.threads} threads for {args.duration:g}s (+{args.warmup:g}s warmup)")
+    samples, seconds = run_load(app, tokens, mix, args.threads, args.duration, args.warmup, args.seed)
+
+    result = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "database": database_url.split(":", 1)[0],
+            "tags": len(tokens), "items": args.items, "messages": args.messages,
+            "mix": mix, "threads": args.threads, "duration": seconds, "seed": args.seed,
+            "settings": {k: os.environ[k] for k in ("SCAN_BUFFER", "TAG_CACHE", "TOKEN_FILTER", "QR_CACHE_DIR",
+                                                     "PIN_HASH_METHOD", "PIN_THROTTLE", "METRICS") if k in os.environ},
+        },
+        **report(samples, seconds),
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("database", "tags", "items", "messages", "mix", "threads"):
+            if baseline.get("meta", {}).get(key) != result["meta"][key]:
+                echo(f"warning: baseline has a different {key}; the comparison may not mean much")
+        result["comparison"], regressions = compare(
+            result, baseline, args.max_latency_regression, args.max_throughput_drop, args.noise_ms,
+        )
+        result["regressions"] = regressions
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for line in regressions:
+        echo(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
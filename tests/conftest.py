@@ -0,0 +1,99 @@
+"""
+Shared fixtures: a fresh app + SQLite database per test, built the way
+production boots (create_app, migrations on startup), with strict query
+budgets so a route going over its @query_budget fails the test.
+"""
+from datetime import datetime
+
+import pytest
+
+from app import create_app, db
+from app.models import FoundMessage, Lighter
+from app import items
+
+PIN = "2468"
+ADMIN_KEY = "test-admin"
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    """
+    Environment for create_app(); tests may setenv more before using `app`.
+    """
+    values = {
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'test.db'}",
+        "SECRET_KEY": "test-secret",
+        "ADMIN_KEY": ADMIN_KEY,
+        "JINJA_CACHE_DIR": "",
+        "MAIL_WORKER": "off",
+        "QUERY_BUDGET": "strict",
+        # cheap hashes: the cost is not what these tests are about
+        "PIN_HASH_METHOD": "pbkdf2:sha256:1000",
+        "PIN_THROTTLE": "off",
+        "ASSETS_DIR": str(tmp_path / "assets"),
+    }
+    for key, value in values.items():
+        monkeypatch.setenv(key, value)
+    return tmp_path
+
+
+@pytest.fixture
+def app(env):
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_tag(app, token: str = "TESTTAG1", claimed: bool = True, messages: int = 0,
+             unread: int = 0, owner_email: str | None = None) -> Lighter:
+    """
+    A tag as claim_lighter leaves it (default items included), with
+    `messages` found messages of which the newest `unread` are unread.
+    """
+    from app.pins import hash_pin
+
+    with app.app_context():
+        now = datetime.utcnow()
+        lighter = Lighter(token=token, origin="admin", updated_at=now, created_at=now)
+        if claimed:
+            lighter.claimed_at = now
+            lighter.owner_pin_hash = hash_pin(PIN)
+            lighter.public_message = "Please return it."
+            lighter.private_message = "Thanks!"
+            lighter.owner_email = owner_email
+        db.session.add(lighter)
+        db.session.flush()
+        if claimed:
+            items.add_defaults(lighter)
+        for n in range(messages):
+            db.session.add(FoundMessage(
+                lighter_id=lighter.id, note=f"note {n}", item_label="Keys",
+                is_read=n < messages - unread, created_at=now,
+            ))
+        lighter.unread_count = unread
+        db.session.commit()
+        # usable (id, token, ...) outside the app context
+        db.session.refresh(lighter)
+        db.session.expunge(lighter)
+        return lighter
+
+
+def unlock(client, token: str, kind: str = "owner"):
+    path = f"/l/{token}/owner" if kind == "owner" else f"/l/{token}/edit/unlock"
+    resp = client.post(path, data={"pin": PIN})
+    assert resp.status_code == 302
+    return resp
+
+
+def admin_login(client):
+    resp = client.post("/admin/login", data={"admin_key": ADMIN_KEY})
+    assert resp.status_code == 302
+    return resp
@@ -0,0 +1,109 @@
+"""
+Scan analytics: hourly buckets, `flask scans-rollup` folding old hours into
+scan_daily, and the owner chart reading both.
+"""
+import calendar
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from app import db
+from app.analytics import CHART_DAYS, add_hourly, bucket_start, daily_series, hour_bucket, rollup
+from app.models import ScanDaily, ScanHourly
+
+from conftest import make_tag, unlock
+
+
+def _hour(dt: datetime) -> int:
+    return hour_bucket(calendar.timegm(dt.timetuple()))
+
+
+def _seed(app, lighter_ids, days_back: range) -> dict:
+    """
+    A few scans in a few hours of each day; returns {(lighter_id, day): scans}.
+    """
+    today = datetime.combine(datetime.utcnow().date(), time.min)
+    buckets, expected = {}, defaultdict(int)
+    for lighter_id in lighter_ids:
+        for back in days_back:
+            for hour, n in ((0, 1), (9, lighter_id + 2), (23, 3)):
+                start = today - timedelta(days=back) + timedelta(hours=hour)
+                buckets[(lighter_id, _hour(start))] = n
+                expected[(lighter_id, start.date())] += n
+    with app.app_context():
+        add_hourly(buckets)
+        db.session.commit()
+    return dict(expected)
+
+
+def test_hour_buckets():
+    ts = calendar.timegm(datetime(2026, 3, 29, 1, 59, 59).timetuple())
+    assert bucket_start(hour_bucket(ts)) == datetime(2026, 3, 29, 1, 0)
+    assert bucket_start(hour_bucket(ts)).tzinfo is None
+
+
+def test_add_hourly_adds_up(app):
+    tag = make_tag(app, "SCANS001")
+    hour = _hour(datetime(2026, 1, 5, 10, 30))
+    with app.app_context():
+        add_hourly({(tag.id, hour): 2})
+        add_hourly({(tag.id, hour): 5})
+        db.session.commit()
+        (row,) = ScanHourly.query.all()
+        assert (row.hour, row.scans) == (datetime(2026, 1, 5, 10), 7)
+
+
+def test_rollup_moves_old_hours_into_daily_totals(app):
+    tags = [make_tag(app, f"SCANS00{n}").id for n in range(2)]
+    old = _seed(app, tags, range(8, 12))
+    recent = _seed(app, tags, range(0, 7))
+
+    with app.app_context():
+        # a day rolled up earlier: new hourly rows for it are added on top
+        db.session.add(ScanDaily(lighter_id=tags[0], day=min(d for _, d in old), scans=100))
+        db.session.commit()
+
+        days, removed = rollup(keep_days=7)
+        assert (days, removed) == (4, len(old) * 3)
+
+        daily = {(r.lighter_id, r.day): r.scans for r in ScanDaily.query.all()}
+        expected = dict(old)
+        expected[(tags[0], min(d for _, d in old))] += 100
+        assert daily == expected
+
+        left = defaultdict(int)
+        for r in ScanHourly.query.all():
+            left[(r.lighter_id, r.hour.date())] += r.scans
+        assert dict(left) == recent
+
+        # nothing left to fold
+        assert rollup(keep_days=7) == (0, 0)
+
+
+def test_rollup_command(app):
+    tag = make_tag(app, "SCANS010")
+    old = _seed(app, [tag.id], range(9, 10))
+
+    result = app.test_cli_runner().invoke(args=["scans-rollup", "--keep-days", "7"])
+    assert result.exit_code == 0, result.output
+    assert "Rolled up 1 days (3 hourly rows)" in result.output
+    with app.app_context():
+        assert {(r.lighter_id, r.day): r.scans for r in ScanDaily.query.all()} == old
+
+
+def test_owner_chart_reads_daily_and_hourly(app):
+    tag = make_tag(app, "SCANS020")
+    counts = _seed(app, [tag.id], range(0, 20))
+    with app.app_context():
+        rollup(keep_days=3)
+        series = daily_series(tag.id)
+
+    assert len(series) == CHART_DAYS
+    assert [day for day, _ in series] == sorted(day for day, _ in series)
+    assert series[-1][0] == datetime.utcnow().date()
+    assert series == [(day, counts[(tag.id, day)]) for day, _ in series]
+
+    client = app.test_client()
+    unlock(client, "SCANS020")
+    page = client.get("/l/SCANS020/owner/dashboard").get_data(as_text=True)
+    day, n = series[0]
+    assert f'title="{day.isoformat()}: {n}"' in page
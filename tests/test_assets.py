@@ -0,0 +1,160 @@
+"""
+Built assets: content-hashed names, gzip/brotli siblings only when they
+are smaller, resized images, and /assets serving the best encoding the
+browser accepts with immutable caching.
+"""
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from app.assets import IMAGE_MAX_PX, IMMUTABLE, MANIFEST, assets, build, minify_css
+
+HAS_BROTLI = importlib.util.find_spec("brotli") is not None
+
+CSS = "/* theme */\nbody {\n    color: #222;\n}\n\n" + "".join(
+    f".rule-{n} {{\n    margin: {n}px;\n}}\n" for n in range(50)
+)
+
+
+def _png(size: tuple[int, int]) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, (200, 80, 20)).save(out, format="PNG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def static(tmp_path):
+    root = tmp_path / "static"
+    (root / "css").mkdir(parents=True)
+    (root / "img").mkdir()
+    (root / "css" / "style.css").write_text(CSS)
+    (root / "css" / "tiny.css").write_text("a{b:c}")
+    (root / "img" / "qr.png").write_bytes(_png((600, 400)))
+    (root / "img" / "notes.txt").write_text("not an asset")
+    return root
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def test_build_hashes_and_precompresses(static, tmp_path):
+    out = tmp_path / "built"
+    manifest = build(str(static), str(out))
+
+    assert sorted(manifest) == ["css/style.css", "css/tiny.css", "img/qr.png"]
+    assert json.loads((out / MANIFEST).read_text()) == manifest
+
+    css = manifest["css/style.css"]
+    minified = minify_css(CSS).encode()
+    assert "theme" not in minified.decode() and "    " not in minified.decode()
+    assert css["file"] == f"css/style.{_digest(minified)}.css"
+    assert (out / css["file"]).read_bytes() == minified
+    assert gzip.decompress((out / (css["file"] + ".gz")).read_bytes()) == minified
+    if HAS_BROTLI:
+        import brotli
+
+        assert css["encodings"] == ["br", "gzip"]
+        assert brotli.decompress((out / (css["file"] + ".br")).read_bytes()) == minified
+    else:
+        assert css["encodings"] == ["gzip"]
+        assert not (out / (css["file"] + ".br")).exists()
+
+    # compressing six bytes only makes them bigger: no siblings
+    tiny = manifest["css/tiny.css"]
+    assert tiny["encodings"] == []
+    assert not (out / (tiny["file"] + ".gz")).exists()
+
+
+def test_build_resizes_images(static, tmp_path):
+    out = tmp_path / "built"
+    entry = build(str(static), str(out))["img/qr.png"]
+
+    limit = IMAGE_MAX_PX["img/qr.png"]
+    assert (entry["width"], entry["height"]) == (limit, limit * 2 // 3)
+    png = (out / entry["file"]).read_bytes()
+    assert entry["file"] == f"img/qr.{_digest(png)}.png"
+    assert Image.open(io.BytesIO(png)).size == (entry["width"], entry["height"])
+    if "webp" in entry:
+        assert (out / entry["webp"]).stat().st_size < len(png)
+
+
+def test_rebuild_is_stable_and_changes_follow_content(static, tmp_path):
+    first = build(str(static), str(tmp_path / "a"))
+    assert build(str(static), str(tmp_path / "b")) == first
+
+    (static / "css" / "style.css").write_text(CSS + ".new { color: red; }\n")
+    second = build(str(static), str(tmp_path / "a"))
+    assert second["css/style.css"]["file"] != first["css/style.css"]["file"]
+    assert second["img/qr.png"] == first["img/qr.png"]
+    # the previous build's file is still there for pages rendered before
+    assert (tmp_path / "a" / first["css/style.css"]["file"]).exists()
+
+
+@pytest.fixture
+def built(app, static):
+    manifest = build(str(static), assets.out_dir)
+    assets.load()
+    yield manifest
+    os.remove(os.path.join(assets.out_dir, MANIFEST))
+    assets.load()
+
+
+def test_send_picks_the_accepted_encoding(app, client, built):
+    name = built["css/style.css"]["file"]
+    url = f"/assets/{name}"
+    minified = minify_css(CSS).encode()
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert plain.data == minified
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Cache-Control"] == IMMUTABLE
+    assert "Accept-Encoding" in plain.headers["Vary"]
+    assert plain.mimetype == "text/css"
+
+    zipped = client.get(url, headers={"Accept-Encoding": "gzip, deflate"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.data) == minified
+
+    # br is preferred over gzip whenever both exist and are accepted
+    br_path = os.path.join(assets.out_dir, name + ".br")
+    if not os.path.exists(br_path):
+        with open(br_path, "wb") as f:
+            f.write(b"brotli bytes")
+    both = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+    assert both.headers["Content-Encoding"] == "br"
+    with open(br_path, "rb") as f:
+        assert both.data == f.read()
+
+    image = client.get(f"/assets/{built['img/qr.png']['file']}", headers={"Accept-Encoding": "gzip"})
+    assert image.mimetype == "image/png" and "Content-Encoding" not in image.headers
+    assert "Vary" not in image.headers
+
+
+def test_send_only_serves_hashed_files(app, client, built):
+    for path in (MANIFEST, "css/style.css", "../test.db", f"{built['css/style.css']['file']}.gz"):
+        assert client.get(f"/assets/{path}").status_code == 404, path
+
+
+def test_pages_link_the_built_files(app, client, built):
+    html = client.get("/").get_data(as_text=True)
+    assert f"/assets/{built['css/style.css']['file']}" in html
+    assert "/static/css/style.css" not in html
+
+
+def test_assets_build_command(app):
+    result = app.test_cli_runner().invoke(args=["assets-build"])
+    try:
+        assert result.exit_code == 0, result.output
+        with open(os.path.join(app.config["ASSETS_DIR"], MANIFEST)) as f:
+            manifest = json.load(f)
+        assert "css/style.css" in manifest and "img/logo.png" in manifest
+        assert result.output.splitlines()[-1] == f"Built {len(manifest)} assets into {app.config['ASSETS_DIR']}"
+    finally:
+        assets.load()
@@ -0,0 +1,87 @@
+"""
+bench.py: the report maths, the baseline comparison, and a short end-to-end
+run that every route in the default mix answers without a server error.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bench
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(n) for n in range(1, 101)]
+    assert bench.percentile(values, 50) == 50
+    assert bench.percentile(values, 95) == 95
+    assert bench.percentile(values, 99.5) == 100
+    assert bench.percentile([7.0], 99) == 7
+    assert bench.percentile([], 50) == 0.0
+
+
+def test_summarize():
+    summary = bench.summarize([0.001, 0.003, 0.002, 0.010], errors=1, seconds=2)
+    assert summary == {
+        "requests": 4, "errors": 1, "throughput_rps": 2.0, "mean_ms": 4.0,
+        "p50_ms": 2.0, "p95_ms": 10.0, "p99_ms": 10.0, "max_ms": 10.0,
+    }
+    assert bench.summarize([], 0, 1)["requests"] == 0
+
+
+def test_compare_flags_only_real_regressions():
+    def run(p95, p99, rps, p50=1.0):
+        return {"routes": {"finder_page": {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "throughput_rps": rps}}}
+
+    baseline = run(p95=10.0, p99=20.0, rps=100.0)
+    _, regressions = bench.compare(run(11.0, 21.0, 90.0, p50=5.0), baseline, 15, 15, 1.0)
+    assert regressions == []
+
+    details, regressions = bench.compare(run(13.0, 20.0, 80.0), baseline, 15, 15, 1.0)
+    assert regressions == ["finder_page p95_ms: 10.0 -> 13.0 (+30.0%)", "finder_page throughput_rps: 100.0 -> 80.0 (-20.0%)"]
+    assert details["finder_page"]["p99_ms"]["regression"] is False
+
+    # large relative change but under the noise floor
+    _, regressions = bench.compare(run(0.2, 0.4, 100.0), run(0.1, 0.2, 100.0), 15, 15, 1.0)
+    assert regressions == []
+    # routes missing from the baseline are skipped
+    assert bench.compare(baseline, {"routes": {}}, 15, 15, 1.0) == ({}, [])
+
+
+def test_parse_mix():
+    assert bench.parse_mix("scan") is bench.MIXES["scan"]
+    assert bench.parse_mix("finder_page=3,qr_code") == {"finder_page": 3.0, "qr_code": 1.0}
+    with pytest.raises(SystemExit, match="Unknown route"):
+        bench.parse_mix("finder_page=1,nope=2")
+
+
+def _bench(*args, cwd):
+    env = {**os.environ, "PIN_HASH_METHOD": "pbkdf2:sha256:1000", "JINJA_CACHE_DIR": ""}
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, "bench.py"), "--tags", "20", "--items", "2", "--messages", "2",
+         "--threads", "2", "--duration", "0.5", "--warmup", "0.1", *args],
+        cwd=cwd, env=env, capture_output=True, text=True, timeout=120,
+    )
+
+
+def test_end_to_end_and_baseline(tmp_path):
+    first = tmp_path / "before.json"
+    proc = _bench("--output", str(first), cwd=tmp_path)
+    assert proc.returncode == 0, proc.stderr
+    result = json.loads(first.read_text())
+    assert result["meta"]["tags"] == 20 and result["meta"]["database"] == "sqlite"
+    assert result["total"]["requests"] > 0 and result["total"]["errors"] == 0
+    assert set(result["routes"]) <= set(bench.ROUTES)
+
+    # a baseline ten times faster than anything possible: every route regresses
+    for route in result["routes"].values():
+        route["p95_ms"] = route["p99_ms"] = 0.001
+        route["throughput_rps"] *= 10
+    first.write_text(json.dumps(result))
+    proc = _bench("--baseline", str(first), cwd=tmp_path)
+    assert proc.returncode == 1
+    assert "REGRESSION " in proc.stderr
+    assert json.loads(proc.stdout)["regressions"]
@@ -0,0 +1,99 @@
+"""
+Owner inbox keyset pagination: every message exactly once, newest first,
+ties on created_at broken by id, and only the shown page marked read.
+"""
+import re
+from datetime import datetime, timedelta
+
+from app import db
+from app.inbox import decode_cursor, load_page
+from app.models import FoundMessage, Lighter
+
+from conftest import make_tag, unlock
+
+
+def _add_messages(app, lighter_id: int, times: list[datetime]):
+    with app.app_context():
+        for n, created in enumerate(times):
+            db.session.add(FoundMessage(
+                lighter_id=lighter_id, note=f"msg {n}", item_label="Keys", is_read=False, created_at=created,
+            ))
+        db.session.get(Lighter, lighter_id).unread_count += len(times)
+        db.session.commit()
+
+
+def _walk(lighter_id: int, size: int) -> list[list[int]]:
+    pages, cursor = [], None
+    while True:
+        rows, cursor = load_page(lighter_id, cursor, size)
+        pages.append([m.id for m in rows])
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_message_once(app):
+    tag = make_tag(app, "INBOX001")
+    other = make_tag(app, "INBOX002", messages=5)
+    base = datetime(2026, 5, 1, 12, 0)
+    # runs of equal timestamps straddle the page boundaries
+    times = [base + timedelta(minutes=m) for m in (0, 0, 0, 1, 2, 2, 2, 2, 3, 5, 5)]
+    _add_messages(app, tag.id, times)
+
+    with app.app_context():
+        expected = [
+            m.id for m in FoundMessage.query.filter_by(lighter_id=tag.id)
+            .order_by(FoundMessage.created_at.desc(), FoundMessage.id.desc())
+        ]
+        for size in (1, 2, 3, 4, 11, 50):
+            pages = _walk(tag.id, size)
+            assert [i for page in pages for i in page] == expected
+            assert all(len(page) == size for page in pages[:-1])
+            assert 0 < len(pages[-1]) <= size
+        others = [i for page in _walk(other.id, 2) for i in page]
+        assert len(others) == 5 and not set(others) & set(expected)
+
+
+def test_bad_cursor_starts_over(app):
+    assert decode_cursor(None) is None
+    assert decode_cursor("garbage") is None
+    assert decode_cursor("2026-05-01T12:00:00_x") is None
+    assert decode_cursor("2026-05-01T12:00:00_7") == (datetime(2026, 5, 1, 12, 0), 7)
+
+    tag = make_tag(app, "INBOX003", messages=3, unread=3)
+    with app.app_context():
+        assert len(load_page(tag.id, "garbage", 10)[0]) == 3
+
+
+def test_load_more_marks_only_the_shown_page(app):
+    tag = make_tag(app, "INBOX004")
+    base = datetime(2026, 5, 1, 12, 0)
+    _add_messages(app, tag.id, [base + timedelta(minutes=m) for m in range(5)])
+    client = app.test_client()
+    unlock(client, "INBOX004")
+
+    def unread() -> int:
+        with app.app_context():
+            count = FoundMessage.query.filter_by(lighter_id=tag.id, is_read=False).count()
+            assert db.session.get(Lighter, tag.id).unread_count == count
+            return count
+
+    first = client.get("/l/INBOX004/messages?partial=1&size=2")
+    assert first.status_code == 200
+    assert re.findall(r"msg (\d)", first.get_data(as_text=True)) == ["4", "3"]
+    assert unread() == 3
+
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(f"/l/INBOX004/messages?partial=1&size=2&cursor={cursor}")
+    assert re.findall(r"msg (\d)", second.get_data(as_text=True)) == ["2", "1"]
+    assert unread() == 1
+
+    last = client.get(f"/l/INBOX004/messages?partial=1&size=2&cursor={second.headers['X-Next-Cursor']}")
+    assert re.findall(r"msg (\d)", last.get_data(as_text=True)) == ["0"]
+    assert last.headers["X-Next-Cursor"] == ""
+    assert unread() == 0
+
+
+def test_inbox_needs_a_grant(app):
+    make_tag(app, "INBOX005", messages=2, unread=2)
+    resp = app.test_client().get("/l/INBOX005/messages")
+    assert resp.status_code == 302 and resp.location.endswith("/l/INBOX005/owner")
@@ -0,0 +1,118 @@
+"""
+Default items are written when a tag is claimed (or by the backfill), so
+public GETs never write, and pages showing items load them with the tag
+in one statement.
+"""
+import re
+
+import pytest
+
+from app import db, querylog
+from app.items import DEFAULT_LABELS, backfill
+from app.models import Lighter, LighterItem
+
+from conftest import make_tag, unlock
+
+WRITES = re.compile(r"^\s*(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+
+@pytest.fixture
+def statements(app):
+    """
+    The SQL text of every statement, per request.
+    """
+    seen = []
+    querylog.install(app)
+
+    @app.after_request
+    def record(response):
+        seen.append(list(querylog.current().statements.elements()))
+        return response
+
+    return seen
+
+
+def _legacy_tag(app, token: str) -> int:
+    """
+    Claimed before items were written at claim time: no items at all.
+    """
+    tag = make_tag(app, token, messages=2)
+    with app.app_context():
+        LighterItem.query.filter_by(lighter_id=tag.id).delete()
+        db.session.commit()
+    return tag.id
+
+
+def _labels(app, lighter_id: int) -> list[str]:
+    with app.app_context():
+        return [i.label for i in LighterItem.query.filter_by(lighter_id=lighter_id).order_by(LighterItem.created_at)]
+
+
+def test_public_gets_do_not_write(app, client, statements):
+    make_tag(app, "ITEMS001", messages=3)
+    legacy = _legacy_tag(app, "ITEMS002")
+    make_tag(app, "ITEMS003", claimed=False)
+
+    def writes() -> list[str]:
+        found = [sql for request in statements for sql in request if WRITES.match(sql)]
+        statements.clear()
+        return found
+
+    for token in ("ITEMS001", "ITEMS002", "ITEMS003"):
+        for path in (f"/l/{token}", f"/l/{token}/finder", f"/l/{token}/owner", f"/qr/{token}"):
+            assert client.get(path).status_code in (200, 302), path
+    assert len(statements) == 12 and writes() == []
+
+    unlock(client, "ITEMS001")
+    writes()
+    # all messages already read: nothing to mark
+    assert client.get("/l/ITEMS001/owner/dashboard").status_code == 200
+    assert client.get("/l/ITEMS001/messages").status_code == 200
+    assert writes() == []
+    # the legacy tag still has no items: the GETs didn't add them
+    assert _labels(app, legacy) == []
+
+
+def test_items_load_with_the_tag(app, client, statements):
+    make_tag(app, "ITEMS004")
+
+    html = client.get("/l/ITEMS004/finder").get_data(as_text=True)
+    assert all(label in html for label in DEFAULT_LABELS)
+    (only,) = statements[-1]
+    assert "JOIN lighter_items" in only
+
+
+def test_claim_writes_the_default_items(app, client):
+    tag = make_tag(app, "ITEMS005", claimed=False)
+    assert _labels(app, tag.id) == []
+
+    resp = client.post("/l/ITEMS005/claim", data={"pin": "1357"})
+    assert resp.status_code == 302
+    assert _labels(app, tag.id) == list(DEFAULT_LABELS)
+
+
+def test_backfill_fills_only_claimed_tags_without_items(app):
+    legacy = [_legacy_tag(app, f"LEGACY{n:02d}") for n in range(5)]
+    full = make_tag(app, "ITEMS006")
+    unclaimed = make_tag(app, "ITEMS007", claimed=False)
+    with app.app_context():
+        before = {t.id: t.updated_at for t in Lighter.query}
+
+        assert backfill(batch_size=2) == 5
+        assert backfill() == 0
+        after = {t.id: t.updated_at for t in Lighter.query}
+
+    for lighter_id in legacy:
+        assert _labels(app, lighter_id) == list(DEFAULT_LABELS)
+        # the public page shows the items, so its ETag has to change
+        assert after[lighter_id] > before[lighter_id]
+    assert _labels(app, full.id) == list(DEFAULT_LABELS) and after[full.id] == before[full.id]
+    assert _labels(app, unclaimed.id) == []
+
+
+def test_items_backfill_command(app):
+    legacy = _legacy_tag(app, "LEGACY99")
+    result = app.test_cli_runner().invoke(args=["items-backfill"])
+    assert result.exit_code == 0, result.output
+    assert result.output.strip() == "Filled 1 tags"
+    assert _labels(app, legacy) == list(DEFAULT_LABELS)
@@ -0,0 +1,233 @@
+"""
+Outbox delivery against a stand-in SMTP server on localhost: rows are
+claimed and sent over one pooled connection, failures are retried with
+backoff, and a refused recipient doesn't cost the connection.
+"""
+import socketserver
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app, db
+from app.mail import email_enabled, enqueue_email, outbox_worker
+from app.models import EmailOutbox
+
+from conftest import make_tag
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for smtplib: no auth, no TLS.
+    """
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 stand-in ESMTP")
+        rcpts = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8").rstrip("\r\n")
+            verb, _, arg = command.partition(" ")
+            verb = verb.upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stand-in")
+            elif verb in ("NOOP", "RSET"):
+                rcpts = []
+                self.reply("250 OK")
+            elif verb == "MAIL":
+                rcpts = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                addr = arg.partition(":")[2].strip(" <>")
+                if addr in server.refuse:
+                    self.reply("550 no such user")
+                else:
+                    rcpts.append(addr)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                if server.fail_data:
+                    self.reply("451 try again later")
+                    continue
+                self.reply("354 go ahead")
+                data = []
+                for raw in self.rfile:
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw)
+                with server.lock:
+                    server.messages.append((rcpts, b"".join(data).decode("utf-8")))
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class StandInSMTP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+        self.refuse = set()
+        self.fail_data = False
+
+
+@pytest.fixture
+def smtp(env, monkeypatch):
+    server = StandInSMTP()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(server.server_address[1]))
+    monkeypatch.setenv("SMTP_FROM", "tags@flametag.test")
+    monkeypatch.setenv("SMTP_AUTH", "0")
+    monkeypatch.setenv("SMTP_STARTTLS", "0")
+    monkeypatch.setenv("MAIL_POOL_SIZE", "1")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def app(smtp):
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    outbox_worker.pool.close()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _queue(app, *recipients):
+    with app.app_context():
+        for to in recipients:
+            enqueue_email(to, f"Hello {to}", "Your tag was found.")
+        db.session.commit()
+
+
+def _rows(app) -> list[EmailOutbox]:
+    with app.app_context():
+        rows = EmailOutbox.query.order_by(EmailOutbox.id).all()
+        db.session.expunge_all()
+        return rows
+
+
+def _deliver(app) -> int:
+    with app.app_context():
+        return outbox_worker.deliver_batch()
+
+
+def test_email_enabled_needs_login_unless_auth_is_off(smtp, monkeypatch):
+    assert email_enabled()
+    monkeypatch.setenv("SMTP_AUTH", "1")
+    assert not email_enabled()
+    monkeypatch.setenv("SMTP_USER", "user")
+    monkeypatch.setenv("SMTP_PASS", "secret")
+    assert email_enabled()
+
+
+def test_batch_is_claimed_sent_and_marked(app, smtp):
+    _queue(app, "a@example.com", "b@example.com", "c@example.com")
+    assert _deliver(app) == 3
+
+    assert [rcpts for rcpts, _ in smtp.messages] == [["a@example.com"], ["b@example.com"], ["c@example.com"]]
+    assert "Subject: Hello a@example.com" in smtp.messages[0][1]
+    for row in _rows(app):
+        assert (row.status, row.attempts, row.claimed_by) == ("sent", 1, None)
+        assert row.sent_at is not None
+    assert _deliver(app) == 0
+
+
+def test_pooled_connection_is_reused(app, smtp):
+    _queue(app, "a@example.com", "b@example.com")
+    _deliver(app)
+    _queue(app, "c@example.com")
+    _deliver(app)
+
+    assert len(smtp.messages) == 3
+    # one connection for both batches: NOOP-checked and reused
+    assert smtp.connections == 1
+    assert outbox_worker.pool.connects == 1 and outbox_worker.pool.reuses == 1
+
+
+def test_failure_is_retried_with_backoff(app, smtp):
+    outbox_worker.max_attempts = 3
+    smtp.fail_data = True
+    _queue(app, "a@example.com")
+    before = datetime.utcnow()
+    assert _deliver(app) == 1
+
+    (row,) = _rows(app)
+    assert (row.status, row.attempts) == ("pending", 1)
+    assert "451" in row.last_error
+    assert row.next_attempt_at >= before + timedelta(seconds=outbox_worker.backoff_base)
+    # not due yet
+    assert _deliver(app) == 0
+
+    def make_due():
+        with app.app_context():
+            db.session.get(EmailOutbox, row.id).next_attempt_at = datetime.utcnow()
+            db.session.commit()
+
+    make_due()
+    _deliver(app)
+    (row,) = _rows(app)
+    assert row.attempts == 2
+    # the second wait is twice the first
+    assert row.next_attempt_at >= datetime.utcnow() + timedelta(seconds=2 * outbox_worker.backoff_base - 5)
+
+    smtp.fail_data = False
+    make_due()
+    _deliver(app)
+    (row,) = _rows(app)
+    assert (row.status, row.attempts, row.last_error) == ("sent", 3, None)
+    assert len(smtp.messages) == 1
+
+
+def test_gives_up_after_max_attempts(app, smtp):
+    outbox_worker.max_attempts = 1
+    smtp.fail_data = True
+    _queue(app, "a@example.com")
+    _deliver(app)
+    (row,) = _rows(app)
+    assert (row.status, row.attempts) == ("failed", 1)
+
+
+def test_refused_recipient_keeps_the_connection(app, smtp):
+    smtp.refuse.add("nobody@example.com")
+    _queue(app, "nobody@example.com", "b@example.com")
+    _deliver(app)
+
+    refused, sent = _rows(app)
+    assert refused.status == "pending" and "SMTPRecipientsRefused" in refused.last_error
+    assert sent.status == "sent"
+    assert smtp.connections == 1
+
+
+def test_found_message_queues_and_wakes(app, smtp):
+    make_tag(app, "MAILTAG1", owner_email="owner@example.com")
+    outbox_worker._wake.clear()
+    resp = app.test_client().post("/l/MAILTAG1/found", data={"found_note": "On the bus"})
+    assert resp.status_code == 302
+
+    assert outbox_worker._wake.is_set()
+    (row,) = _rows(app)
+    assert row.to_email == "owner@example.com" and row.status == "pending"
+    # nothing was sent inside the request
+    assert smtp.messages == []
+    _deliver(app)
+    assert smtp.messages[0][0] == ["owner@example.com"]
@@ -0,0 +1,132 @@
+"""
+Metrics: histogram buckets are cumulative (non-decreasing up to +Inf ==
+_count), local mode sums every worker's samples, and /metrics is only
+served with the bearer token or an admin session.
+"""
+import re
+from collections import defaultdict
+
+import pytest
+
+from app import create_app, db
+from app.localstore import LocalStore
+from app.metrics import LOCAL_SCHEMA, Metrics, metrics
+
+from conftest import admin_login, make_tag
+
+TOKEN = "scrape-me"
+SAMPLE = re.compile(r'^(\w+?)(?:\{(.*)\})? (\S+)$')
+
+
+@pytest.fixture(params=["memory", "local"])
+def app(request, env, monkeypatch):
+    monkeypatch.setenv("METRICS", request.param)
+    monkeypatch.setenv("METRICS_PATH", str(env / "metrics.sqlite3"))
+    monkeypatch.setenv("METRICS_TOKEN", TOKEN)
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _scrape(client) -> dict:
+    resp = client.get("/metrics", headers={"Authorization": f"Bearer {TOKEN}"})
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in resp.get_data(as_text=True).splitlines():
+        if line.startswith("#"):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        samples[(name, labels or "")] = float(value)
+    return samples
+
+
+def _histograms(samples: dict, family: str) -> dict:
+    """
+    labels without le -> [(bound, cumulative count)] in exposition order.
+    """
+    out = defaultdict(list)
+    for (name, labels), value in samples.items():
+        if name == f"{family}_bucket":
+            le = re.search(r'le="([^"]+)"', labels).group(1)
+            rest = re.sub(r',?le="[^"]+"', "", labels)
+            out[rest].append((float("inf") if le == "+Inf" else float(le), value))
+    return out
+
+
+def test_histogram_buckets_are_cumulative(app, client):
+    make_tag(app, "METRIC01")
+    for _ in range(3):
+        client.get("/l/METRIC01")
+    client.get("/")
+
+    samples = _scrape(client)
+    assert samples[("flametag_requests_total", 'endpoint="main.lighter_page",method="GET",status="200"')] == 3
+
+    for family in ("flametag_request_duration_seconds", "flametag_request_sql_statements"):
+        histograms = _histograms(samples, family)
+        assert 'endpoint="main.lighter_page"' in histograms
+        for labels, buckets in histograms.items():
+            bounds = [b for b, _ in buckets]
+            counts = [c for _, c in buckets]
+            assert bounds == sorted(bounds) and bounds[-1] == float("inf")
+            assert counts == sorted(counts)
+            assert counts[-1] == samples[(f"{family}_count", labels)]
+
+
+def test_observe_fills_every_bucket(app):
+    metrics.observe("flametag_qr_render_seconds", 0.3, size="m")
+    metrics.observe("flametag_qr_render_seconds", 7, size="m")
+    with app.test_request_context():
+        samples = metrics.collect()
+
+    buckets = {labels: v for (name, labels), v in samples.items() if name == "flametag_qr_render_seconds_bucket"}
+    assert buckets['le="0.25",size="m"'] == 0
+    assert buckets['le="0.5",size="m"'] == 1
+    assert buckets['le="10.0",size="m"'] == buckets['le="+Inf",size="m"'] == 2
+    assert samples[("flametag_qr_render_seconds_sum", 'size="m"')] == pytest.approx(7.3)
+
+
+def test_local_mode_sums_workers(app, client):
+    if metrics.mode != "local":
+        pytest.skip("only local mode shares samples")
+
+    # a second worker: its own Metrics over the same file
+    other = Metrics()
+    other.app, other.mode = app, "local"
+    other.store = LocalStore(app.config["METRICS_PATH"], LOCAL_SCHEMA)
+
+    for worker, value in ((metrics, 0.02), (other, 0.2), (other, 3.0)):
+        worker.observe("flametag_qr_render_seconds", value)
+    other.inc("flametag_requests_total", endpoint="x", method="GET", status=200)
+    other.flush()
+
+    samples = _scrape(client)
+    assert samples[("flametag_qr_render_seconds_count", "")] == 3
+    assert samples[("flametag_qr_render_seconds_sum", "")] == pytest.approx(3.22)
+    assert samples[("flametag_qr_render_seconds_bucket", 'le="0.025"')] == 1
+    assert samples[("flametag_qr_render_seconds_bucket", 'le="0.25"')] == 2
+    assert samples[("flametag_qr_render_seconds_bucket", 'le="+Inf"')] == 3
+    assert samples[("flametag_requests_total", 'endpoint="x",method="GET",status="200"')] == 1
+
+    # flushed samples are moved, not copied: a second scrape adds nothing twice
+    again = _scrape(client)
+    assert again[("flametag_qr_render_seconds_count", "")] == 3
+
+
+def test_scrape_needs_token_or_admin(app, client):
+    assert client.get("/metrics").status_code == 404
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 404
+    admin_login(client)
+    assert client.get("/metrics").status_code == 200
+
+
+def test_off_by_default(env):
+    app = create_app()
+    with app.app_context():
+        assert not metrics.enabled
+        assert app.test_client().get("/metrics", headers={"Authorization": f"Bearer {TOKEN}"}).status_code == 404
+        db.engine.dispose()
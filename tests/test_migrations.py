@@ -0,0 +1,150 @@
+"""
+Schema migrations: a fresh database, a database left by the baseline
+release (create_all on boot, no schema_version), and several workers
+booting at once with DB_AUTO_UPGRADE on.
+"""
+import multiprocessing
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+from app.migrations import HEAD, MIGRATIONS, current_version, upgrade
+from app.unread import find_mismatches
+
+# what db.create_all() made before migrations existed
+BASELINE_SCHEMA = """
+CREATE TABLE lighters (
+    id INTEGER NOT NULL PRIMARY KEY,
+    token VARCHAR(32) NOT NULL,
+    claimed_at DATETIME,
+    owner_pin_hash VARCHAR(255),
+    public_message TEXT,
+    private_message TEXT,
+    owner_phone VARCHAR(40),
+    show_owner_phone BOOLEAN NOT NULL,
+    owner_email VARCHAR(120),
+    scan_count INTEGER NOT NULL,
+    found_at DATETIME,
+    found_note TEXT,
+    updated_at DATETIME NOT NULL
+);
+CREATE UNIQUE INDEX ix_lighters_token ON lighters (token);
+CREATE TABLE lighter_items (
+    id INTEGER NOT NULL PRIMARY KEY,
+    lighter_id INTEGER NOT NULL REFERENCES lighters (id),
+    label VARCHAR(64) NOT NULL,
+    created_at DATETIME NOT NULL
+);
+CREATE INDEX ix_lighter_items_lighter_id ON lighter_items (lighter_id);
+CREATE TABLE found_messages (
+    id INTEGER NOT NULL PRIMARY KEY,
+    lighter_id INTEGER NOT NULL REFERENCES lighters (id),
+    item_label VARCHAR(64) NOT NULL,
+    note TEXT NOT NULL,
+    finder_name VARCHAR(80),
+    finder_contact VARCHAR(120),
+    is_read BOOLEAN NOT NULL,
+    created_at DATETIME NOT NULL
+);
+CREATE INDEX ix_found_messages_lighter_id ON found_messages (lighter_id);
+"""
+
+
+def _db_path(env) -> str:
+    return str(env / "test.db")
+
+
+def _schema(conn) -> dict:
+    """
+    table -> (columns with nullability, index names) as the database has it.
+    """
+    insp = inspect(conn)
+    return {
+        table: (
+            {(c["name"], c["nullable"]) for c in insp.get_columns(table)},
+            {i["name"] for i in insp.get_indexes(table)},
+        )
+        for table in db.metadata.tables
+    }
+
+
+def _model_schema() -> dict:
+    return {
+        name: (
+            {(c.name, bool(c.nullable) and not c.primary_key) for c in table.columns},
+            {i.name for i in table.indexes},
+        )
+        for name, table in db.metadata.tables.items()
+    }
+
+
+def test_fresh_database(app):
+    with app.app_context():
+        assert current_version() == HEAD
+        # migrations alone (frozen tables + later columns/indexes) build what the models describe
+        assert _schema(db.engine) == _model_schema()
+        # nothing left to do, and running it again is harmless
+        assert upgrade(echo=lambda _: None) == []
+
+
+def test_upgrade_from_baseline_schema(env):
+    conn = sqlite3.connect(_db_path(env))
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executescript("""
+        INSERT INTO lighters (id, token, claimed_at, owner_pin_hash, show_owner_phone, scan_count, updated_at)
+        VALUES (1, 'OLDTAG01', '2024-01-01 00:00:00', 'x', 0, 7, '2024-01-01 00:00:00');
+        INSERT INTO lighters (id, token, show_owner_phone, scan_count, updated_at)
+        VALUES (2, 'OLDTAG02', 0, 0, '2024-01-01 00:00:00');
+        INSERT INTO found_messages (lighter_id, item_label, note, is_read, created_at) VALUES
+        (1, 'Keys', 'a', 0, '2024-01-02 00:00:00'),
+        (1, 'Keys', 'b', 0, '2024-01-03 00:00:00'),
+        (1, 'Keys', 'c', 1, '2024-01-04 00:00:00');
+    """)
+    conn.commit()
+    conn.close()
+
+    app = create_app()  # DB_AUTO_UPGRADE defaults to on
+    with app.app_context():
+        assert current_version() == HEAD
+        applied = db.session.execute(text("SELECT version FROM schema_version ORDER BY version")).scalars().all()
+        assert applied == [v for v, _, _ in MIGRATIONS]
+
+        row = db.session.execute(text(
+            "SELECT scan_count, unread_count FROM lighters WHERE token = 'OLDTAG01'"
+        )).one()
+        assert tuple(row) == (7, 2)
+        assert find_mismatches() == []
+
+        # claimed tags get their default items (migration 007), unclaimed ones don't
+        items = dict(db.session.execute(text(
+            "SELECT l.token, COUNT(i.id) FROM lighters l "
+            "LEFT JOIN lighter_items i ON i.lighter_id = l.id GROUP BY l.token"
+        )).all())
+        assert items["OLDTAG01"] > 0 and items["OLDTAG02"] == 0
+
+        # the same schema a fresh database gets
+        assert _schema(db.engine) == _model_schema()
+        db.engine.dispose()
+
+
+def _boot(_) -> str:
+    try:
+        create_app()
+    except Exception as e:  # reported to the parent, which fails the test
+        return repr(e)
+    return "ok"
+
+
+def test_concurrent_boot_runs_each_migration_once(env):
+    workers = 6
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        results = list(pool.map(_boot, range(workers)))
+    assert results == ["ok"] * workers
+
+    conn = sqlite3.connect(_db_path(env))
+    versions = [v for (v,) in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    conn.close()
+    assert versions == [v for v, _, _ in MIGRATIONS]
@@ -0,0 +1,78 @@
+"""
+PIN hashing: hashes made with older parameters keep working and are
+upgraded on the next successful unlock; `flask pin-calibrate` suggests a cost.
+"""
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import Lighter
+from app.pins import calibrate, needs_rehash
+
+from conftest import PIN, make_tag, unlock
+
+LEGACY = "pbkdf2:sha256:500"
+
+
+def _stored(app, token: str) -> str:
+    with app.app_context():
+        return Lighter.query.filter_by(token=token).one().owner_pin_hash
+
+
+def _set_legacy(app, token: str) -> str:
+    with app.app_context():
+        lighter = Lighter.query.filter_by(token=token).one()
+        lighter.owner_pin_hash = generate_password_hash(PIN, LEGACY)
+        db.session.commit()
+        return lighter.owner_pin_hash
+
+
+def test_needs_rehash_follows_config(app):
+    with app.app_context():
+        current = generate_password_hash(PIN, app.config["PIN_HASH_METHOD"])
+        assert not needs_rehash(current)
+        assert needs_rehash(generate_password_hash(PIN, LEGACY))
+        assert needs_rehash(generate_password_hash(PIN, "scrypt"))
+
+
+def test_legacy_hash_upgraded_on_unlock(app, client):
+    make_tag(app, "PINS0001")
+    legacy = _set_legacy(app, "PINS0001")
+
+    unlock(client, "PINS0001")
+    upgraded = _stored(app, "PINS0001")
+    assert upgraded != legacy
+    assert upgraded.startswith(app.config["PIN_HASH_METHOD"] + "$")
+
+    # an up-to-date hash is left alone, and the new one still opens the tag
+    unlock(app.test_client(), "PINS0001", kind="edit")
+    assert _stored(app, "PINS0001") == upgraded
+
+
+def test_wrong_pin_does_not_rehash(app, client):
+    make_tag(app, "PINS0002")
+    legacy = _set_legacy(app, "PINS0002")
+
+    resp = client.post("/l/PINS0002/owner", data={"pin": "0000"})
+    assert resp.status_code == 302 and resp.location.endswith("/l/PINS0002/owner")
+    assert _stored(app, "PINS0002") == legacy
+
+
+def test_calibrate_picks_the_costliest_within_target(monkeypatch):
+    timings = {100_000: 20.0, 200_000: 40.0, 400_000: 80.0, 600_000: 120.0, 1_000_000: 250.0, 2_000_000: 500.0}
+    monkeypatch.setattr("app.pins.time_method", lambda method, rounds=3: timings[int(method.rsplit(":", 1)[1])])
+
+    results, best = calibrate("pbkdf2", 100.0)
+    assert best == "pbkdf2:sha256:400000"
+    # stops at the first candidate more than twice the target
+    assert [method for method, _, _ in results][-1] == "pbkdf2:sha256:1000000"
+
+    _, best = calibrate("pbkdf2", 10.0)
+    assert best is None
+
+
+def test_pin_calibrate_command(app):
+    result = app.test_cli_runner().invoke(args=["pin-calibrate", "--algorithm", "pbkdf2",
+                                                "--rounds", "1", "--target-ms", "1000"])
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith("Current PIN_HASH_METHOD=pbkdf2:sha256:1000")
+    assert "PIN_HASH_METHOD=pbkdf2:sha256:" in result.output.splitlines()[-2]
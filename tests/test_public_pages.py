@@ -0,0 +1,138 @@
+"""
+Public tag pages: ETag + 304 revalidation, what changes the ETag, and when
+the response may be kept by a shared cache.
+"""
+import json
+import os
+
+import pytest
+
+from app import create_app, db
+from app.assets import MANIFEST, assets
+
+from conftest import make_tag, unlock
+
+PAGES = ["/l/PUBLIC01", "/l/PUBLIC01/finder"]
+
+
+@pytest.fixture(params=["", "memory"])
+def app(request, env, monkeypatch):
+    # with the tag cache on, a stale entry would keep serving the old ETag
+    monkeypatch.setenv("TAG_CACHE", request.param)
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _etag(client, path, **kwargs) -> str:
+    resp = client.get(path, **kwargs)
+    assert resp.status_code == 200 and resp.headers["ETag"]
+    return resp.headers["ETag"]
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_if_none_match_gets_304(app, path):
+    make_tag(app, "PUBLIC01")
+    client = app.test_client()
+    first = client.get(path)
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"].startswith("public,")
+    assert "Accept-Language" in first.headers["Vary"]
+    assert "Set-Cookie" not in first.headers
+
+    again = client.get(path, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+    other = client.get(path, headers={"If-None-Match": '"not-this-one"'})
+    assert other.status_code == 200
+
+
+def test_etag_differs_per_page_and_language(app):
+    make_tag(app, "PUBLIC01")
+    client = app.test_client()
+    choice, finder = (_etag(client, path) for path in PAGES)
+    assert choice != finder
+
+    english = _etag(client, PAGES[0], headers={"Accept-Language": "en"})
+    french = _etag(client, PAGES[0], headers={"Accept-Language": "fr"})
+    assert english != french
+
+
+def test_found_and_edit_change_etag(app):
+    make_tag(app, "PUBLIC01")
+    client = app.test_client()
+    before = [_etag(client, path) for path in PAGES]
+
+    finder = app.test_client()
+    finder.post("/l/PUBLIC01/found", data={"found_note": "On the bus"})
+    after_found = [_etag(client, path) for path in PAGES]
+    assert all(b != a for b, a in zip(before, after_found))
+
+    owner = app.test_client()
+    unlock(owner, "PUBLIC01", kind="edit")
+    owner.post("/l/PUBLIC01/edit", data={"public_message": "Please text me"})
+    after_edit = [_etag(client, path) for path in PAGES]
+    assert all(f != e for f, e in zip(after_found, after_edit))
+    assert b"Please text me" in client.get(PAGES[1]).data
+
+
+def test_scans_do_not_change_etag(app):
+    make_tag(app, "PUBLIC01")
+    client = app.test_client()
+    before = _etag(client, PAGES[1])
+    client.post("/l/PUBLIC01/scan")
+    assert _etag(client, PAGES[1]) == before
+
+
+def test_asset_rebuild_changes_etag(app):
+    make_tag(app, "PUBLIC01")
+    client = app.test_client()
+    before = _etag(client, PAGES[0])
+
+    # what `flask assets-build` leaves behind: pages now link other files
+    os.makedirs(assets.out_dir, exist_ok=True)
+    manifest = {"css/style.css": {"file": "css/style.0123456789ab.css", "encodings": []}}
+    with open(os.path.join(assets.out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+    assets.load()
+    try:
+        resp = client.get(PAGES[0], headers={"If-None-Match": before})
+        assert resp.status_code == 200
+        assert resp.headers["ETag"] != before
+        assert b"/assets/css/style.0123456789ab.css" in resp.data
+    finally:
+        os.remove(os.path.join(assets.out_dir, MANIFEST))
+        assets.load()
+
+
+def test_lang_cookie_is_private(app):
+    make_tag(app, "PUBLIC01")
+    client = app.test_client()
+    client.set_cookie("lang", "fr")
+    resp = client.get(PAGES[0])
+    assert resp.headers["Cache-Control"] == "private, no-cache"
+    assert "Cookie" in resp.headers["Vary"]
+
+    again = client.get(PAGES[0], headers={"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.headers["Cache-Control"] == "private, no-cache"
+
+
+def test_session_is_private_and_flash_is_not_stored(app):
+    make_tag(app, "PUBLIC01")
+    client = app.test_client()
+    unlock(client, "PUBLIC01", kind="edit")
+
+    # the unlock's flash message: shown once, never cached
+    flashed = client.get(PAGES[0])
+    assert flashed.headers["Cache-Control"] == "private, no-store"
+    assert "ETag" not in flashed.headers
+
+    resp = client.get(PAGES[0])
+    assert resp.headers["Cache-Control"] == "private, no-cache"
+    assert "Cookie" in resp.headers["Vary"]
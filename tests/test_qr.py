@@ -0,0 +1,82 @@
+"""
+/qr/<token>: content-addressed renders, strong ETags with 304s, and the
+memory + disk render cache.
+"""
+import pytest
+
+from app import create_app, db
+from app.qr import qr_cache, render_key, render_qr_png
+
+from conftest import make_tag
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+
+@pytest.fixture
+def app(env, monkeypatch):
+    monkeypatch.setenv("QR_CACHE_DIR", str(env / "qr"))
+    app = create_app()
+    app.config["TESTING"] = True
+    qr_cache.clear()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _counts() -> tuple[int, int, int]:
+    st = qr_cache.stats()
+    return st["hits"], st["disk_hits"], st["misses"]
+
+
+def test_render_key_is_a_content_address():
+    assert render_key("QRTAG001", 10, 2) == render_key("QRTAG001", 10, 2)
+    assert len({render_key("QRTAG001", 10, 2), render_key("QRTAG001", 5, 2),
+                render_key("QRTAG002", 10, 2), render_key("QRTAG001", 10, 4)}) == 4
+    # same key, same bytes: what makes the ETag strong
+    assert render_qr_png("QRTAG001") == render_qr_png("QRTAG001")
+
+
+def test_etag_and_304(app):
+    make_tag(app, "QRTAG001")
+    client = app.test_client()
+    resp = client.get("/qr/QRTAG001")
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/png" and resp.data.startswith(PNG_MAGIC)
+    assert resp.headers["ETag"] == f'"{render_key("QRTAG001", 10, 2)}"'
+    assert "immutable" in resp.headers["Cache-Control"]
+
+    again = client.get("/qr/QRTAG001", headers={"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+
+
+def test_box_size_is_clamped_and_keyed(app):
+    make_tag(app, "QRTAG001")
+    client = app.test_client()
+    small = client.get("/qr/QRTAG001?box=4")
+    huge = client.get("/qr/QRTAG001?box=500")
+    assert small.headers["ETag"] == f'"{render_key("QRTAG001", 4, 2)}"'
+    assert huge.headers["ETag"] == f'"{render_key("QRTAG001", 20, 2)}"'
+    assert len(small.data) < len(huge.data)
+
+
+def test_memory_then_disk_cache(app, env):
+    make_tag(app, "QRTAG001")
+    client = app.test_client()
+    hits, disk_hits, misses = _counts()
+
+    first = client.get("/qr/QRTAG001").data
+    assert _counts() == (hits, disk_hits, misses + 1)
+    assert list((env / "qr").rglob("*.png"))
+
+    assert client.get("/qr/QRTAG001").data == first
+    assert _counts() == (hits + 1, disk_hits, misses + 1)
+
+    # a restarted worker: memory is empty, the disk copy is served
+    qr_cache.clear()
+    assert client.get("/qr/QRTAG001").data == first
+    assert _counts() == (hits + 1, disk_hits + 1, misses + 1)
+
+
+def test_unknown_tag_is_404(app):
+    assert app.test_client().get("/qr/NOSUCHTG").status_code == 404
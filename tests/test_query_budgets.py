@@ -0,0 +1,89 @@
+"""
+Every budgeted route, run against seeded data with QUERY_BUDGET=strict:
+going over the route's @query_budget or repeating a statement (an N+1)
+raises QueryBudgetExceeded and fails the test.
+"""
+import pytest
+
+from app.querybudget import query_budgets
+
+from conftest import PIN, admin_login, make_tag, unlock
+
+TOKEN = "BUDGET01"
+
+
+@pytest.fixture
+def seeded(app):
+    # enough rows that a per-row lazy load would cross QUERY_BUDGET_REPEAT
+    make_tag(app, TOKEN, messages=30, unread=12, owner_email="owner@example.com")
+    make_tag(app, "UNCLAIM1", claimed=False)
+    for n in range(20):
+        make_tag(app, f"OTHER{n:03d}", messages=2, unread=1)
+    return app
+
+
+def test_strict_mode_is_on(seeded):
+    assert query_budgets.mode == "strict"
+
+
+@pytest.mark.parametrize("path", [
+    f"/l/{TOKEN}",
+    "/l/UNCLAIM1",
+    f"/l/{TOKEN}/finder",
+    f"/l/{TOKEN}/owner",
+    f"/qr/{TOKEN}",
+    "/l/NOSUCHTG",
+])
+def test_public_gets(seeded, client, path):
+    assert client.get(path).status_code in (200, 404)
+
+
+def test_scan_beacon(seeded, client):
+    resp = client.post(f"/l/{TOKEN}/scan")
+    assert resp.status_code == 200
+    assert resp.get_json()["scan_count"] == 1
+
+
+def test_owner_unlock_and_dashboard(seeded, client):
+    resp = client.post(f"/l/{TOKEN}/owner", data={"pin": "0000"})
+    assert resp.status_code == 302
+
+    unlock(client, TOKEN)
+    assert client.get(f"/l/{TOKEN}/owner/dashboard").status_code == 200
+
+
+def test_found_message(seeded, client):
+    resp = client.post(f"/l/{TOKEN}/found", data={"found_note": "At the bus stop", "finder_name": "Sam"})
+    assert resp.status_code == 302
+
+
+def test_unlock_private_and_inbox(seeded, client):
+    resp = client.post(f"/l/{TOKEN}/unlock", data={"pin": PIN})
+    assert resp.status_code == 200
+
+    assert client.get(f"/l/{TOKEN}/messages").status_code == 200
+    assert client.get(f"/l/{TOKEN}/messages?partial=1").status_code == 200
+
+
+def test_admin_list(seeded, client):
+    admin_login(client)
+    assert client.get("/admin").status_code == 200
+    assert client.get("/admin?status=claimed&prefix=OTH").status_code == 200
+
+
+def test_deletes(seeded, client):
+    unlock(client, TOKEN)
+    assert client.post(f"/l/{TOKEN}/delete").status_code == 302
+
+    admin_login(client)
+    assert client.post("/admin/delete/OTHER000").status_code == 302
+
+
+def test_over_budget_fails_the_request(seeded, client, monkeypatch):
+    from app.querybudget import QueryBudgetExceeded
+
+    unlock(client, TOKEN)
+    view = seeded.view_functions["main.owner_dashboard"]
+    monkeypatch.setattr(view, "query_budget", 1)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get(f"/l/{TOKEN}/owner/dashboard")
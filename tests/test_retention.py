@@ -0,0 +1,136 @@
+"""
+Retention purge: a dry run only counts, a real run deletes exactly the
+matching rows (children first) in batches, and the archive holds each
+deleted row with its child rows nested.
+"""
+import json
+from datetime import date, datetime, timedelta
+
+from app import db
+from app.models import FoundMessage, Lighter, LighterItem, ScanDaily, ScanHourly
+from app.retention import purge, run_policies
+
+from conftest import make_tag
+
+OLD = datetime.utcnow() - timedelta(days=60)
+NEW = datetime.utcnow() - timedelta(days=2)
+
+
+def _tag(token: str, origin: str = "web", created: datetime = OLD, claimed: bool = False) -> Lighter:
+    lighter = Lighter(token=token, origin=origin, created_at=created, updated_at=created,
+                      claimed_at=created if claimed else None)
+    db.session.add(lighter)
+    db.session.flush()
+    return lighter
+
+
+def _seed(app) -> None:
+    with app.app_context():
+        for n in range(5):
+            stale = _tag(f"STALE{n:03d}")
+            db.session.add_all([
+                LighterItem(lighter_id=stale.id, label="Keys"),
+                FoundMessage(lighter_id=stale.id, note=f"found {n}", item_label="Keys", is_read=False, created_at=OLD),
+                ScanHourly(lighter_id=stale.id, hour=OLD.replace(minute=0, second=0, microsecond=0), scans=2),
+                ScanDaily(lighter_id=stale.id, day=date(2026, 1, 1), scans=3),
+            ])
+        _tag("FRESH001", created=NEW)
+        _tag("CLAIMED1", claimed=True)
+        _tag("PRINTED1", origin="admin")
+        _tag("IMPORTD1", origin="import")
+        db.session.commit()
+
+
+def _tokens() -> set[str]:
+    return {t for (t,) in db.session.query(Lighter.token)}
+
+
+def test_dry_run_only_counts(app):
+    _seed(app)
+    with app.app_context():
+        result = purge("unclaimed-tags", 30, dry_run=True)
+        assert (result.matched, result.deleted, result.batches) == (5, 0, 0)
+        assert "5 rows older than 30 days would be deleted (dry run)" in result.summary()
+        assert len(_tokens()) == 9
+        assert db.session.query(FoundMessage).count() == 5
+
+
+def test_purge_deletes_matching_tags_and_children(app, env):
+    _seed(app)
+    archive = env / "archive"
+    with app.app_context():
+        result = purge("unclaimed-tags", 30, batch_size=2, pause=0, archive_dir=str(archive))
+        assert (result.deleted, result.archived, result.batches) == (5, 5, 3)
+        assert _tokens() == {"FRESH001", "CLAIMED1", "PRINTED1", "IMPORTD1"}
+        for model in (LighterItem, FoundMessage, ScanHourly, ScanDaily):
+            assert db.session.query(model).count() == 0
+
+        # nothing left to do
+        assert purge("unclaimed-tags", 30, pause=0).deleted == 0
+
+    (path,) = archive.iterdir()
+    assert path.name.startswith("unclaimed-tags-") and path.suffix == ".jsonl"
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert sorted(r["token"] for r in rows) == [f"STALE{n:03d}" for n in range(5)]
+    for row in rows:
+        assert [m["note"] for m in row["found_messages"]] == [f"found {row['token'][-1]}"]
+        assert [i["label"] for i in row["lighter_items"]] == ["Keys"]
+        assert row["scan_hourly"][0]["scans"] == 2 and row["scan_daily"][0]["scans"] == 3
+
+
+def test_purged_tag_is_gone_from_the_cache(app, monkeypatch):
+    monkeypatch.setenv("TAG_CACHE", "memory")
+    from app import create_app
+
+    cached = create_app()
+    _seed(cached)
+    client = cached.test_client()
+    assert client.get("/l/STALE000").status_code == 200
+    with cached.app_context():
+        purge("unclaimed-tags", 30, pause=0)
+    assert client.get("/l/STALE000").status_code == 404
+
+
+def test_max_batches(app):
+    _seed(app)
+    with app.app_context():
+        result = purge("unclaimed-tags", 30, batch_size=2, pause=0, max_batches=1)
+        assert (result.deleted, result.batches) == (2, 1)
+        assert len(_tokens()) == 7
+
+
+def test_read_messages_policy(app):
+    tag = make_tag(app, "READMSG1")
+    with app.app_context():
+        for created, read in ((OLD, True), (OLD, False), (NEW, True)):
+            db.session.add(FoundMessage(lighter_id=tag.id, note="x", item_label="Keys",
+                                        is_read=read, created_at=created))
+        db.session.commit()
+
+        app.config["RETENTION_UNCLAIMED_TAG_DAYS"] = 0
+        assert run_policies(app.config, pause=0) == []
+
+        app.config["RETENTION_READ_MESSAGE_DAYS"] = 30
+        (result,) = run_policies(app.config, pause=0)
+        assert (result.policy, result.deleted) == ("read-messages", 1)
+        assert sorted((m.is_read, m.created_at == NEW) for m in FoundMessage.query) == [(False, False), (True, True)]
+
+
+def test_purge_command(app):
+    _seed(app)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=["purge", "--dry-run"])
+    assert result.exit_code == 0, result.output
+    assert "unclaimed-tags: 5 rows" in result.output
+
+    result = runner.invoke(args=["purge", "--days", "30"])
+    assert result.exit_code == 2 and "--days needs exactly one --policy" in result.output
+
+    result = runner.invoke(args=["purge", "--policy", "unclaimed-tags", "--days", "90", "--pause", "0"])
+    assert "deleted 0 rows older than 90 days" in result.output
+
+    result = runner.invoke(args=["purge", "--pause", "0", "--batch-size", "10"])
+    assert "unclaimed-tags: deleted 5 rows older than 30 days in 1 batches" in result.output
+    with app.app_context():
+        assert len(_tokens()) == 4
@@ -0,0 +1,138 @@
+"""
+Write-behind scan counting (SCAN_BUFFER=memory / local): scans show up in
+the page's count right away, a flush writes them to lighters.scan_count
+and scan_hourly in one go, and nothing is lost when a flush fails.
+"""
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+from app import db, scans
+from app.analytics import daily_series
+from app.models import Lighter, ScanHourly
+from app.scans import scan_buffer
+
+from conftest import make_tag
+
+
+@pytest.fixture(params=["memory", "local"])
+def buffered_app(request, env, monkeypatch):
+    monkeypatch.setenv("SCAN_BUFFER", request.param)
+    monkeypatch.setenv("SCAN_BUFFER_PATH", str(env / "scan_buffer.sqlite3"))
+    # the test flushes by hand; the background flusher stays asleep
+    monkeypatch.setenv("SCAN_FLUSH_SECONDS", "3600")
+    from app import create_app
+
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    scan_buffer.flush()
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _scan_count(app, token: str) -> int:
+    with app.app_context():
+        return db.session.execute(select(Lighter.scan_count).where(Lighter.token == token)).scalar()
+
+
+def test_flush_writes_counts_and_hourly_buckets(buffered_app):
+    app = buffered_app
+    a = make_tag(app, "SCANBUF1")
+    make_tag(app, "SCANBUF2")
+    client = app.test_client()
+
+    counts = [client.post("/l/SCANBUF1/scan").get_json()["scan_count"] for _ in range(3)]
+    client.post("/l/SCANBUF2/scan")
+    # buffered, but the beacon already reports the pending scans
+    assert counts == [1, 2, 3]
+    assert _scan_count(app, "SCANBUF1") == 0
+
+    assert scan_buffer.flush() == 4
+    assert scan_buffer.pending_for(a.id) == 0
+    assert _scan_count(app, "SCANBUF1") == 3
+    assert _scan_count(app, "SCANBUF2") == 1
+    with app.app_context():
+        assert db.session.execute(select(func.sum(ScanHourly.scans))).scalar() == 4
+        assert daily_series(a.id)[-1][1] == 3
+
+    assert scan_buffer.flush() == 0
+
+
+def test_scans_of_a_deleted_tag_are_dropped(buffered_app):
+    app = buffered_app
+    gone = make_tag(app, "SCANGONE")
+    client = app.test_client()
+    client.post("/l/SCANGONE/scan")
+
+    with app.app_context():
+        db.session.execute(Lighter.__table__.delete().where(Lighter.id == gone.id))
+        db.session.commit()
+
+    assert scan_buffer.flush() == 1
+    with app.app_context():
+        assert db.session.execute(select(func.count()).select_from(ScanHourly)).scalar() == 0
+
+
+def test_failed_flush_keeps_the_scans(buffered_app, monkeypatch):
+    app = buffered_app
+    tag = make_tag(app, "SCANFAIL")
+    app.test_client().post("/l/SCANFAIL/scan")
+
+    def broken(buckets):
+        raise RuntimeError("database went away")
+
+    working = scans.add_hourly
+    monkeypatch.setattr(scans, "add_hourly", broken)
+    assert scan_buffer.flush() == 0
+    assert scan_buffer.pending_for(tag.id) == 1
+    assert _scan_count(app, "SCANFAIL") == 0
+
+    monkeypatch.setattr(scans, "add_hourly", working)
+    assert scan_buffer.flush() == 1
+    assert _scan_count(app, "SCANFAIL") == 1
+
+
+def test_max_pending_flushes_early(buffered_app, monkeypatch):
+    app = buffered_app
+    monkeypatch.setattr(scan_buffer, "max_pending", 3)
+    tags = [make_tag(app, f"SCANMAX{n}") for n in range(3)]
+    client = app.test_client()
+
+    # local mode looks at the shared buffer's size every LOCAL_SIZE_CHECK_EVERY scans
+    monkeypatch.setattr(scans, "LOCAL_SIZE_CHECK_EVERY", 1)
+    for tag in tags:
+        client.post(f"/l/{tag.token}/scan")
+
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and _scan_count(app, "SCANMAX2") == 0:
+        time.sleep(0.05)
+    assert [_scan_count(app, t.token) for t in tags] == [1, 1, 1]
+
+
+@pytest.mark.parametrize("buffer", ["", "memory", "local"])
+def test_beacon_count_is_current_with_tag_cache(env, monkeypatch, buffer):
+    monkeypatch.setenv("TAG_CACHE", "memory")
+    monkeypatch.setenv("SCAN_BUFFER", buffer)
+    monkeypatch.setenv("SCAN_BUFFER_PATH", str(env / "scan_buffer.sqlite3"))
+    monkeypatch.setenv("SCAN_FLUSH_SECONDS", "3600")
+    from app import create_app
+
+    app = create_app()
+    app.config["TESTING"] = True
+    make_tag(app, "SCANBUF5")
+    client = app.test_client()
+    # the finder page puts the tag's view in the cache
+    assert client.get("/l/SCANBUF5/finder").status_code == 200
+
+    counts = [client.post("/l/SCANBUF5/scan").get_json()["scan_count"] for _ in range(3)]
+    assert counts == [1, 2, 3]
+
+    # after a flush the pending scans are in the row, not counted twice or lost
+    scan_buffer.flush()
+    assert client.post("/l/SCANBUF5/scan").get_json()["scan_count"] == 4
+    scan_buffer.flush()
+    assert _scan_count(app, "SCANBUF5") == 4
+    with app.app_context():
+        db.engine.dispose()
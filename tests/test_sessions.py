@@ -0,0 +1,152 @@
+"""
+Per-tag grants (expiry, pruning) and the server-side session store
+(new id on every privilege change, old id unusable afterwards).
+"""
+import pytest
+
+from app import db, sessions
+
+from conftest import admin_login, make_tag, unlock
+
+
+@pytest.fixture(params=["", "sql", "local"])
+def backend_app(request, env, monkeypatch):
+    monkeypatch.setenv("SESSION_BACKEND", request.param)
+    monkeypatch.setenv("SESSION_LOCAL_PATH", str(env / "sessions.sqlite3"))
+    monkeypatch.setenv("GRANT_SECONDS", "600")
+    from app import create_app
+
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _session_cookie(client, app) -> str | None:
+    cookie = client.get_cookie(app.config["SESSION_COOKIE_NAME"])
+    return cookie.value if cookie else None
+
+
+def test_grant_expires(backend_app, monkeypatch):
+    app = backend_app
+    make_tag(app, "GRANT001")
+    client = app.test_client()
+    unlock(client, "GRANT001")
+    assert client.get("/l/GRANT001/owner/dashboard").status_code == 200
+
+    now = sessions.time.time()
+    monkeypatch.setattr(sessions.time, "time", lambda: now + 601)
+    resp = client.get("/l/GRANT001/owner/dashboard")
+    assert resp.status_code == 302 and resp.location.endswith("/l/GRANT001/owner")
+
+
+def test_grants_are_per_tag_and_kind(backend_app):
+    app = backend_app
+    make_tag(app, "GRANT002")
+    make_tag(app, "GRANT003")
+    client = app.test_client()
+
+    unlock(client, "GRANT002", kind="edit")
+    with client.session_transaction() as s:
+        assert set(s["grants"]) == {"edit:GRANT002"}
+
+    # an edit grant doesn't open another tag's edit page
+    resp = client.post("/l/GRANT003/edit", data={"public_message": "hijacked"})
+    assert resp.location.endswith("#tab-edit")
+
+    unlock(client, "GRANT003")
+    with client.session_transaction() as s:
+        assert set(s["grants"]) == {"edit:GRANT002", "owner:GRANT003"}
+
+
+def test_expired_grants_are_pruned(backend_app, monkeypatch):
+    app = backend_app
+    make_tag(app, "GRANT004")
+    make_tag(app, "GRANT005")
+    client = app.test_client()
+    unlock(client, "GRANT004")
+
+    now = sessions.time.time()
+    monkeypatch.setattr(sessions.time, "time", lambda: now + 601)
+    unlock(client, "GRANT005")
+    with client.session_transaction() as s:
+        assert set(s["grants"]) == {"owner:GRANT005"}
+
+
+@pytest.mark.parametrize("backend", ["sql", "local"])
+@pytest.mark.parametrize("privilege", ["unlock", "admin"])
+def test_privilege_change_rotates_server_session(env, monkeypatch, backend, privilege):
+    monkeypatch.setenv("SESSION_BACKEND", backend)
+    monkeypatch.setenv("SESSION_LOCAL_PATH", str(env / "sessions.sqlite3"))
+    from app import create_app
+
+    app = create_app()
+    app.config["TESTING"] = True
+    make_tag(app, "ROTATE01")
+    client = app.test_client()
+
+    # any session (a flash message) before the privilege change
+    client.post("/l/ROTATE01/owner", data={"pin": "0000"})
+    before = _session_cookie(client, app)
+    assert before
+
+    if privilege == "unlock":
+        unlock(client, "ROTATE01")
+        protected = "/l/ROTATE01/owner/dashboard"
+    else:
+        admin_login(client)
+        protected = "/admin/stats"
+    after = _session_cookie(client, app)
+    assert after and after != before
+    assert client.get(protected).status_code == 200
+
+    # the pre-login id was deleted server-side: replaying it gets nothing
+    replay = app.test_client()
+    replay.set_cookie(app.config["SESSION_COOKIE_NAME"], before)
+    assert replay.get(protected).status_code in (302, 404)
+
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.mark.parametrize("backend", ["sql", "local"])
+def test_cookie_lives_as_long_as_the_server_row(env, monkeypatch, backend):
+    monkeypatch.setenv("SESSION_BACKEND", backend)
+    monkeypatch.setenv("SESSION_LOCAL_PATH", str(env / "sessions.sqlite3"))
+    monkeypatch.setenv("SESSION_IDLE_SECONDS", "7200")
+    from app import create_app
+
+    app = create_app()
+    app.config["TESTING"] = True
+    make_tag(app, "COOKIE01")
+    client = app.test_client()
+
+    resp = unlock(client, "COOKIE01")
+    assert "Max-Age=7200" in resp.headers["Set-Cookie"]
+    sid = _session_cookie(client, app)
+
+    # (shows and drops the unlock's flash message: a write)
+    client.get("/l/COOKIE01/owner/dashboard")
+    # unchanged and fresh: no rewrite, no new cookie
+    assert "Set-Cookie" not in client.get("/l/COOKIE01/owner/dashboard").headers
+
+    # past the hourly refresh: the row's expiry is pushed and the cookie renewed
+    now = sessions.time.time()
+    monkeypatch.setattr(sessions.time, "time", lambda: now + sessions.REFRESH_SECONDS + 1)
+    resp = client.get("/l/COOKIE01/owner/dashboard")
+    assert "Max-Age=7200" in resp.headers["Set-Cookie"]
+    assert _session_cookie(client, app) == sid
+
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_cookie_backend_has_no_rotate_flag(app):
+    make_tag(app, "COOKIE02")
+    with app.test_request_context("/"):
+        from flask import session
+
+        sessions.grant("owner", "COOKIE02")
+        assert sessions.has_grant("COOKIE02")
+        assert not hasattr(session._get_current_object(), "rotate")
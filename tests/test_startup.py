@@ -0,0 +1,63 @@
+"""
+Cold start: heavy subsystems stay unimported until first use, and
+`flask startup-profile` can time a fresh create_app().
+"""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import make_tag, unlock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY = ("qrcode", "PIL", "smtplib", "email.mime", "app.qr_export")
+
+
+def _loaded_after(code: str) -> list[str]:
+    script = (
+        "import json, sys\n"
+        "from app import create_app\n"
+        "app = create_app()\n"
+        f"{code}\n"
+        f"print(json.dumps([m for m in {LAZY!r} if m in sys.modules]))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=os.environ.copy(),
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_create_app_skips_heavy_imports(env):
+    assert _loaded_after("") == []
+    # serving a page doesn't pull them in either
+    assert _loaded_after("app.test_client().get('/')") == []
+
+
+def test_qr_imports_on_first_use(app):
+    make_tag(app, "START002")
+    loaded = _loaded_after("assert app.test_client().get('/qr/START002').status_code == 200")
+    assert "qrcode" in loaded and "PIL" in loaded
+    assert "smtplib" not in loaded and "app.qr_export" not in loaded
+
+
+def test_startup_timings_and_template_cache(app, env, monkeypatch):
+    phases = dict(app.extensions["startup_timings"])
+    assert phases and all(ms >= 0 for ms in phases.values())
+
+    cache_dir = env / "jinja"
+    monkeypatch.setenv("JINJA_CACHE_DIR", str(cache_dir))
+    from app import create_app
+
+    cached = create_app()
+    make_tag(cached, "START001")
+    client = cached.test_client()
+    unlock(client, "START001")
+    assert client.get("/l/START001/owner").status_code == 200
+    assert any(cache_dir.iterdir())
+
+
+def test_startup_profile_command(app):
+    result = app.test_cli_runner().invoke(args=["startup-profile", "--top", "5"])
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith("Cold start: ")
+    assert "import app" in result.output
+    assert "Slowest imports" in result.output
@@ -0,0 +1,111 @@
+"""
+Every route that writes a tag's public fields invalidates its cached
+TagView: after the write, the next public GET shows the change.
+"""
+import pytest
+
+from app import create_app, db
+
+from conftest import admin_login, make_tag, unlock
+
+TOKEN = "CACHED01"
+FINDER = f"/l/{TOKEN}/finder"
+
+
+@pytest.fixture(params=["memory", "local"])
+def app(request, env, monkeypatch):
+    monkeypatch.setenv("TAG_CACHE", request.param)
+    monkeypatch.setenv("TAG_CACHE_PATH", str(env / "tag_cache.sqlite3"))
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def visitor(app):
+    # anonymous: its GETs are what the cache serves
+    return app.test_client()
+
+
+def _cached_page(app, client, path: str = FINDER):
+    assert client.get(path).status_code == 200
+    # served from the cache from here on
+    hits = app.extensions["tag_cache"].stats()["hits"]
+    again = client.get(path)
+    assert app.extensions["tag_cache"].stats()["hits"] == hits + 1
+    return again
+
+
+def test_claim(app, visitor):
+    make_tag(app, TOKEN, claimed=False)
+    assert b"Unclaimed" in _cached_page(app, visitor).data
+
+    app.test_client().post(f"/l/{TOKEN}/claim", data={"pin": "1234", "public_message": "Ring me, please"})
+    page = visitor.get(FINDER).data
+    assert b"Unclaimed" not in page and b"Ring me, please" in page
+
+
+def test_edit(app, visitor):
+    make_tag(app, TOKEN)
+    assert b"Please return it." in _cached_page(app, visitor).data
+
+    owner = app.test_client()
+    unlock(owner, TOKEN, kind="edit")
+    owner.post(f"/l/{TOKEN}/edit", data={"public_message": "Reward offered"})
+    assert b"Reward offered" in visitor.get(FINDER).data
+
+
+def test_edit_items(app, visitor):
+    make_tag(app, TOKEN)
+    assert b"Passport" not in _cached_page(app, visitor).data
+
+    owner = app.test_client()
+    unlock(owner, TOKEN, kind="edit")
+    owner.post(f"/l/{TOKEN}/edit", data={"items": "Wallet\nPassport"})
+    assert b"Passport" in visitor.get(FINDER).data
+
+
+def test_found(app, visitor):
+    make_tag(app, TOKEN)
+    etag = _cached_page(app, visitor).headers["ETag"]
+
+    app.test_client().post(f"/l/{TOKEN}/found", data={"found_note": "On the bus"})
+    # updated_at moved on: the cached view must not keep the old ETag
+    assert visitor.get(FINDER, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_reset_pin(app, visitor):
+    from app.routes import make_serializer
+
+    make_tag(app, TOKEN, owner_email="owner@example.com")
+    etag = _cached_page(app, visitor).headers["ETag"]
+
+    with app.test_request_context():
+        signed = make_serializer().dumps({"token": TOKEN, "email": "owner@example.com"})
+    app.test_client().post(f"/reset-pin/{signed}", data={"pin": "97531"})
+    assert visitor.get(FINDER, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_owner_delete(app, visitor):
+    make_tag(app, TOKEN)
+    _cached_page(app, visitor)
+
+    owner = app.test_client()
+    unlock(owner, TOKEN)
+    owner.post(f"/l/{TOKEN}/delete")
+    assert visitor.get(FINDER).status_code == 404
+    assert visitor.get(f"/l/{TOKEN}").status_code == 404
+
+
+def test_admin_delete(app, visitor):
+    make_tag(app, TOKEN)
+    _cached_page(app, visitor)
+
+    admin = app.test_client()
+    admin_login(admin)
+    admin.post(f"/admin/delete/{TOKEN}")
+    assert visitor.get(FINDER).status_code == 404
+    assert visitor.get(f"/l/{TOKEN}").status_code == 404
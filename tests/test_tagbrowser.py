@@ -0,0 +1,116 @@
+"""
+Admin tag browser: keyset pages visit every matching tag exactly once in
+both directions, and the filters (token prefix, status, scans, dates)
+select what they say.
+"""
+import re
+from datetime import date, datetime
+
+from werkzeug.datastructures import MultiDict
+
+from app import db
+from app.models import Lighter
+from app.tagbrowser import TagFilters, load_page, prefix_upper_bound
+
+from conftest import admin_login
+
+DAY = datetime(2026, 3, 10, 12, 0)
+
+
+def _seed(app, count: int = 23) -> list[int]:
+    """
+    Tags AA000..., AB000..., BA000... in turn; every third is claimed, with
+    scan_count = n and claimed/updated on consecutive days from DAY.
+    """
+    with app.app_context():
+        for n in range(count):
+            claimed = n % 3 == 0
+            db.session.add(Lighter(
+                token=f"{('AA', 'AB', 'BA')[n % 3]}{n:06d}", origin="admin", scan_count=n,
+                claimed_at=DAY.replace(day=1 + n) if claimed else None,
+                updated_at=DAY.replace(day=1 + n), created_at=DAY,
+            ))
+        db.session.commit()
+        return [lighter.id for lighter in Lighter.query.order_by(Lighter.id.desc())]
+
+
+def _walk_older(filters: TagFilters, size: int) -> list[list[int]]:
+    pages, before = [], None
+    while True:
+        rows, newer, older = load_page(filters, before=before, size=size)
+        assert (newer is None) == (before is None)
+        pages.append([lighter.id for lighter in rows])
+        if older is None:
+            return pages
+        before = older
+
+
+def test_pages_visit_each_tag_once_both_ways(app):
+    ids = _seed(app)
+    with app.app_context():
+        for size in (1, 4, 5, 23, 50):
+            pages = _walk_older(TagFilters(), size)
+            assert [i for page in pages for i in page] == ids
+            assert all(len(page) == size for page in pages[:-1])
+
+            # and back again from the last page: its newer cursor is its first id
+            back, after = [pages[-1]], pages[-1][0] if len(pages) > 1 else None
+            while after is not None:
+                rows, after, older = load_page(TagFilters(), after=after, size=size)
+                assert older == rows[-1].id
+                back.append([lighter.id for lighter in rows])
+            assert back[::-1] == pages
+
+
+def test_prefix_search_is_exact(app):
+    _seed(app)
+    assert prefix_upper_bound("AB") == "AC"
+    with app.app_context():
+        tokens = [lighter.token for lighter in load_page(TagFilters(q="A"), size=100)[0]]
+        assert len(tokens) == 16 and all(t.startswith("A") for t in tokens)
+        tokens = [lighter.token for lighter in load_page(TagFilters(q="AB"), size=100)[0]]
+        assert len(tokens) == 8 and all(t.startswith("AB") for t in tokens)
+        assert [lighter.token for lighter in load_page(TagFilters(q="AB00000"), size=100)[0]] == [
+            "AB000007", "AB000004", "AB000001",
+        ]
+        assert load_page(TagFilters(q="ZZ"), size=100) == ([], None, None)
+
+
+def test_filters(app):
+    _seed(app)
+
+    def tokens(**args) -> list[str]:
+        filters = TagFilters.from_args(MultiDict(args))
+        return sorted(lighter.token for lighter in load_page(filters, size=100)[0])
+
+    with app.app_context():
+        assert len(tokens(status="claimed")) == 8
+        assert len(tokens(status="unclaimed")) == 15
+        assert tokens(scans_min="20", scans_max="21") == ["AA000021", "BA000020"]
+        # date_to is inclusive of the whole day
+        assert tokens(date_field="updated", date_from="2026-03-03", date_to="2026-03-04") == ["AA000003", "BA000002"]
+        assert tokens(date_field="claimed", date_from="2026-03-03", date_to="2026-03-04") == ["AA000003"]
+        assert tokens(status="claimed", q="aa", scans_min="10") == ["AA000012", "AA000015", "AA000018", "AA000021"]
+        # junk values are ignored rather than failing the page
+        assert len(tokens(status="bogus", scans_min="x", date_from="soon", date_field="nope")) == 23
+
+
+def test_to_args_round_trips(app):
+    filters = TagFilters.from_args(MultiDict({"q": "ab", "status": "claimed", "date_to": "2026-03-04"}))
+    assert filters.to_args() == {"q": "AB", "status": "claimed", "date_field": "claimed", "date_to": "2026-03-04"}
+    assert TagFilters.from_args(MultiDict(filters.to_args())) == filters
+    assert TagFilters(q="AB", date_from=date(2026, 3, 1)).to_args()["date_from"] == "2026-03-01"
+    assert "date_field" not in TagFilters(date_field="updated").to_args()
+
+
+def test_admin_page_links_carry_filters(app, client):
+    _seed(app)
+    app.config["ADMIN_PAGE_SIZE"] = 3
+    admin_login(client)
+
+    html = client.get("/admin?q=AA").get_data(as_text=True)
+    shown = re.findall(r"AA\d{6}", html)
+    assert shown and all(t.startswith("AA") for t in shown)
+    older = re.search(r'href="(/admin\?[^"]*before=\d+[^"]*)"', html).group(1).replace("&amp;", "&")
+    assert "q=AA" in older
+    assert "← Newer" in client.get(older).get_data(as_text=True)
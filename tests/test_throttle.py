@@ -0,0 +1,147 @@
+"""
+PIN throttle: bursts are rejected with Retry-After, buckets refill over
+time, one guesser can't lock a tag's owner out, and the bucket store stays
+bounded. Memory and local (shared SQLite) backends.
+"""
+import pytest
+
+from app import create_app, db, throttle
+from app.throttle import PinThrottle
+
+from conftest import PIN, make_tag
+
+WRONG_PIN = "1357"
+
+
+@pytest.fixture(params=["memory", "local"])
+def app(request, env, monkeypatch):
+    monkeypatch.setenv("PIN_THROTTLE", request.param)
+    monkeypatch.setenv("PIN_THROTTLE_PATH", str(env / "pin_throttle.sqlite3"))
+    monkeypatch.setenv("PIN_TAG_BURST", "3")
+    monkeypatch.setenv("PIN_TAG_PER_MINUTE", "6")
+    monkeypatch.setenv("PIN_TAG_TOTAL_BURST", "5")
+    monkeypatch.setenv("PIN_TAG_TOTAL_PER_MINUTE", "6")
+    monkeypatch.setenv("PIN_CLIENT_BURST", "4")
+    monkeypatch.setenv("PIN_CLIENT_PER_MINUTE", "6")
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(throttle.time, "time", lambda: now[0])
+    return now
+
+
+def _client(app, addr: str):
+    client = app.test_client()
+    client.environ_base["REMOTE_ADDR"] = addr
+    return client
+
+
+def _try(client, token: str, pin: str = WRONG_PIN):
+    resp = client.post(f"/l/{token}/owner", data={"pin": pin})
+    assert resp.status_code == 302
+    return resp
+
+
+def test_burst_then_retry_after(app, clock):
+    make_tag(app, "THROTTL1")
+    guesser = _client(app, "10.0.0.1")
+    for _ in range(3):
+        assert "Retry-After" not in _try(guesser, "THROTTL1").headers
+
+    resp = _try(guesser, "THROTTL1", PIN)
+    # 6 per minute: one attempt back every 10 seconds
+    assert resp.headers["Retry-After"] == "10"
+    assert resp.location.endswith("/l/THROTTL1/owner")
+    assert app.extensions["pin_throttle"].stats()["rejected_tag"] == 1
+
+
+def test_refills_over_time(app, clock):
+    make_tag(app, "THROTTL2")
+    guesser = _client(app, "10.0.0.1")
+    for _ in range(3):
+        _try(guesser, "THROTTL2")
+    assert "Retry-After" in _try(guesser, "THROTTL2").headers
+
+    clock[0] += 10
+    resp = _try(guesser, "THROTTL2", PIN)
+    assert resp.location.endswith("/l/THROTTL2/owner/dashboard")
+    assert "Retry-After" in _try(guesser, "THROTTL2").headers
+
+
+def test_guesser_does_not_lock_owner_out(app, clock):
+    make_tag(app, "THROTTL3")
+    guesser = _client(app, "10.0.0.1")
+    for _ in range(4):
+        _try(guesser, "THROTTL3")
+
+    owner = _client(app, "10.0.0.2")
+    resp = _try(owner, "THROTTL3", PIN)
+    assert resp.location.endswith("/l/THROTTL3/owner/dashboard")
+
+
+def test_tag_ceiling_over_all_clients(app, clock):
+    make_tag(app, "THROTTL4")
+    for n in range(5):
+        assert "Retry-After" not in _try(_client(app, f"10.0.1.{n}"), "THROTTL4").headers
+    assert "Retry-After" in _try(_client(app, "10.0.1.99"), "THROTTL4").headers
+    assert app.extensions["pin_throttle"].stats()["rejected_tag_total"] == 1
+
+
+def test_client_bucket_spans_tags(app, clock):
+    for n in range(5):
+        make_tag(app, f"THROTTC{n}")
+    sweeper = _client(app, "10.0.2.1")
+    for n in range(4):
+        assert "Retry-After" not in _try(sweeper, f"THROTTC{n}").headers
+    assert "Retry-After" in _try(sweeper, "THROTTC4").headers
+    assert app.extensions["pin_throttle"].stats()["rejected_client"] == 1
+
+
+def test_untrusted_forwarded_clients_share_one_bucket(app, clock):
+    make_tag(app, "THROTTL5")
+    forwarded = {"X-Forwarded-For": "203.0.113.7"}
+    proxy = _client(app, "10.0.3.1")
+    for _ in range(3):
+        proxy.post("/l/THROTTL5/owner", data={"pin": WRONG_PIN}, headers=forwarded)
+    resp = proxy.post("/l/THROTTL5/owner", data={"pin": PIN}, headers=forwarded)
+    assert "Retry-After" in resp.headers
+
+    # a direct client isn't in that bucket
+    assert _try(_client(app, "10.0.3.2"), "THROTTL5", PIN).location.endswith("/owner/dashboard")
+
+
+def test_memory_buckets_are_capped(monkeypatch):
+    monkeypatch.setattr(throttle, "MAX_BUCKETS", 10)
+    pins = PinThrottle()
+    pins.mode = "memory"
+    for n in range(50):
+        assert pins.attempt(f"TAG{n}", f"10.0.0.{n}") == 0.0
+    assert len(pins._buckets) == 10
+    # the most recent clients are kept, the oldest evicted first
+    assert "ip:10.0.0.49" in pins._buckets and "ip:10.0.0.0" not in pins._buckets
+
+
+def test_local_sweep_drops_refilled_buckets(tmp_path, monkeypatch):
+    from app.localstore import LocalStore
+
+    now = [1_000_000.0]
+    monkeypatch.setattr(throttle.time, "time", lambda: now[0])
+    pins = PinThrottle()
+    pins.mode = "local"
+    pins.store = LocalStore(str(tmp_path / "pins.sqlite3"), throttle.LOCAL_SCHEMA)
+    for n in range(20):
+        assert pins.attempt(f"TAG{n}", f"10.0.0.{n}") == 0.0
+    assert pins.stats()["buckets"] == 20 * 3
+
+    monkeypatch.setattr(throttle, "SWEEP_RATE", 1.0)
+    now[0] += pins._horizon() + 1
+    pins.attempt("NEWTAG", "10.0.0.2")
+    assert pins.stats()["buckets"] == 3
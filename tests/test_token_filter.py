@@ -0,0 +1,160 @@
+"""
+TOKEN_FILTER: unknown tokens get a 404 without touching the database, and
+tokens created after the filter was built (generate, admin generate,
+import, another worker) still resolve.
+"""
+import io
+import time
+
+import pytest
+
+from app import create_app, db, querylog
+from app.models import Lighter
+from app.tokenfilter import BloomFilter, token_filter
+
+from conftest import admin_login, make_tag
+
+UNKNOWN = "ZZZZ2222"
+
+
+@pytest.fixture
+def app(env, monkeypatch):
+    monkeypatch.setenv("TOKEN_FILTER", "1")
+    # a miss never refreshes on its own unless a test asks for it
+    monkeypatch.setenv("TOKEN_FILTER_REFRESH_SECONDS", "3600")
+    monkeypatch.setenv("ADMIN_GENERATE_MAX", "50")
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def statements(app):
+    """
+    SQL statements per request, in request order.
+    """
+    counts = []
+    querylog.install(app)
+
+    @app.after_request
+    def record(resp):
+        counts.append(querylog.current().count)
+        return resp
+
+    return counts
+
+
+def _rebuild(app):
+    with app.app_context():
+        token_filter.rebuild()
+
+
+def _tokens(app, origin: str) -> list[str]:
+    with app.app_context():
+        return [t for (t,) in db.session.query(Lighter.token).filter_by(origin=origin)]
+
+
+@pytest.mark.parametrize("method, path", [
+    ("get", f"/l/{UNKNOWN}"),
+    ("get", f"/l/{UNKNOWN}/finder"),
+    ("get", f"/l/{UNKNOWN}/owner"),
+    ("get", f"/qr/{UNKNOWN}"),
+    ("post", f"/l/{UNKNOWN}/scan"),
+    ("post", f"/l/{UNKNOWN}/found"),
+    ("post", f"/l/{UNKNOWN}/owner"),
+])
+def test_unknown_token_is_rejected_without_sql(app, statements, method, path):
+    make_tag(app, "FILTER01")
+    _rebuild(app)
+
+    resp = getattr(app.test_client(), method)(path)
+    assert resp.status_code == 404
+    assert statements == [0]
+    assert token_filter.stats()["rejected"] == 1
+
+
+def test_known_token_still_queries(app, statements):
+    make_tag(app, "FILTER01")
+    _rebuild(app)
+    assert app.test_client().get("/l/FILTER01").status_code == 200
+    assert statements[-1] >= 1
+
+
+def test_public_generate_then_claim(app):
+    _rebuild(app)
+    client = app.test_client()
+    resp = client.post("/generate")
+    token = resp.location.rsplit("/", 1)[-1]
+    assert token in _tokens(app, "web")
+
+    # another browser (no generated_token in its session) must find it too
+    assert app.test_client().get(f"/l/{token}").status_code == 200
+    client.post(f"/l/{token}/claim", data={"pin": "1234"})
+    assert app.test_client().get(f"/l/{token}/owner").status_code == 200
+
+
+def test_admin_generate(app):
+    _rebuild(app)
+    admin = app.test_client()
+    admin_login(admin)
+    admin.post("/admin/generate", data={"how_many": "25"})
+
+    created = _tokens(app, "admin")
+    assert len(created) == 25
+    visitor = app.test_client()
+    assert all(visitor.get(f"/l/{t}").status_code == 200 for t in created)
+
+
+def test_admin_import(app):
+    _rebuild(app)
+    admin = app.test_client()
+    admin_login(admin)
+    upload = io.BytesIO(b"token\nIMPORT22\nIMPORT33\n")
+    admin.post("/admin/import", data={"file": (upload, "tokens.csv")}, content_type="multipart/form-data")
+
+    visitor = app.test_client()
+    assert visitor.get("/l/IMPORT22").status_code == 200
+    assert visitor.get("/l/IMPORT33").status_code == 200
+
+
+def test_token_from_another_worker_is_picked_up(app, statements):
+    _rebuild(app)
+    # inserted behind this worker's back, as another worker would
+    make_tag(app, "ELSEWHRE")
+    visitor = app.test_client()
+
+    # within the refresh interval it is still "definitely not"
+    assert visitor.get("/l/ELSEWHRE").status_code == 404
+    assert statements == [0]
+
+    token_filter.refresh_seconds = 0
+    assert visitor.get("/l/ELSEWHRE").status_code == 200
+    assert token_filter.stats()["refreshes"] == 1
+
+
+def test_overfilled_filter_rebuilds_in_background(app, statements):
+    for n in range(3):
+        make_tag(app, f"OVERFIL{n}")
+    _rebuild(app)
+    small = BloomFilter(2)
+    for n in range(3):
+        small.add(f"OVERFIL{n}")
+    token_filter.bloom = small
+    visitor = app.test_client()
+
+    # while it is resized, lookups fall through to the database
+    assert visitor.get(f"/l/{UNKNOWN}").status_code == 404
+    assert statements == [1]
+    deadline = time.monotonic() + 5
+    while token_filter.stats()["rebuilding"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    stats = token_filter.stats()
+    assert stats["background_rebuilds"] == 1 and not stats["rebuilding"]
+    assert stats["capacity"] >= 10000
+    assert visitor.get(f"/l/{UNKNOWN}").status_code == 404
+    assert statements[-1] == 0
+    assert visitor.get("/l/OVERFIL2").status_code == 200
@@ -0,0 +1,134 @@
+"""
+Token allocation: candidates that collide with existing tags, with each
+other, or with a tag inserted after the existence check (another worker)
+never produce duplicates, and the missing ones are topped up. Imports
+stream through in chunks with the same guarantees.
+"""
+import io
+
+from sqlalchemy import func, select
+
+from app import db, tokens
+from app.models import Lighter
+from app.tokens import allocate_tokens, import_file, import_stream
+
+from conftest import admin_login, make_tag
+
+
+def _scripted(monkeypatch, *rounds):
+    """
+    random_tokens() returns these batches, one per call.
+    """
+    batches = iter(rounds)
+    monkeypatch.setattr(tokens, "random_tokens", lambda n, length=tokens.TOKEN_LENGTH: next(batches)[:n])
+
+
+def _count(token: str) -> int:
+    return db.session.execute(select(func.count()).where(Lighter.token == token)).scalar()
+
+
+def test_collisions_are_retried(app, monkeypatch):
+    make_tag(app, "TAKEN001")
+    make_tag(app, "TAKEN002")
+    _scripted(
+        monkeypatch,
+        # 2 existing + 1 repeated within the batch: 2 of 5 usable
+        ["TAKEN001", "NEWTOK01", "NEWTOK01", "TAKEN002", "NEWTOK02"],
+        # the 3 still missing, one of them colliding again
+        ["NEWTOK02", "NEWTOK03", "NEWTOK04"],
+        ["NEWTOK05"],
+    )
+
+    with app.app_context():
+        result = allocate_tokens(5, origin="admin")
+        assert sorted(result.tokens) == ["NEWTOK01", "NEWTOK02", "NEWTOK03", "NEWTOK04", "NEWTOK05"]
+        assert result.rounds == 3
+        for token in result.tokens + ["TAKEN001", "TAKEN002"]:
+            assert _count(token) == 1
+
+
+def test_race_after_existence_check_is_skipped_by_the_insert(app, monkeypatch):
+    make_tag(app, "RACED001")
+    # another worker inserted RACED001 between our check and our insert
+    monkeypatch.setattr(tokens, "existing_tokens", lambda candidates: set())
+    _scripted(monkeypatch, ["RACED001", "FRESH001"], ["FRESH002"])
+
+    with app.app_context():
+        result = allocate_tokens(2, origin="admin")
+        assert sorted(result.tokens) == ["FRESH001", "FRESH002"]
+        assert _count("RACED001") == 1
+
+
+def test_gives_up_after_max_rounds(app, monkeypatch):
+    make_tag(app, "ALWAYS01")
+    monkeypatch.setattr(tokens, "random_tokens", lambda n, length=tokens.TOKEN_LENGTH: ["ALWAYS01"] * n)
+
+    with app.app_context():
+        result = allocate_tokens(3, max_rounds=4, origin="admin")
+        assert result.tokens == [] and result.rounds == 4
+
+
+def test_import_counts_duplicates(app, monkeypatch):
+    make_tag(app, "IMPORT01")
+    monkeypatch.setattr(tokens, "CHUNK_SIZE", 2)
+
+    with app.app_context():
+        # repeats across chunks are caught by the next chunk's check
+        result = import_stream(["IMPORT01", "IMPORT02", "IMPORT02", "IMPORT03", "IMPORT03"], origin="import")
+        assert (result.imported, result.duplicates) == (2, 3)
+        assert _count("IMPORT02") == 1 and _count("IMPORT03") == 1
+
+
+def test_import_streams_chunk_by_chunk(app, monkeypatch):
+    monkeypatch.setattr(tokens, "CHUNK_SIZE", 3)
+    lines = (f"STREAM{n:02d}" for n in range(10))
+    seen = []
+
+    with app.app_context():
+        result = import_stream(lines, progress=lambda r: seen.append((r.chunks, r.imported)),
+                               progress_every=2, origin="import")
+        assert (result.imported, result.duplicates, result.chunks) == (10, 0, 4)
+        assert seen == [(2, 6), (4, 10)]
+        assert db.session.query(Lighter).filter(Lighter.token.like("STREAM%")).count() == 10
+
+
+def test_import_file_text_and_csv(app, monkeypatch):
+    monkeypatch.setattr(tokens, "CHUNK_SIZE", 2)
+    make_tag(app, "FILE0001")
+    text = [b"\xef\xbb\xbffile0001, FILE0002\n", b"  FILE0003 x FILE0002\n", b"\n"]
+    csv_lines = ["label,token\n", "a,CSV00001\n", "b,\n", "c,csv00002\n", "d,CSV00001\n"]
+
+    with app.app_context():
+        result = import_file(text, origin="import")
+        # BOM dropped and case folded; "x" is too short
+        assert (result.lines, result.imported, result.duplicates, result.skipped) == (3, 2, 2, 1)
+
+        result = import_file(csv_lines, csv_mode=True, origin="import")
+        assert (result.lines, result.imported, result.duplicates, result.skipped) == (5, 2, 1, 0)
+        assert {t for (t,) in db.session.query(Lighter.token).filter(Lighter.origin == "import")} == {
+            "FILE0002", "FILE0003", "CSV00001", "CSV00002",
+        }
+
+
+def test_import_tokens_command(app, env, monkeypatch):
+    monkeypatch.setattr(tokens, "CHUNK_SIZE", 2)
+    path = env / "tokens.csv"
+    path.write_text("token\n" + "".join(f"CMD{n:05d}\n" for n in range(45)))
+
+    result = app.test_cli_runner().invoke(args=["import-tokens", str(path)])
+    assert result.exit_code == 0, result.output
+    # progress every 20 chunks of 2
+    assert result.output.count("  ... ") == 1
+    assert result.output.splitlines()[-1].startswith("Done: 45 imported, 0 duplicates, 0 skipped from 46 lines")
+
+
+def test_admin_upload_import(app, client, monkeypatch):
+    monkeypatch.setattr(tokens, "CHUNK_SIZE", 2)
+    admin_login(client)
+    body = b"token\n" + b"".join(b"UPLOAD%02d\n" % n for n in range(5))
+
+    resp = client.post("/admin/import", data={"file": (io.BytesIO(body), "tags.csv")},
+                       content_type="multipart/form-data", follow_redirects=True)
+    assert "Imported 5 tokens (0 duplicates, 0 invalid skipped)." in resp.get_data(as_text=True)
+    with app.app_context():
+        assert db.session.query(Lighter).filter(Lighter.token.like("UPLOAD%")).count() == 5
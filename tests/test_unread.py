@@ -0,0 +1,85 @@
+"""
+Lighter.unread_count stays equal to the real number of unread messages
+(find_mismatches() is empty) after every route that adds, reads or
+deletes messages.
+"""
+import pytest
+
+from app import db
+from app.models import Lighter
+from app.retention import purge
+from app.unread import find_mismatches
+
+from conftest import PIN, admin_login, make_tag, unlock
+
+
+@pytest.fixture
+def app(env, monkeypatch):
+    # small pages, so "load more" is exercised
+    monkeypatch.setenv("INBOX_PAGE_SIZE", "3")
+    from app import create_app
+
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def assert_consistent(app):
+    with app.app_context():
+        assert find_mismatches() == []
+
+
+def test_unread_count_through_the_inbox(app):
+    make_tag(app, "UNREAD01", messages=4, unread=2)
+    make_tag(app, "UNREAD02", messages=1, unread=1)
+    client = app.test_client()
+    assert_consistent(app)
+
+    for n in range(5):
+        resp = client.post("/l/UNREAD01/found", data={"found_note": f"found it {n}"})
+        assert resp.status_code == 302
+        assert_consistent(app)
+
+    # first page (3 newest) is marked read by the unlock
+    assert client.post("/l/UNREAD01/unlock", data={"pin": PIN}).status_code == 200
+    assert_consistent(app)
+
+    cursor = ""
+    pages = 0
+    while True:
+        resp = client.get(f"/l/UNREAD01/messages?partial=1&cursor={cursor}")
+        assert resp.status_code == 200
+        assert_consistent(app)
+        pages += 1
+        cursor = resp.headers["X-Next-Cursor"]
+        if not cursor:
+            break
+    assert pages >= 2
+
+    with app.app_context():
+        assert db.session.query(Lighter.unread_count).filter_by(token="UNREAD01").scalar() == 0
+
+    unlock(client, "UNREAD01")
+    assert client.get("/l/UNREAD01/owner/dashboard").status_code == 200
+    assert_consistent(app)
+
+
+def test_unread_count_after_deletes_and_purge(app):
+    make_tag(app, "UNREAD03", messages=3, unread=1)
+    make_tag(app, "UNREAD04", messages=2, unread=2)
+    client = app.test_client()
+
+    with app.app_context():
+        purge("read-messages", 0, pause=0)
+        db.session.commit()
+    assert_consistent(app)
+
+    admin_login(client)
+    assert client.post("/admin/delete/UNREAD03").status_code == 302
+    assert_consistent(app)
+
+    unlock(client, "UNREAD04")
+    assert client.post("/l/UNREAD04/delete").status_code == 302
+    assert_consistent(app)